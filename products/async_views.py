@@ -0,0 +1,129 @@
+"""
+Async versions of the read-heavy endpoints for running under an ASGI server. They
+return the same payloads as their DRF counterparts in views.py, but never hold a
+worker thread while waiting on the database or a slow client.
+"""
+
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from shop_api.routers import replica_reads
+
+from . import fastpath
+from .filters import filter_products, requested_fields
+from .pagination import ProductPagination
+from .renderers import CompactJSONRenderer
+from .serializers import (
+    CategorySerializer,
+    EventQuerySerializer,
+    OutboxEventSerializer,
+    ProductSerializer,
+    SoldProductReportSerializer,
+)
+from .services import CategoryService, OutboxService, ProductService
+from .views import parse_date_param, parse_int_param
+
+
+def render(data, status=200):
+    return HttpResponse(
+        CompactJSONRenderer().render(data),
+        status=status,
+        content_type="application/json",
+    )
+
+
+def async_api_view(view):
+    """
+    Give an async view a DRF Request and render APIExceptions the way DRF does.
+    """
+
+    @require_safe
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail
+            if not isinstance(data, (dict, list)):
+                data = {"detail": data}
+            return render(data, status=exc.status_code)
+
+    return wrapper
+
+
+@replica_reads(max_lag=5)
+@async_api_view
+async def product_list(request):
+    fields = requested_fields(request.query_params)
+    queryset = filter_products(request.query_params, ProductService.list_products())
+    paginator = ProductPagination()
+    page = await paginator.apaginate_queryset(
+        fastpath.product_values(queryset, fields), request
+    )
+    rows = fastpath.product_rows(page, fields)
+    data = paginator.get_paginated_response(rows).data
+    return fastpath.ProductPageResponse(data, rows).render()
+
+
+@async_api_view
+async def product_detail(request, pk):
+    product = await ProductService.aget_product(pk)
+    return render(ProductSerializer(product).data)
+
+
+@replica_reads(max_lag=30)
+@async_api_view
+async def category_list(request):
+    # Served from the category cache; only a cold cache touches the database.
+    categories = await sync_to_async(CategoryService.get_all_categories)()
+    return render(CategorySerializer(categories, many=True).data)
+
+
+@replica_reads(max_lag=60)
+@async_api_view
+async def sold_report(request):
+    queryset = ProductService.get_sold_products_report(
+        parse_date_param(request.query_params, "start_date"),
+        parse_date_param(request.query_params, "end_date"),
+        parse_int_param(request.query_params, "category"),
+    )
+    rows = [row async for row in queryset.aiterator()]
+    return render(SoldProductReportSerializer(rows, many=True).data)
+
+
+@async_api_view
+async def event_list(request):
+    """
+    Long-poll for published outbox events after the ``after`` sequence number.
+    Answers as soon as there are events, or with an empty list once ``timeout``
+    seconds have passed. Pass the returned ``next`` as ``after`` to continue.
+    """
+    params = EventQuerySerializer(data=request.query_params.dict())
+    params.is_valid(raise_exception=True)
+    after, limit, timeout = (
+        params.validated_data["after"],
+        params.validated_data["limit"],
+        params.validated_data["timeout"],
+    )
+    if timeout is None:
+        timeout = settings.EVENTS_LONG_POLL_TIMEOUT
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        events = [event async for event in OutboxService.events_after(after, limit)]
+        remaining = deadline - loop.time()
+        if events or remaining <= 0:
+            break
+        await asyncio.sleep(min(settings.EVENTS_POLL_INTERVAL, remaining))
+    return render(
+        {
+            "events": OutboxEventSerializer(events, many=True).data,
+            "next": events[-1]["sequence"] if events else after,
+        }
+    )
@@ -0,0 +1,36 @@
+"""
+Benchmark suites for ``python manage.py bench [suite]``; ``endpoints`` runs by default.
+
+Each suite module exposes ``add_arguments(parser)`` and ``run(**options)``, the
+latter returning a JSON-serializable dict of results.
+"""
+
+from . import (
+    asgi,
+    campaigns,
+    category_tree,
+    compression,
+    connections,
+    endpoints,
+    exports,
+    hot_stock,
+    imports,
+    pagination,
+    search,
+    serializers,
+)
+
+SUITES = {
+    "endpoints": endpoints,
+    "category_tree": category_tree,
+    "pagination": pagination,
+    "asgi": asgi,
+    "exports": exports,
+    "serializers": serializers,
+    "search": search,
+    "campaigns": campaigns,
+    "hot_stock": hot_stock,
+    "imports": imports,
+    "connections": connections,
+    "compression": compression,
+}
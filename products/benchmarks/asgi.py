@@ -0,0 +1,227 @@
+"""
+Sync (WSGI, one thread per in-flight request) vs. async (ASGI, one event loop)
+throughput for the read endpoints when clients are slow. Both apps are served
+over real sockets: the WSGI app by a thread-pooled wsgiref server, the ASGI app
+by uvicorn.
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import uvicorn
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+
+from .endpoints import Dataset
+from .utils import summarize
+
+HOST = "127.0.0.1"
+
+ENDPOINTS = [
+    ("product-list", "async-product-list"),
+    ("category-list", "async-category-list"),
+    ("sold_report", "async-sold-report"),
+]
+
+
+def add_arguments(parser):
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=200,
+        help="Simultaneous client connections.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Threads available to the sync server, like a WSGI worker's thread pool.",
+    )
+    parser.add_argument(
+        "--client-delay",
+        type=float,
+        default=0.05,
+        help="Seconds each slow client takes to finish sending its request headers.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    # A connection holds a pool thread from accept until the response is sent.
+    request_queue_size = 1024
+
+    def __init__(self, address, workers):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            connections.close_all()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+@contextmanager
+def wsgi_server(workers):
+    server = ThreadPoolWSGIServer((HOST, 0), workers)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server.server_port
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+@contextmanager
+def asgi_server():
+    sock = socket.create_server((HOST, 0))
+    server = uvicorn.Server(
+        uvicorn.Config(
+            get_asgi_application(),
+            lifespan="off",
+            access_log=False,
+            log_level="warning",
+        )
+    )
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]})
+    thread.start()
+    try:
+        while not server.started:
+            if not thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.01)
+        yield sock.getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+async def get(port, path, client_delay):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        # A slow client: the server has the connection before it has the request.
+        writer.write(f"GET {path} HTTP/1.1\r\n".encode())
+        await writer.drain()
+        await asyncio.sleep(client_delay)
+        writer.write(f"Host: {HOST}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def load(port, path, requests, concurrency, client_delay):
+    semaphore, latencies, errors = asyncio.Semaphore(concurrency), [], []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status = await get(port, path, client_delay)
+            except (OSError, IndexError, ValueError) as exc:
+                status = type(exc).__name__
+            latencies.append(time.perf_counter() - start)
+            if not isinstance(status, int) or status >= 400:
+                errors.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def report(requests, latencies, errors, wall):
+    return {
+        **summarize(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(requests / wall, 1),
+    }
+
+
+def run(products, requests, concurrency, workers, client_delay, seed, **options):
+    data = Dataset(
+        {
+            "categories": 50,
+            "depth": 3,
+            "products": products,
+            "reservations": 0,
+            "requests": 0,
+        },
+        random.Random(seed),
+    )
+    results = []
+    try:
+        with (
+            override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]),
+            wsgi_server(workers) as wsgi_port,
+            asgi_server() as asgi_port,
+        ):
+            for sync_name, async_name in ENDPOINTS:
+                wsgi = asyncio.run(
+                    load(
+                        wsgi_port,
+                        reverse(sync_name),
+                        requests,
+                        concurrency,
+                        client_delay,
+                    )
+                )
+                asgi = asyncio.run(
+                    load(
+                        asgi_port,
+                        reverse(async_name),
+                        requests,
+                        concurrency,
+                        client_delay,
+                    )
+                )
+                results.append(
+                    {
+                        "endpoint": sync_name,
+                        "wsgi": report(requests, *wsgi),
+                        "asgi": report(requests, *asgi),
+                    }
+                )
+    finally:
+        data.cleanup()
+    return {
+        "products": products,
+        "requests_per_endpoint": requests,
+        "concurrency": concurrency,
+        "wsgi_workers": workers,
+        "client_delay_s": client_delay,
+        "results": results,
+    }
@@ -0,0 +1,56 @@
+"""
+Putting a catalog on sale: one start_sale/end_sale call per product against a
+SaleCampaign applied and reverted with set-based UPDATEs.
+"""
+
+import random
+from datetime import timedelta
+
+from django.utils import timezone
+
+from products.models import Category, SaleCampaign
+from products.services import ProductService, SaleCampaignService
+
+from .seed import seed_products
+from .utils import measure, rolled_back, summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def run(products, seed, **options):
+    with rolled_back():
+        category = Category.objects.create(name="bench-campaigns")
+        product_ids = [
+            product.pk
+            for product in seed_products(products, [category.pk], random.Random(seed))
+        ]
+
+        def per_product():
+            for product_id in product_ids:
+                ProductService.start_sale(product_id, 20)
+            for product_id in product_ids:
+                ProductService.end_sale(product_id)
+
+        now = timezone.now()
+        campaign = SaleCampaign.objects.create(
+            name="bench", discount=20, starts_at=now, ends_at=now + timedelta(days=1)
+        )
+        campaign.categories.add(category)
+
+        def set_based():
+            SaleCampaignService.apply(campaign)
+            SaleCampaignService.revert(campaign)
+
+        per_product_samples, per_product_queries = measure(per_product)
+        set_based_samples, set_based_queries = measure(set_based)
+        return {
+            "products": products,
+            "per_product_calls": {
+                **summarize(per_product_samples),
+                "queries": per_product_queries,
+            },
+            "campaign": {**summarize(set_based_samples), "queries": set_based_queries},
+        }
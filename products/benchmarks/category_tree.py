@@ -0,0 +1,62 @@
+"""
+Subtree product filtering: closure table vs. walking the tree level by level.
+"""
+
+import random
+
+from products.models import Category, Product
+from products.services import ProductService
+
+from .seed import seed_category_tree, seed_products
+from .utils import measure, rolled_back, summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--categories", type=int, default=50000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def walk_tree(category_id):
+    # The pre-closure-table approach, extended to every level: one query per level.
+    category_ids, frontier = [category_id], [category_id]
+    while frontier:
+        frontier = list(
+            Category.objects.filter(parent_id__in=frontier).values_list("pk", flat=True)
+        )
+        category_ids += frontier
+    return Product.objects.filter(stock__gt=0, category_id__in=category_ids)
+
+
+def run(categories, depth, products, samples, seed, **options):
+    rng = random.Random(seed)
+    with rolled_back():
+        levels = seed_category_tree(categories, depth, rng)
+        seed_products(products, levels[-1], rng)
+        targets = [rng.choice(rng.choice(levels[:-1])) for _ in range(samples)]
+
+        results = {}
+        for name, build in (
+            ("closure_table", ProductService.list_products),
+            ("tree_walk", walk_tree),
+        ):
+            durations, queries, rows = [], 0, []
+            for pk in targets:
+                timings, query_count = measure(
+                    lambda: rows.append(len(build(pk).values_list("pk")))
+                )
+                durations += timings
+                queries += query_count
+            results[name] = {
+                **summarize(durations),
+                "queries_per_call": queries / len(targets),
+                "mean_rows": sum(rows) / len(rows),
+            }
+        return {
+            "categories": categories,
+            "depth": depth,
+            "products": products,
+            "results": results,
+        }
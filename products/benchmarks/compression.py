@@ -0,0 +1,107 @@
+"""
+Bytes on the wire and CPU per request for the large listings and an export,
+per negotiated content coding, plus the indented JSON the compact renderer
+replaces.
+"""
+
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from products.models import Category
+from shop_api.compression import CODECS
+
+from .seed import seed_products, seed_reservations
+from .utils import rolled_back, summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--reservations", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def fetch(client, path, coding, accept):
+    """
+    Request ``path`` and return (bytes received, CPU seconds, wall seconds).
+    """
+    headers = {"HTTP_ACCEPT": accept}
+    if coding != "identity":
+        headers["HTTP_ACCEPT_ENCODING"] = coding
+    cpu, start = time.process_time(), time.perf_counter()
+    response = client.get(path, **headers)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, path
+    assert response.get("Content-Encoding", "identity") == coding, path
+    return size, time.process_time() - cpu, elapsed
+
+
+def run(products, reservations, requests, page_size, seed, **options):
+    rng = random.Random(seed)
+    client = Client()
+    results = []
+    page = f"page_size={page_size}"
+    json_type = "application/json"
+    endpoints = [
+        ("product-list", f"{reverse('product-list')}?{page}", json_type),
+        (
+            "product-list?fields",
+            f"{reverse('product-list')}?{page}&fields=id,name,discounted_price",
+            json_type,
+        ),
+        ("reservation_list", f"{reverse('reservation_list')}?{page}", json_type),
+        (
+            "reservation_list.csv",
+            f"{reverse('reservation_list')}?format=csv",
+            "text/csv",
+        ),
+    ]
+    with override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+    ), rolled_back():
+        category = Category.objects.create(name="bench-compression")
+        product_ids = [
+            product.pk for product in seed_products(products, [category.pk], rng)
+        ]
+        seed_reservations(reservations, product_ids, rng)
+        for name, path, media_type in endpoints:
+            identity_bytes = None
+            variants = [(coding, media_type) for coding in ["identity", *CODECS]]
+            if media_type == json_type:
+                # Pretty-printed JSON, for comparison with the compact renderer.
+                variants.append(("identity", f"{json_type}; indent=4"))
+            for coding, accept in variants:
+                samples = [fetch(client, path, coding, accept) for _ in range(requests)]
+                size = samples[0][0]
+                if identity_bytes is None:
+                    identity_bytes = size
+                results.append(
+                    {
+                        "endpoint": name,
+                        "coding": coding,
+                        "indented": "indent" in accept,
+                        "bytes": size,
+                        "ratio": round(size / identity_bytes, 3),
+                        "cpu_ms": round(
+                            statistics.fmean(cpu for _, cpu, _ in samples) * 1000, 3
+                        ),
+                        **summarize([elapsed for _, _, elapsed in samples]),
+                    }
+                )
+    return {
+        "products": products,
+        "reservations": reservations,
+        "page_size": page_size,
+        "codings": list(CODECS),
+        "results": results,
+    }
@@ -0,0 +1,134 @@
+"""
+Connection setup on a tiny endpoint (product detail): a new connection per
+request against persistent connections, with and without health checks, and
+the DATABASES settings as configured (e.g. with DB_POOL).
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from products.models import Category, Product
+
+from .utils import summarize
+
+MODES = {
+    "per_request": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+    "persistent": {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": False},
+    "persistent_health_checks": {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": True},
+    "configured": None,
+}
+
+
+def add_arguments(parser):
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+
+
+def drive(path, overrides, requests, concurrency):
+    """
+    Request ``path`` ``requests`` times from ``concurrency`` threads, each with
+    its own connection. Returns (latencies, connect times, connections opened,
+    errors, wall time).
+    """
+    remaining = iter(range(requests))
+    latencies, connect_times, errors = [], [], []
+    opened = 0
+    lock = threading.Lock()
+
+    def count(sender, connection, **kwargs):
+        nonlocal opened
+        with lock:
+            opened += 1
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        connection = connections[DEFAULT_DB_ALIAS]
+        if overrides is not None:
+            # Without the pool, which doesn't allow persistent connections.
+            options = connection.settings_dict["OPTIONS"]
+            connection.settings_dict = {
+                **connection.settings_dict,
+                **overrides,
+                "OPTIONS": {k: v for k, v in options.items() if k != "pool"},
+            }
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                # The test client skips the request_started/request_finished
+                # handlers that apply CONN_MAX_AGE and health checks.
+                start = time.perf_counter()
+                close_old_connections()
+                connected = time.perf_counter()
+                connection.ensure_connection()
+                connect_time = time.perf_counter() - connected
+                response = client.get(path)
+                close_old_connections()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    connect_times.append(connect_time)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    connection_created.connect(count)
+    start = time.perf_counter()
+    try:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        connection_created.disconnect(count)
+    return latencies, connect_times, opened, errors, time.perf_counter() - start
+
+
+def run(requests, concurrency, **options):
+    # Committed, so the worker threads' connections can see it.
+    category = Category.objects.create(name="bench-connections")
+    product = Product.objects.create(
+        name="bench-connections", category=category, price=10, stock=1
+    )
+    path = reverse("product-detail", args=[product.pk])
+    results = []
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for mode, overrides in MODES.items():
+                latencies, connect_times, opened, errors, wall = drive(
+                    path, overrides, requests, concurrency
+                )
+                results.append(
+                    {
+                        "mode": mode,
+                        **summarize(latencies),
+                        "connect_mean_ms": round(
+                            sum(connect_times) / len(connect_times) * 1000, 3
+                        ),
+                        "connections_opened": opened,
+                        "throughput_rps": round(len(latencies) / wall, 1),
+                        "errors": len(errors),
+                    }
+                )
+    finally:
+        category.delete()
+    configured = settings.DATABASES[DEFAULT_DB_ALIAS]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "configured": {
+            "CONN_MAX_AGE": configured.get("CONN_MAX_AGE", 0),
+            "CONN_HEALTH_CHECKS": configured.get("CONN_HEALTH_CHECKS", False),
+            "pool": bool(configured.get("OPTIONS", {}).get("pool")),
+        },
+        "results": results,
+    }
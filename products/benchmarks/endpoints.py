@@ -0,0 +1,319 @@
+"""
+Load test every API endpoint through the Django test client with concurrent workers.
+"""
+
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Category, Product, Reservation, SaleCampaign
+
+from .seed import seed_category_tree, seed_products, seed_reservations
+from .utils import summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--reservations", type=int, default=10000)
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Requests per endpoint."
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--endpoints", help="Comma-separated endpoint names to run (default: all)."
+    )
+    parser.add_argument("--seed", type=int, default=42)
+
+
+class Dataset:
+    def __init__(self, options, rng):
+        self.levels = seed_category_tree(options["categories"], options["depth"], rng)
+        products = seed_products(options["products"], self.levels[-1], rng)
+        self.product_ids = [product.pk for product in products]
+        # Enough stock that the write endpoints never run out mid-run.
+        Product.objects.filter(pk__in=self.product_ids).update(
+            stock=1000000, updated_at=timezone.now()
+        )
+        # Cancel and complete-sale each consume one active reservation per request.
+        seed_reservations(
+            max(options["reservations"], 2 * options["requests"]),
+            self.product_ids,
+            rng,
+        )
+        reserved = Reservation.objects.filter(product_id__in=self.product_ids)
+        self.active = deque(
+            reserved.order_by("pk").values_list("pk", flat=True)[
+                : 2 * options["requests"]
+            ]
+        )
+        self.reservation_ids = list(
+            reserved.order_by("-pk").values_list("pk", flat=True)[:100]
+        )
+        # Ending a campaign needs one that is still running per request.
+        starts_at = timezone.now() + timedelta(days=1)
+        self.campaigns = deque(
+            campaign.pk
+            for campaign in SaleCampaign.objects.bulk_create(
+                SaleCampaign(
+                    name=f"bench-campaign-{i}",
+                    discount=10,
+                    starts_at=starts_at,
+                    ends_at=starts_at + timedelta(days=1),
+                )
+                for i in range(options["requests"])
+            )
+        )
+        self.campaign_ids = list(self.campaigns)
+        self.skus = itertools.count()
+        self._lock = threading.Lock()
+
+    def take_active(self):
+        with self._lock:
+            return self.active.popleft()
+
+    def take_campaign(self):
+        with self._lock:
+            return self.campaigns.popleft()
+
+    def next_sku(self):
+        with self._lock:
+            return f"bench-sku-{next(self.skus)}"
+
+    def cleanup(self):
+        Category.objects.filter(pk__in=self.levels[0]).delete()
+        SaleCampaign.objects.filter(name__startswith="bench-").delete()
+
+
+def endpoint_specs(data, rng):
+    """
+    (name, method, build) triples, at least one per URL name in products.urls.
+    build() returns the path and an optional body: a dict sent as JSON, or a
+    (content, content type) pair.
+    """
+    category = lambda: rng.choice(rng.choice(data.levels))  # noqa: E731
+    product = lambda: rng.choice(data.product_ids)  # noqa: E731
+
+    def import_rows(rows=10):
+        lines = ["sku,name,category,price,stock"] + [
+            f"{data.next_sku()},Imported,{category()},{rng.randint(1, 500)}.00,5"
+            for _ in range(rows)
+        ]
+        return "\n".join(lines), "text/csv"
+
+    def campaign():
+        starts_at = timezone.now() + timedelta(days=1)
+        return {
+            "name": "bench-campaign",
+            "discount": "15.00",
+            "starts_at": starts_at.isoformat(),
+            "ends_at": (starts_at + timedelta(days=1)).isoformat(),
+            "categories": [category()],
+        }
+
+    return [
+        ("product-list", "get", lambda: (reverse("product-list"), None)),
+        (
+            "product-list?category",
+            "get",
+            lambda: (f"{reverse('product-list')}?category={category()}", None),
+        ),
+        (
+            "product-detail",
+            "get",
+            lambda: (reverse("product-detail", args=[product()]), None),
+        ),
+        ("category-list", "get", lambda: (reverse("category-list"), None)),
+        (
+            "category_detail",
+            "get",
+            lambda: (reverse("category_detail", args=[category()]), None),
+        ),
+        ("reservation_list", "get", lambda: (reverse("reservation_list"), None)),
+        (
+            "reservation_detail",
+            "get",
+            lambda: (
+                reverse("reservation_detail", args=[rng.choice(data.reservation_ids)]),
+                None,
+            ),
+        ),
+        ("sold_report", "get", lambda: (reverse("sold_report"), None)),
+        (
+            "reservation_list:create",
+            "post",
+            lambda: (
+                reverse("reservation_list"),
+                {"product": product(), "quantity": 1, "user": "bench"},
+            ),
+        ),
+        (
+            "reservation-batch",
+            "post",
+            lambda: (
+                reverse("reservation-batch"),
+                {
+                    "user": "bench",
+                    "items": [{"product": product(), "quantity": 1} for _ in range(5)],
+                },
+            ),
+        ),
+        (
+            "reservation-cancel",
+            "patch",
+            lambda: (reverse("reservation-cancel", args=[data.take_active()]), None),
+        ),
+        (
+            "complete_sale",
+            "patch",
+            lambda: (reverse("complete_sale", args=[data.take_active()]), None),
+        ),
+        (
+            "start_sale",
+            "post",
+            lambda: (reverse("start_sale", args=[product(), rng.randint(0, 50)]), None),
+        ),
+        (
+            "product-search",
+            "get",
+            lambda: (f"{reverse('product-search')}?q=product", None),
+        ),
+        ("product-bulk", "post", lambda: (reverse("product-bulk"), import_rows())),
+        ("campaign-list", "get", lambda: (reverse("campaign-list"), None)),
+        (
+            "campaign-list:create",
+            "post",
+            lambda: (reverse("campaign-list"), campaign()),
+        ),
+        (
+            "campaign-detail",
+            "get",
+            lambda: (
+                reverse("campaign-detail", args=[rng.choice(data.campaign_ids)]),
+                None,
+            ),
+        ),
+        (
+            "campaign-end",
+            "post",
+            lambda: (reverse("campaign-end", args=[data.take_campaign()]), None),
+        ),
+        ("event-list", "get", lambda: (f"{reverse('event-list')}?timeout=0", None)),
+        ("async-product-list", "get", lambda: (reverse("async-product-list"), None)),
+        (
+            "async-product-detail",
+            "get",
+            lambda: (reverse("async-product-detail", args=[product()]), None),
+        ),
+        (
+            "async-category-list",
+            "get",
+            lambda: (reverse("async-category-list"), None),
+        ),
+        ("async-sold-report", "get", lambda: (reverse("async-sold-report"), None)),
+    ]
+
+
+def drive(method, build, requests, concurrency):
+    """
+    Issue ``requests`` calls spread over ``concurrency`` threads, each with its own
+    client and database connection. Returns (latencies, query counts, errors, wall time).
+    """
+    pending = deque(build() for _ in range(requests))
+    latencies, query_counts, errors = [], [], []
+    queries = {}
+    lock = threading.Lock()
+
+    def count_queries(execute, sql, params, many, context):
+        queries[threading.get_ident()] += 1
+        return execute(sql, params, many, context)
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        queries[threading.get_ident()] = 0
+        try:
+            with connection.execute_wrapper(count_queries):
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        path, body = pending.popleft()
+                    before = queries[threading.get_ident()]
+                    start = time.perf_counter()
+                    if body is None:
+                        response = getattr(client, method)(path)
+                    else:
+                        if isinstance(body, dict):
+                            body = body, "application/json"
+                        content, content_type = body
+                        response = getattr(client, method)(
+                            path, content, content_type=content_type
+                        )
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        query_counts.append(queries[threading.get_ident()] - before)
+                        if response.status_code >= 400:
+                            errors.append(response.status_code)
+        finally:
+            if concurrency > 1:
+                connections.close_all()
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        # Inline, so the run can see data that isn't committed yet (e.g. in tests).
+        worker()
+    return latencies, query_counts, errors, time.perf_counter() - start
+
+
+def run(requests, concurrency, endpoints, seed, **options):
+    rng = random.Random(seed)
+    selected = set(endpoints.split(",")) if endpoints else None
+    data = Dataset({"requests": requests, **options}, rng)
+    results = []
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, method, build in endpoint_specs(data, rng):
+                if selected is not None and name not in selected:
+                    continue
+                latencies, query_counts, errors, wall = drive(
+                    method, build, requests, concurrency
+                )
+                results.append(
+                    {
+                        "endpoint": name,
+                        "method": method.upper(),
+                        **summarize(latencies),
+                        "throughput_rps": round(len(latencies) / wall, 1),
+                        "queries_per_request": round(
+                            sum(query_counts) / len(query_counts), 2
+                        ),
+                        "errors": len(errors),
+                    }
+                )
+    finally:
+        data.cleanup()
+    return {
+        "categories": options["categories"],
+        "products": options["products"],
+        "reservations": options["reservations"],
+        "requests_per_endpoint": requests,
+        "concurrency": concurrency,
+        "results": results,
+    }
@@ -0,0 +1,90 @@
+"""
+Sold report and reservation history: peak memory and time of the JSON response
+against the streaming CSV/NDJSON exports as the number of rows grows.
+"""
+
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Category, SalesDaily
+
+from .seed import seed_products, seed_reservations
+from .utils import rolled_back
+
+FORMATS = ["json", "csv", "ndjson"]
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", default="1000,10000,100000")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def fetch(client, path, format):
+    """
+    Download ``path`` in ``format`` and return (peak traced memory in bytes,
+    seconds, bytes received).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(path, {"format": format})
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, size
+
+
+def seed_table(rows, rng):
+    category = Category.objects.create(name="bench-exports")
+    products = seed_products(rows, [category.pk], rng)
+    SalesDaily.objects.bulk_create(
+        [
+            SalesDaily(
+                product=product,
+                category=category,
+                day=timezone.localdate(),
+                units=1,
+                revenue=product.price,
+            )
+            for product in products
+        ],
+        batch_size=5000,
+    )
+    seed_reservations(rows, [product.pk for product in products], rng)
+
+
+def run(rows, seed, **options):
+    client = Client()
+    results = []
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        for count in map(int, rows.split(",")):
+            with rolled_back():
+                seed_table(count, random.Random(seed))
+                for name, path, formats in [
+                    ("sold_report", reverse("sold_report"), FORMATS),
+                    # The JSON reservation listing is paginated, so only the
+                    # exports cover the full history.
+                    ("reservations", reverse("reservation_list"), FORMATS[1:]),
+                ]:
+                    for format in formats:
+                        peak, elapsed, size = fetch(client, path, format)
+                        results.append(
+                            {
+                                "endpoint": name,
+                                "rows": count,
+                                "format": format,
+                                "peak_memory_kb": round(peak / 1024, 1),
+                                "time_ms": round(elapsed * 1000, 3),
+                                "bytes": size,
+                            }
+                        )
+    return {"results": results}
@@ -0,0 +1,104 @@
+"""
+A product drop: concurrent reservations of one product through the row lock
+against the hot-stock counter store, followed by reconciliation and a
+consistency check.
+"""
+
+import threading
+import time
+
+from django.db import connections
+from django.test import override_settings
+
+from products.models import Category, Product, Reservation
+from products.services import HotStockService, ReservationService
+from products.stock import stock_store
+
+from .utils import summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--reservations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+
+
+def drop(product_id, reservations, concurrency):
+    """
+    Reserve one unit at a time from ``concurrency`` threads.
+    Returns (latencies, failed attempts, wall time).
+    """
+    remaining = iter(range(reservations))
+    latencies, errors, lock = [], [], threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                try:
+                    ReservationService.create_reservation(
+                        {"product": product_id, "quantity": 1, "user": "bench-drop"}
+                    )
+                except Exception as exc:
+                    with lock:
+                        errors.append(type(exc).__name__)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            if concurrency > 1:
+                connections.close_all()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def run(reservations, concurrency, **options):
+    category = Category.objects.create(name="bench-hot-stock")
+    results = []
+    try:
+        for mode in ("row_lock", "hot_stock"):
+            product = Product.objects.create(
+                name=f"bench-{mode}", category=category, price=10, stock=reservations
+            )
+            with override_settings(HOT_STOCK_ENABLED=mode == "hot_stock"):
+                if mode == "hot_stock":
+                    HotStockService.enable([product.pk])
+                latencies, errors, wall = drop(product.pk, reservations, concurrency)
+                start = time.perf_counter()
+                HotStockService.reconcile()
+                reconcile_ms = (time.perf_counter() - start) * 1000
+                mismatches = HotStockService.check()
+                if mode == "hot_stock":
+                    HotStockService.disable([product.pk])
+            product.refresh_from_db()
+            reserved = Reservation.objects.filter(product=product).count()
+            results.append(
+                {
+                    "mode": mode,
+                    **summarize(latencies),
+                    "errors": len(errors),
+                    "throughput_rps": round(len(latencies) / wall, 1),
+                    "reconcile_ms": round(reconcile_ms, 3),
+                    "consistent": not mismatches
+                    and product.stock == reservations - reserved,
+                }
+            )
+    finally:
+        category.delete()
+        stock_store.clear()
+    return {
+        "reservations": reservations,
+        "concurrency": concurrency,
+        "results": results,
+    }
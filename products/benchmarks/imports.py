@@ -0,0 +1,87 @@
+"""
+Bulk product import: rows per second for the chunked upsert from NDJSON and CSV,
+first inserting new SKUs and then updating all of them, against creating the
+products one by one through ProductSerializer.
+"""
+
+import json
+import random
+import time
+
+from products.imports import READERS
+from products.models import Category
+from products.serializers import ProductSerializer
+from products.services import ProductService
+
+from .utils import rolled_back
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--baseline-rows", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def feed(rows, format, category, rng):
+    """
+    Yield the text lines of a catalog feed, as a file or request body would.
+    """
+    if format == "csv":
+        yield "sku,name,category,price,stock,description\n"
+    for number in range(rows):
+        row = {
+            "sku": f"BENCH-{number:08d}",
+            "name": f"Product {number}",
+            "category": category,
+            "price": f"{rng.uniform(1, 500):.2f}",
+            "stock": rng.randint(0, 100),
+            "description": "Imported by the benchmark",
+        }
+        if format == "csv":
+            yield ",".join(map(str, row.values())) + "\n"
+        else:
+            yield json.dumps(row) + "\n"
+
+
+def run(rows, baseline_rows, chunk_size, seed, **options):
+    results = []
+    for format in READERS:
+        with rolled_back():
+            category = Category.objects.create(name="bench-imports")
+            for phase in ("insert", "update"):
+                lines = feed(rows, format, category.name, random.Random(seed))
+                report = ProductService.import_products(
+                    READERS[format](lines), chunk_size
+                )
+                results.append(
+                    {
+                        "method": f"bulk_{format}",
+                        "phase": phase,
+                        "rows": report["rows"],
+                        "errors": report["error_count"],
+                        "seconds": report["seconds"],
+                        "rows_per_second": report["rows_per_second"],
+                    }
+                )
+
+    with rolled_back():
+        category = Category.objects.create(name="bench-imports")
+        lines = feed(baseline_rows, "ndjson", category.pk, random.Random(seed))
+        start = time.perf_counter()
+        for line in lines:
+            serializer = ProductSerializer(data=json.loads(line))
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        seconds = time.perf_counter() - start
+        results.append(
+            {
+                "method": "serializer_per_row",
+                "phase": "insert",
+                "rows": baseline_rows,
+                "errors": 0,
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(baseline_rows / seconds, 1),
+            }
+        )
+    return {"results": results}
@@ -0,0 +1,64 @@
+"""
+Reservation listing: keyset pagination vs. OFFSET pagination at increasing depth.
+"""
+
+import random
+
+from products.models import Category, Product, Reservation
+from products.pagination import ReservationPagination, keyset_filter
+
+from .seed import seed_reservations
+from .utils import measure, rolled_back, summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--pages", default="1,10,100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def seed_table(rows, rng):
+    category = Category.objects.create(name="bench-pagination")
+    products = Product.objects.bulk_create(
+        [
+            Product(name=f"bench-{i}", category=category, price=10, stock=0)
+            for i in range(100)
+        ]
+    )
+    seed_reservations(rows, [product.pk for product in products], rng)
+
+
+def run(rows, page_size, pages, repeat, seed, **options):
+    ordering = ReservationPagination.ordering
+    fields = [field.lstrip("-") for field in ordering]
+    queryset = Reservation.objects.order_by(*ordering)
+
+    with rolled_back():
+        seed_table(rows, random.Random(seed))
+        results = []
+        for page in map(int, pages.split(",")):
+            offset = (page - 1) * page_size
+            if offset >= rows:
+                continue
+            offset_samples, _ = measure(
+                lambda: list(queryset[offset : offset + page_size]), repeat
+            )
+            if offset:
+                # The cursor a client would hold after reading the previous page.
+                last = queryset.values_list(*fields)[offset - 1]
+                keyset_queryset = queryset.filter(keyset_filter(ordering, last))
+            else:
+                keyset_queryset = queryset
+            keyset_samples, _ = measure(
+                lambda: list(keyset_queryset[:page_size]), repeat
+            )
+            results.append(
+                {
+                    "page": page,
+                    "offset": summarize(offset_samples),
+                    "keyset": summarize(keyset_samples),
+                }
+            )
+        return {"rows": rows, "page_size": page_size, "results": results}
@@ -0,0 +1,87 @@
+"""
+Product search: full-text search with facets against the substring scan it
+replaces, over a synthetic catalog.
+"""
+
+import random
+from decimal import Decimal
+
+from django.db import connection
+
+from products import search
+from products.models import Category, Product
+from products.services import ProductService
+
+from .utils import measure, rolled_back, summarize
+
+WORDS = (
+    "wireless bluetooth ergonomic mechanical gaming studio portable compact "
+    "leather steel bamboo ceramic cotton waterproof solar vintage keyboard mouse "
+    "headphones speaker lamp chair desk kettle blender camera tripod backpack "
+    "jacket sneakers watch charger monitor router drone guitar"
+).split()
+
+
+def add_arguments(parser):
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument(
+        "--queries", default="wireless,steel lamp,portable bluetooth speaker"
+    )
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def seed_catalog(products, categories, rng, batch_size=5000):
+    category_ids = [
+        category.pk
+        for category in Category.objects.bulk_create(
+            [Category(name=f"bench-search-{i}") for i in range(categories)]
+        )
+    ]
+    for offset in range(0, products, batch_size):
+        Product.objects.bulk_create(
+            [
+                Product(
+                    name=" ".join(rng.sample(WORDS, 3)),
+                    description=" ".join(rng.choices(WORDS, k=8)),
+                    category_id=rng.choice(category_ids),
+                    price=Decimal(rng.randint(100, 100000)) / 100,
+                    stock=rng.randint(0, 50),
+                )
+                for _ in range(min(batch_size, products - offset))
+            ]
+        )
+
+
+def run(products, categories, queries, page_size, repeat, seed, **options):
+    results = []
+    with rolled_back():
+        seed_catalog(products, categories, random.Random(seed))
+        for text in queries.split(","):
+            queryset = ProductService.search_products(text)
+
+            def full_text():
+                ProductService.search_facets(queryset)
+                list(queryset[:page_size])
+
+            baseline = search.search(Product.objects.all(), text, vendor=None)
+
+            def substring():
+                ProductService.search_facets(baseline)
+                list(baseline.order_by("id")[:page_size])
+
+            full_text_samples, full_text_queries = measure(full_text, repeat)
+            substring_samples, _ = measure(substring, repeat)
+            results.append(
+                {
+                    "query": text,
+                    "matches": queryset.count(),
+                    "baseline_matches": baseline.count(),
+                    "full_text": summarize(full_text_samples),
+                    "queries_per_search": full_text_queries,
+                    "substring_scan": summarize(substring_samples),
+                }
+            )
+    return {"products": products, "vendor": connection.vendor, "results": results}
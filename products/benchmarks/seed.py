@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+from products.cache import category_tree_cache
+from products.models import Category, CategoryClosure, Product, Reservation
+
+
+def seed_category_tree(count, depth, rng, batch_size=5000):
+    """
+    Insert a synthetic tree of ``count`` categories spread over ``depth`` levels,
+    each level roughly ``branching`` times wider than the previous one.
+    Returns the new category ids grouped by level.
+    """
+    branching = max(2.0, count ** (1 / depth))
+    weights = [branching**level for level in range(depth)]
+    sizes = [max(1, int(count * weight / sum(weights))) for weight in weights]
+    sizes[-1] += count - sum(sizes)
+
+    levels, ancestors = [], {}
+    for level, size in enumerate(sizes):
+        parents = levels[-1] if levels else [None]
+        created = Category.objects.bulk_create(
+            [
+                Category(name=f"bench-{level}-{i}", parent_id=rng.choice(parents))
+                for i in range(size)
+            ],
+            batch_size=batch_size,
+        )
+        # bulk_create() skips Category.save(), so index the new nodes here.
+        links = []
+        for category in created:
+            chain = [category.pk] + ancestors.get(category.parent_id, [])
+            ancestors[category.pk] = chain
+            links += [
+                CategoryClosure(
+                    ancestor_id=ancestor_id, descendant_id=category.pk, depth=depth
+                )
+                for depth, ancestor_id in enumerate(chain)
+            ]
+        CategoryClosure.objects.bulk_create(links, batch_size=batch_size)
+        levels.append([category.pk for category in created])
+    category_tree_cache.invalidate()
+    return levels
+
+
+def seed_products(count, category_ids, rng, batch_size=5000):
+    """
+    Insert ``count`` products spread randomly over ``category_ids`` and return them.
+    """
+    created = []
+    for offset in range(0, count, batch_size):
+        products = [
+            Product(
+                name=f"bench-product-{offset + i}",
+                description="Synthetic benchmark product",
+                category_id=rng.choice(category_ids),
+                price=Decimal(rng.randint(100, 100000)) / 100,
+                stock=rng.randint(0, 50),
+            )
+            for i in range(min(batch_size, count - offset))
+        ]
+        # bulk_create() skips Product.save(), which fills in the category path.
+        paths = CategoryClosure.objects.paths(
+            {product.category_id for product in products}
+        )
+        for product in products:
+            product.category_path = paths.get(product.category_id, "")
+        created += Product.objects.bulk_create(products)
+    return created
+
+
+def seed_reservations(count, product_ids, rng, status="reserved", batch_size=10000):
+    """
+    Insert ``count`` reservations of one unit spread randomly over ``product_ids``.
+    Stock is left untouched.
+    """
+    for offset in range(0, count, batch_size):
+        Reservation.objects.bulk_create(
+            [
+                Reservation(
+                    product_id=rng.choice(product_ids),
+                    user=f"bench-{offset + i}",
+                    status=status,
+                )
+                for i in range(min(batch_size, count - offset))
+            ]
+        )
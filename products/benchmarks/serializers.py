@@ -0,0 +1,64 @@
+"""
+Product listing: ProductSerializer + JSONRenderer against the values()-based
+fast path, per row of CPU time for pages of increasing size.
+"""
+
+import random
+
+from rest_framework.renderers import JSONRenderer
+
+from products import fastpath
+from products.models import Category, Product
+from products.serializers import ProductSerializer
+
+from .seed import seed_products
+from .utils import measure, rolled_back, summarize
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--page-sizes", default="50,500,5000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def run(rows, page_sizes, repeat, seed, **options):
+    rng = random.Random(seed)
+    results = []
+    with rolled_back():
+        category = Category.objects.create(name="bench-serializers")
+        products = seed_products(rows, [category.pk], rng)
+        for product in products:
+            product.discount = rng.choice([0, 0, 10, 15, 33.33])
+        Product.objects.bulk_update(products, ["discount"], batch_size=5000)
+        queryset = Product.objects.filter(category=category).order_by("id")
+        for page_size in map(int, page_sizes.split(",")):
+
+            def drf():
+                page = list(queryset[:page_size])
+                return JSONRenderer().render(ProductSerializer(page, many=True).data)
+
+            def fast():
+                rows = fastpath.product_rows(
+                    fastpath.product_values(queryset)[:page_size]
+                )
+                return fastpath.encode(rows, [row["discounted_price"] for row in rows])
+
+            drf_samples, _ = measure(drf, repeat)
+            fast_samples, _ = measure(fast, repeat)
+            drf_summary, fast_summary = summarize(drf_samples), summarize(fast_samples)
+            results.append(
+                {
+                    "page_size": page_size,
+                    "identical": drf() == fast(),
+                    "serializer": drf_summary,
+                    "fast_path": fast_summary,
+                    "serializer_us_per_row": round(
+                        drf_summary["mean_ms"] * 1000 / page_size, 2
+                    ),
+                    "fast_path_us_per_row": round(
+                        fast_summary["mean_ms"] * 1000 / page_size, 2
+                    ),
+                }
+            )
+    return {"rows": rows, "orjson": fastpath.orjson is not None, "results": results}
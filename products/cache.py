@@ -0,0 +1,101 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from shop_api.routers import use_primary
+
+from .models import Category
+
+
+class CacheVersion:
+    """
+    A version counter kept in the shared cache, so every worker sees a bump.
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def get(self):
+        version = cache.get(self.key)
+        if version is None:
+            # A fresh token rather than 1, so an evicted counter can never reuse
+            # a version that some worker still holds locally.
+            cache.add(self.key, time.time_ns(), timeout=None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, time.time_ns(), timeout=None)
+
+    def bump_on_change(self):
+        # Bump right away for this process, and again once the change is
+        # visible to other workers, so nobody keeps a version read in between.
+        self.bump()
+        transaction.on_commit(self.bump)
+
+
+# Bumped by every write to the product table; see ProductQuerySet.
+product_version = CacheVersion("products:version")
+
+
+class CategoryTreeCache:
+    """
+    Two-level cache for the category tree: a small in-process LRU in front of
+    Django's cache framework. Invalidation bumps a version counter kept in the
+    shared cache, which every worker checks before using its local copy.
+    """
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = CacheVersion("category-tree:version")
+
+    def version(self):
+        return self._version.get()
+
+    def invalidate(self):
+        self._version.bump()
+
+    def get_tree(self):
+        """
+        Return a dict mapping category ids to categories, ordered by id.
+        """
+        version = self.version()
+        with self._lock:
+            if version in self._local:
+                self._local.move_to_end(version)
+                return self._local[version]
+
+        key = f"category-tree:{version}"
+        tree = cache.get(key)
+        if tree is None:
+            # From the primary: a tree built from a lagging replica would be
+            # cached under the new version until the next change.
+            with use_primary():
+                tree = {
+                    category.pk: category
+                    for category in Category.objects.order_by("pk")
+                }
+            cache.set(key, tree, timeout=settings.CATEGORY_CACHE_TIMEOUT)
+
+        with self._lock:
+            self._local[version] = tree
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+        return tree
+
+    def get_category(self, category_id):
+        category = self.get_tree().get(category_id)
+        # Callers may modify and save the instance; keep the cached one pristine.
+        return copy.copy(category) if category is not None else None
+
+
+category_tree_cache = CategoryTreeCache()
@@ -0,0 +1,41 @@
+"""
+Conditional GET for the catalog listings. The ETag comes from a cheap version
+stamp, so an unchanged poll gets a 304 without the listing ever being queried
+or serialized.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+    quote_etag,
+)
+
+
+class ConditionalGetMixin:
+    """
+    Views implement ``get_version()`` returning a stamp that changes whenever the
+    listing does. The ETag also covers the query string and the negotiated media
+    type, since every page and format is a different representation. There is no
+    Last-Modified: deletions change a listing without a newer timestamp.
+    """
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        etag = quote_etag(
+            hashlib.md5(
+                f"{version}|{request.get_full_path()}|{request.accepted_media_type}".encode(),
+                usedforsecurity=False,
+            ).hexdigest()
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            patch_cache_control(response, max_age=settings.CATALOG_CACHE_MAX_AGE)
+            patch_vary_headers(response, ["Accept"])
+        return response
@@ -6,11 +6,46 @@ class ProductNotFoundError(APIException):
     default_detail = "Product not found."
 
 
+class CategoryNotFoundError(APIException):
+    status_code = 404
+    default_detail = "Category not found."
+
+
 class InsufficientStockError(APIException):
     status_code = 400
     default_detail = "Not enough stock available."
 
 
+class ReservationNotFoundError(APIException):
+    status_code = 404
+    default_detail = "Reservation not found."
+
+
 class ReservationError(APIException):
     status_code = 400
     default_detail = "Reservation error occurred."
+
+
+class BatchReservationError(APIException):
+    status_code = 400
+    default_detail = "Cart could not be reserved."
+
+
+class SaleCampaignNotFoundError(APIException):
+    status_code = 404
+    default_detail = "Sale campaign not found."
+
+
+class InvalidIdempotencyKeyError(APIException):
+    status_code = 400
+    default_detail = "Idempotency-Key must be 1 to 255 characters long."
+
+
+class IdempotencyKeyInUseError(APIException):
+    status_code = 409
+    default_detail = "A request with this Idempotency-Key is still being processed."
+
+
+class IdempotencyKeyMismatchError(APIException):
+    status_code = 422
+    default_detail = "This Idempotency-Key was already used for a different request."
@@ -0,0 +1,167 @@
+"""
+Read-only fast path for the product listing. Rows are read with ``values()`` and
+formatted directly instead of going through ``ProductSerializer`` field by field,
+and the page is encoded with orjson when it is installed. The bytes produced are
+identical to what the API's JSON renderer sends for the serializer output.
+"""
+
+import json
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .renderers import CompactJSONEncoder, CompactJSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+PRODUCT_COLUMNS = (
+    "id",
+    "sku",
+    "name",
+    "description",
+    "price",
+    "stock",
+    "category",
+    "category_path",
+    "discount",
+    "discounted_price",
+)
+CENT = Decimal("0.01")
+
+
+def decimal_string(value):
+    # As DRF's DecimalField renders a two-place decimal.
+    return format(value.quantize(CENT), "f")
+
+
+FORMATTERS = {
+    "price": decimal_string,
+    "discount": decimal_string,
+    "discounted_price": float,
+}
+
+
+def sparse_columns(queryset, fields):
+    """
+    The columns to read for a sparse fieldset: ``fields`` plus the ordering
+    columns, which the paginator's cursor needs.
+    """
+    ordering = [field.lstrip("-") for field in queryset.query.order_by]
+    return list(dict.fromkeys([*fields, *ordering, "id"]))
+
+
+def product_values(queryset, fields=None):
+    """
+    Named rows, so KeysetPagination can read the cursor columns by attribute.
+    With ``fields``, only the sparse_columns() are read.
+    """
+    if fields is None:
+        return queryset.values_list(*PRODUCT_COLUMNS, named=True)
+    return queryset.values_list(*sparse_columns(queryset, fields), named=True)
+
+
+def product_rows(page, fields=None):
+    """
+    Turn ``product_values()`` tuples into the dicts ``ProductSerializer`` builds,
+    limited to ``fields`` if given.
+    """
+    if fields is not None:
+        formatters = [(field, FORMATTERS.get(field)) for field in fields]
+        return [
+            {
+                field: (
+                    formatter(getattr(row, field)) if formatter else getattr(row, field)
+                )
+                for field, formatter in formatters
+            }
+            for row in page
+        ]
+    return [
+        {
+            "id": id,
+            "sku": sku,
+            "name": name,
+            "description": description,
+            "price": format(price.quantize(CENT), "f"),
+            "stock": stock,
+            "category": category_id,
+            "category_path": category_path,
+            "discount": format(discount.quantize(CENT), "f"),
+            "discounted_price": float(discounted_price),
+        }
+        for (
+            id,
+            sku,
+            name,
+            description,
+            price,
+            stock,
+            category_id,
+            category_path,
+            discount,
+            discounted_price,
+        ) in page
+    ]
+
+
+def can_encode(value):
+    # orjson and json disagree on the notation of very small and very large floats.
+    return value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def encode(data, floats=()):
+    """
+    Encode ``data`` exactly as ``CompactJSONRenderer`` (or ``JSONRenderer`` with
+    the default settings) would.
+    ``floats`` are the float values inside ``data``, checked before using orjson.
+    """
+    if orjson is not None and all(map(can_encode, floats)):
+        content = orjson.dumps(data)
+        if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            content = content.replace(b"\xe2\x80\xa8", b"\\u2028")
+            content = content.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return content
+    content = json.dumps(
+        data,
+        cls=CompactJSONEncoder,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    )
+    return content.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+
+def accepts(request):
+    """
+    Whether the negotiated response is plain JSON, which the fast path can produce.
+    """
+    renderer = getattr(request, "accepted_renderer", None)
+    return (
+        type(renderer) in (JSONRenderer, CompactJSONRenderer)
+        and renderer.compact
+        and renderer.strict
+        and not renderer.ensure_ascii
+        and "indent" not in (getattr(request, "accepted_media_type", None) or "")
+    )
+
+
+class ProductPageResponse(Response):
+    """
+    A DRF Response for a page of ``product_rows()`` that renders with ``encode()``
+    instead of going through the negotiated renderer.
+    """
+
+    def __init__(self, data, rows, **kwargs):
+        super().__init__(data, **kwargs)
+        self.floats = [
+            row["discounted_price"] for row in rows if "discounted_price" in row
+        ]
+
+    @property
+    def rendered_content(self):
+        self["Content-Type"] = JSONRenderer.media_type
+        return encode(self.data, self.floats)
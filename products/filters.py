@@ -0,0 +1,72 @@
+"""
+Filtering, ordering and sparse fieldsets for the product listing. ``?ordering=``
+only sets the queryset's order; ProductPagination builds its cursor from it.
+"""
+
+import django_filters
+from django import forms
+from rest_framework.exceptions import ValidationError
+
+from .fastpath import PRODUCT_COLUMNS
+from .models import CategoryClosure, Product
+
+
+class IntegerFilter(django_filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class ProductFilter(django_filters.FilterSet):
+    category = IntegerFilter(
+        method="filter_category", label="Category ID, including its subcategories."
+    )
+    min_price = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
+    max_price = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
+    min_discounted_price = django_filters.NumberFilter(
+        field_name="discounted_price", lookup_expr="gte"
+    )
+    max_discounted_price = django_filters.NumberFilter(
+        field_name="discounted_price", lookup_expr="lte"
+    )
+    min_stock = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
+    max_stock = django_filters.NumberFilter(field_name="stock", lookup_expr="lte")
+    ordering = django_filters.OrderingFilter(
+        fields=["id", "name", "price", "discounted_price", "stock"]
+    )
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(
+            category_id__in=CategoryClosure.objects.filter(ancestor_id=value).values(
+                "descendant_id"
+            )
+        )
+
+
+def filter_products(query_params, queryset):
+    """
+    Apply ProductFilter outside a DRF view, e.g. in the async views.
+    """
+    filterset = ProductFilter(query_params, queryset=queryset)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.qs
+
+
+def requested_fields(query_params):
+    """
+    The product fields listed in ``?fields=``, in serializer order, or None
+    when all fields are wanted.
+    """
+    value = query_params.get("fields")
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested.difference(PRODUCT_COLUMNS)
+    if unknown:
+        raise ValidationError(
+            {"fields": [f'Unknown field "{name}".' for name in sorted(unknown)]}
+        )
+    return [name for name in PRODUCT_COLUMNS if name in requested]
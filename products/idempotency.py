@@ -0,0 +1,77 @@
+"""
+Idempotency-Key support for unsafe endpoints. The first request with a key runs
+normally and its successful response is stored; retries with the same key get
+that response back without running the view again, and a retry that arrives
+while the first request is still running gets a 409.
+"""
+
+import functools
+import hashlib
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from .exceptions import (
+    IdempotencyKeyInUseError,
+    IdempotencyKeyMismatchError,
+    InvalidIdempotencyKeyError,
+)
+from .services import IdempotencyService, hot_stock_atomic
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(request):
+    # Reusing a key for a different request is a client error, not a retry.
+    digest = hashlib.sha256()
+    for part in (request.method, request.get_full_path(), request.body):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def idempotent(handler):
+    """
+    Decorate a DRF view method to honour the Idempotency-Key header. Requests
+    without the header are handled as before. Failed requests release the key.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(self, request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            raise InvalidIdempotencyKeyError()
+
+        request_fingerprint = fingerprint(request)
+        record, claimed = IdempotencyService.claim(key, request_fingerprint)
+        if not claimed:
+            if record.fingerprint != request_fingerprint:
+                raise IdempotencyKeyMismatchError()
+            if record.response_status is None:
+                raise IdempotencyKeyInUseError()
+            return Response(
+                record.response_body,
+                status=record.response_status,
+                headers={REPLAYED_HEADER: "true"},
+            )
+
+        try:
+            # The outermost block, so hot stock the handler took is given back
+            # if complete() loses the key and everything rolls back.
+            with hot_stock_atomic():
+                response = handler(self, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    IdempotencyService.complete(
+                        record, response.status_code, response.data
+                    )
+        except Exception:
+            IdempotencyService.release(record)
+            raise
+        if not status.is_success(response.status_code):
+            IdempotencyService.release(record)
+        return response
+
+    return wrapper
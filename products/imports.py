@@ -0,0 +1,168 @@
+"""
+Bulk product imports from CSV or NDJSON. Rows are read lazily and handled in
+chunks: each chunk is validated one column at a time instead of through a
+serializer per row, categories are resolved from a name map built with a single
+query, and the valid rows are upserted on ``sku`` with one INSERT ... ON
+CONFLICT statement per chunk.
+
+Columns: sku, name, category (a name or an id), price, and optionally stock
+(default 0) and description.
+"""
+
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from .models import CATEGORY_PATH_SEPARATOR, Category, Product
+
+MEDIA_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson"}
+MAX_PRICE = Decimal("99999999.99")
+MAX_STOCK = 2147483647
+CENT = Decimal("0.01")
+
+
+def csv_rows(lines):
+    return csv.DictReader(lines)
+
+
+def ndjson_rows(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        # Anything but an object is reported as an invalid row.
+        yield row if isinstance(row, dict) else None
+
+
+READERS = {"csv": csv_rows, "ndjson": ndjson_rows}
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def category_map():
+    """
+    Category ids by name and by id as a string, and category paths by id.
+    Names shared by several categories map to None, since a row can't say
+    which one it means.
+    """
+    categories, parents, names = {}, {}, {}
+    for pk, name, parent_id in Category.objects.values_list("pk", "name", "parent"):
+        categories[name] = None if name in categories else pk
+        parents[pk], names[pk] = parent_id, name
+    paths = {}
+
+    def path(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (
+                names[pk]
+                if parent_id is None
+                else CATEGORY_PATH_SEPARATOR.join([path(parent_id), names[pk]])
+            )
+        return paths[pk]
+
+    for pk in parents:
+        categories.setdefault(str(pk), pk)
+        path(pk)
+    return categories, paths
+
+
+def parse_text(max_length, required=True):
+    def parse(value):
+        value = "" if value is None else str(value).strip()
+        if required and not value:
+            raise ValueError("This field is required.")
+        if len(value) > max_length:
+            raise ValueError(
+                f"Ensure this field has no more than {max_length} characters."
+            )
+        return value
+
+    return parse
+
+
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError("A valid number is required.")
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        raise ValueError(f"Ensure this value is between 0 and {MAX_PRICE}.")
+    if price != price.quantize(CENT):
+        raise ValueError("Ensure that there are no more than 2 decimal places.")
+    return price.quantize(CENT)
+
+
+def parse_stock(value):
+    if value is None or value == "":
+        return 0
+    if isinstance(value, float) or not str(value).strip().isdigit():
+        raise ValueError("A non-negative integer is required.")
+    if int(value) > MAX_STOCK:
+        raise ValueError(f"Ensure this value is less than or equal to {MAX_STOCK}.")
+    return int(value)
+
+
+def validate_chunk(rows, first_row, categories, paths):
+    """
+    Validate a chunk of row dicts (None for rows that couldn't be parsed).
+    ``first_row`` is the 1-based number of the first row, for error messages;
+    ``categories`` and ``paths`` come from category_map().
+    Returns ({sku: (row number, Product)}, [(row number, message)]).
+    A SKU repeated within the chunk keeps its last row.
+    """
+    errors = {
+        index: "Not a valid row." for index, row in enumerate(rows) if row is None
+    }
+
+    def column(name, parse):
+        values = []
+        for index, row in enumerate(rows):
+            value = None
+            if index not in errors:
+                try:
+                    value = parse(row.get(name))
+                except ValueError as exc:
+                    errors[index] = f"{name}: {exc}"
+            values.append(value)
+        return values
+
+    def resolve_category(value):
+        value = "" if value is None else str(value).strip()
+        if value not in categories:
+            raise ValueError(f'Category "{value}" does not exist.')
+        if categories[value] is None:
+            raise ValueError(f'Several categories are named "{value}"; use its id.')
+        return categories[value]
+
+    skus = column("sku", parse_text(64))
+    names = column("name", parse_text(255))
+    category_ids = column("category", resolve_category)
+    prices = column("price", parse_price)
+    stocks = column("stock", parse_stock)
+    descriptions = column("description", parse_text(10**6, required=False))
+
+    products = {}
+    for index in range(len(rows)):
+        if index in errors:
+            continue
+        products[skus[index]] = first_row + index, Product(
+            sku=skus[index],
+            name=names[index],
+            category_id=category_ids[index],
+            category_path=paths[category_ids[index]],
+            price=prices[index],
+            stock=stocks[index],
+            description=descriptions[index],
+        )
+    return products, [
+        (first_row + index, message) for index, message in sorted(errors.items())
+    ]
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+from products.models import Reservation, SalesDaily
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SalesDaily rollup from sold reservations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start-date", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--end-date", help="Last day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, start_date, end_date, batch_size, **options):
+        sold = Reservation.objects.filter(status="sold").annotate(
+            day=TruncDate("updated_at")
+        )
+        rollups = SalesDaily.objects.all()
+        if start_date:
+            sold = sold.filter(day__gte=start_date)
+            rollups = rollups.filter(day__gte=start_date)
+        if end_date:
+            sold = sold.filter(day__lte=end_date)
+            rollups = rollups.filter(day__lte=end_date)
+
+        rows = (
+            sold.values("product_id", "product__category_id", "day")
+            .annotate(
+                units=Sum("quantity"), revenue=Sum(F("quantity") * F("unit_price"))
+            )
+            .order_by()
+        )
+        created = 0
+        with transaction.atomic():
+            rollups.delete()
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(
+                    SalesDaily(
+                        product_id=row["product_id"],
+                        category_id=row["product__category_id"],
+                        day=row["day"],
+                        units=row["units"],
+                        revenue=row["revenue"],
+                    )
+                )
+                if len(batch) >= batch_size:
+                    created += len(SalesDaily.objects.bulk_create(batch))
+                    batch = []
+            created += len(SalesDaily.objects.bulk_create(batch))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} SalesDaily rows."))
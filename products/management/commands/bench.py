@@ -0,0 +1,26 @@
+import argparse
+import json
+
+from django.core.management.base import BaseCommand
+
+from products.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark suite and print its results as JSON."
+
+    default_suite = "endpoints"
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="suite")
+        for name, suite in SUITES.items():
+            suite.add_arguments(subparsers.add_parser(name, help=suite.__doc__))
+
+    def handle(self, *args, suite, **options):
+        if suite is None:
+            suite = self.default_suite
+            defaults = argparse.ArgumentParser()
+            SUITES[suite].add_arguments(defaults)
+            options = {**vars(defaults.parse_args([])), **options}
+        results = SUITES[suite].run(**options)
+        self.stdout.write(json.dumps({"suite": suite, **results}, indent=2))
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.services import ReservationService
+
+
+class Command(BaseCommand):
+    help = "Expire reservations older than the TTL and release their stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl",
+            type=int,
+            default=settings.RESERVATION_TTL,
+            help="Reservation lifetime in seconds.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping instead of exiting once no stale reservations remain.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30,
+            help="Seconds to sleep between sweeps in --loop mode.",
+        )
+
+    def handle(self, *args, ttl, batch_size, loop, interval, **options):
+        while True:
+            total = 0
+            while True:
+                expired = ReservationService.expire_stale_reservations(ttl, batch_size)
+                total += expired
+                if expired < batch_size:
+                    break
+            if total or not loop:
+                self.stdout.write(f"Expired {total} reservations.")
+            if not loop:
+                return
+            time.sleep(interval)
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.services import HotStockService
+
+
+class Command(BaseCommand):
+    help = "Manage hot-stock products and reconcile their counters with the database."
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="action", required=True)
+        for action in ("enable", "disable"):
+            subparser = subparsers.add_parser(
+                action, help=f"{action.capitalize()} hot stock for products."
+            )
+            subparser.add_argument("product_ids", nargs="+", type=int)
+        reconcile = subparsers.add_parser(
+            "reconcile", help="Flush pending counter changes to Product.stock."
+        )
+        reconcile.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep reconciling instead of exiting after one pass.",
+        )
+        reconcile.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds to sleep between passes in --loop mode.",
+        )
+        subparsers.add_parser(
+            "check", help="Report counters that disagree with the database."
+        )
+
+    def handle(self, *args, action, **options):
+        getattr(self, action)(**options)
+
+    def enable(self, product_ids, **options):
+        HotStockService.enable(product_ids)
+        self.stdout.write(f"Enabled hot stock for {len(product_ids)} products.")
+
+    def disable(self, product_ids, **options):
+        busy = HotStockService.disable(product_ids)
+        if busy:
+            raise CommandError(
+                f"Products {sorted(busy)} kept receiving reservations; run disable again."
+            )
+        self.stdout.write(f"Disabled hot stock for {len(product_ids)} products.")
+
+    def reconcile(self, loop, interval, **options):
+        while True:
+            flushed = HotStockService.reconcile()
+            if flushed or not loop:
+                self.stdout.write(f"Flushed {flushed} products.")
+            if not loop:
+                return
+            time.sleep(interval)
+
+    def check(self, **options):
+        mismatches = HotStockService.check()
+        for mismatch in mismatches:
+            self.stdout.write(
+                "Product {product}: counter {counter}, database {database}, "
+                "unflushed {unflushed}".format(**mismatch)
+            )
+        if mismatches:
+            raise CommandError(
+                f"{len(mismatches)} hot-stock counters are inconsistent."
+            )
+        self.stdout.write("Hot-stock counters match the database.")
@@ -0,0 +1,40 @@
+import codecs
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.imports import READERS
+from products.services import ProductService
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or NDJSON file, matched on sku."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='File to import, or "-" for stdin.')
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Defaults to the file extension.",
+        )
+        parser.add_argument("--chunk-size", type=int)
+
+    def handle(self, *args, path, format, chunk_size, **options):
+        format = format or path.rsplit(".", 1)[-1].lower()
+        if format not in READERS:
+            raise CommandError("Pass --format csv or --format ndjson.")
+        if path == "-":
+            lines = codecs.iterdecode(sys.stdin.buffer, "utf-8-sig")
+            report = ProductService.import_products(READERS[format](lines), chunk_size)
+        else:
+            with open(path, encoding="utf-8-sig", newline="") as file:
+                report = ProductService.import_products(
+                    READERS[format](file), chunk_size
+                )
+        for error in report["errors"]:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(
+            f"Imported {report['imported']} of {report['rows']} rows in "
+            f"{report['seconds']}s ({report['rows_per_second']} rows/s), "
+            f"{report['error_count']} with errors."
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.outbox import get_sink
+from products.services import OutboxService
+
+
+class Command(BaseCommand):
+    help = "Publish outbox events to the configured sink, in order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep publishing instead of exiting once the outbox is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Seconds to sleep when the outbox is empty in --loop mode.",
+        )
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        sink = get_sink()
+        while True:
+            total = 0
+            while True:
+                published = OutboxService.publish(sink, batch_size)
+                total += published
+                if published < batch_size:
+                    break
+            OutboxService.purge_published()
+            if not loop:
+                self.stderr.write(f"Published {total} events.")
+                return
+            time.sleep(interval)
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.services import IdempotencyService
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys whose TTL has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep purging instead of exiting once no expired keys remain.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=300,
+            help="Seconds to sleep between purges in --loop mode.",
+        )
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            total = 0
+            while True:
+                purged = IdempotencyService.purge_expired(batch_size)
+                total += purged
+                if purged < batch_size:
+                    break
+            if total or not loop:
+                self.stdout.write(f"Purged {total} idempotency keys.")
+            if not loop:
+                return
+            time.sleep(interval)
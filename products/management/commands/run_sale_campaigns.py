@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.services import SaleCampaignService
+
+
+class Command(BaseCommand):
+    help = "Apply discounts of sale campaigns whose window opened and revert those whose window closed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep checking campaign windows instead of exiting after one pass.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30,
+            help="Seconds to sleep between passes in --loop mode.",
+        )
+
+    def handle(self, *args, loop, interval, **options):
+        while True:
+            started, ended = SaleCampaignService.run_due()
+            if started or ended or not loop:
+                self.stdout.write(f"Started {started} and ended {ended} campaigns.")
+            if not loop:
+                return
+            time.sleep(interval)
@@ -0,0 +1,62 @@
+# Generated by Django 5.1 on 2026-10-18 10:47
+
+import django.db.models.deletion
+import products.models
+from django.db import migrations, models
+
+
+def build_category_closure(apps, schema_editor):
+    apps.get_model("products", "CategoryClosure").objects.rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0004_remove_product_available"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategoryClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="products.category",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="products.category",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("ancestor", "descendant"),
+                        name="category_closure_unique",
+                    )
+                ],
+            },
+            managers=[
+                ("objects", products.models.CategoryClosureManager()),
+            ],
+        ),
+        migrations.RunPython(build_category_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1 on 2026-10-18 10:52
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def price_past_sales(apps, schema_editor):
+    # The sale-time price wasn't kept before; today's price is the best estimate.
+    Product = apps.get_model("products", "Product")
+    Reservation = apps.get_model("products", "Reservation")
+    Reservation.objects.filter(status="sold").update(
+        unit_price=Subquery(
+            Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_reservation_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("units", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0"), max_digits=14
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_daily",
+                        to="products.category",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_daily",
+                        to="products.product",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "day"), name="sales_daily_product_day_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="reservation",
+            name="unit_price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.RunPython(price_past_sales, migrations.RunPython.noop),
+    ]
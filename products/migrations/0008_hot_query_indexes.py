@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_salesdaily"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("stock__gt", 0)),
+                fields=["id"],
+                name="product_in_stock_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("stock__gt", 0)),
+                fields=["category", "id"],
+                name="product_in_stock_category_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["status", "updated_at"], name="reservation_status_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["status", "created_at"], name="reservation_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="salesdaily",
+            index=models.Index(fields=["day"], name="sales_daily_day_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="salesdaily",
+            index=models.Index(
+                fields=["category", "day"], name="sales_daily_category_day_idx"
+            ),
+        ),
+    ]
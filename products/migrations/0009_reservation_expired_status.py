@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0008_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reservation",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("reserved", "Reserved"),
+                    ("sold", "Sold"),
+                    ("canceled", "Canceled"),
+                    ("expired", "Expired"),
+                ],
+                default="reserved",
+                max_length=10,
+            ),
+        ),
+    ]
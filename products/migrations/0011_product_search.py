@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 11:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from ._search_sql import install, uninstall
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_product_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # Trigger and GIN index on PostgreSQL, FTS5 table on SQLite.
+        migrations.RunPython(install, uninstall),
+    ]
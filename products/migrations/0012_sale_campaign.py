@@ -0,0 +1,87 @@
+# Generated by Django 5.1 on 2026-10-18 11:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._search_sql import reinstall_search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0011_product_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SaleCampaign",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("discount", models.DecimalField(decimal_places=2, max_digits=5)),
+                ("starts_at", models.DateTimeField()),
+                ("ends_at", models.DateTimeField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("scheduled", "Scheduled"),
+                            ("active", "Active"),
+                            ("ended", "Ended"),
+                        ],
+                        default="scheduled",
+                        max_length=10,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "categories",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="sale_campaigns",
+                        to="products.category",
+                    ),
+                ),
+                (
+                    "products",
+                    models.ManyToManyField(
+                        blank=True, related_name="sale_campaigns", to="products.product"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="sale_campaign",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="discounted_products",
+                to="products.salecampaign",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="salecampaign",
+            index=models.Index(
+                fields=["status", "starts_at"], name="sale_campaign_status_start_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="salecampaign",
+            index=models.Index(
+                fields=["status", "ends_at"], name="sale_campaign_status_end_idx"
+            ),
+        ),
+        # Adding the foreign key rebuilds the product table on SQLite, which
+        # drops the search triggers.
+        migrations.RunPython(reinstall_search, migrations.RunPython.noop),
+    ]
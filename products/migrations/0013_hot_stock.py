@@ -0,0 +1,53 @@
+# Generated by Django 5.1 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._search_sql import reinstall_search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0012_sale_campaign"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="hot_stock",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="StockFlush",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("flush_id", models.CharField(max_length=32, unique=True)),
+                ("delta", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_flushes",
+                        to="products.product",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["created_at"], name="stock_flush_created_idx")
+                ],
+            },
+        ),
+        # Adding a NOT NULL column rebuilds the product table on SQLite.
+        migrations.RunPython(reinstall_search, migrations.RunPython.noop),
+    ]
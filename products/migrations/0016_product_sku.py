@@ -0,0 +1,21 @@
+# Generated by Django 5.1 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+from ._search_sql import reinstall_search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0015_outbox_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="sku",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(reinstall_search, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1 on 2026-10-18 11:39
+
+import products.models
+from django.db import migrations, models
+
+from ._search_sql import reinstall_search
+
+
+def fill_category_paths(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    paths = apps.get_model("products", "CategoryClosure").objects.paths(
+        Product.objects.values("category_id")
+    )
+    for category_id, path in paths.items():
+        Product.objects.filter(category_id=category_id).update(category_path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0016_product_sku"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="category_path",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="discounted_price",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=products.models.PercentOff("price", "discount"),
+                output_field=models.DecimalField(decimal_places=6, max_digits=16),
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="in_stock",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Q(("stock__gt", 0)),
+                output_field=models.BooleanField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("stock__gt", 0)),
+                fields=["discounted_price", "id"],
+                name="product_in_stock_price_idx",
+            ),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+        # Adding the generated columns rebuilds the product table on SQLite,
+        # which drops the search triggers.
+        migrations.RunPython(reinstall_search, migrations.RunPython.noop),
+    ]
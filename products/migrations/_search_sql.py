@@ -0,0 +1,96 @@
+"""
+The search SQL as of 0011_product_search, copied from products.search so that
+later changes to that module don't rewrite history. Migrations share this copy;
+changing the search schema needs a new copy for the new migration, not an edit
+here. The leading underscore keeps Django's loader from treating it as a migration.
+"""
+
+POSTGRES_INSTALL = [
+    """
+    CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_product_search_vector ON products_product",
+    """
+    CREATE TRIGGER products_product_search_vector
+    BEFORE INSERT OR UPDATE OF name, description ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update()
+    """,
+    "UPDATE products_product SET name = name",
+    """
+    CREATE INDEX IF NOT EXISTS product_search_vector_idx
+    ON products_product USING gin (search_vector)
+    """,
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "DROP TRIGGER IF EXISTS products_product_search_vector ON products_product",
+    "DROP FUNCTION IF EXISTS products_product_search_vector_update()",
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5(
+        name, description, content='products_product', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_insert AFTER INSERT ON products_product
+    BEGIN
+        INSERT INTO products_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_delete AFTER DELETE ON products_product
+    BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_update
+    AFTER UPDATE OF name, description ON products_product
+    BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS products_product_fts_insert",
+    "DROP TRIGGER IF EXISTS products_product_fts_delete",
+    "DROP TRIGGER IF EXISTS products_product_fts_update",
+    "DROP TABLE IF EXISTS products_product_fts",
+]
+
+
+def install(apps, schema_editor):
+    statements = {"postgresql": POSTGRES_INSTALL, "sqlite": SQLITE_INSTALL}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def uninstall(apps, schema_editor):
+    statements = {"postgresql": POSTGRES_UNINSTALL, "sqlite": SQLITE_UNINSTALL}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def reinstall_search(apps, schema_editor):
+    # PostgreSQL keeps triggers across ALTER TABLE; only SQLite loses them.
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in SQLITE_INSTALL:
+            schema_editor.execute(sql)
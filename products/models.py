@@ -1,6 +1,32 @@
 from decimal import Decimal
 
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+
+
+CATEGORY_PATH_SEPARATOR = " / "
+
+
+class PercentOff(models.Func):
+    """
+    ``amount * (100 - percent) / 100``. SQLite keeps whole numbers in decimal
+    columns as integers and would divide them as such, so it divides by a REAL.
+    """
+
+    arity = 2
+
+    def as_sql(self, compiler, connection, hundred="100", **extra_context):
+        amount, amount_params = compiler.compile(self.source_expressions[0])
+        percent, percent_params = compiler.compile(self.source_expressions[1])
+        return (
+            f"({amount} * (100 - {percent}) / {hundred})",
+            [*amount_params, *percent_params],
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, hundred="100.0", **extra_context)
 
 
 class Category(models.Model):
@@ -13,11 +39,186 @@ class Category(models.Model):
         on_delete=models.CASCADE,
     )
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            if not adding:
+                old_parent_id, old_name = (
+                    Category.objects.filter(pk=self.pk)
+                    .values_list("parent_id", "name")
+                    .first()
+                ) or (None, None)
+            super().save(*args, **kwargs)
+            if adding:
+                CategoryClosure.objects.insert_node(self)
+                return
+            if old_parent_id != self.parent_id:
+                CategoryClosure.objects.move_subtree(self)
+            if (old_parent_id, old_name) != (self.parent_id, self.name):
+                CategoryClosure.objects.update_product_paths(self)
+
     def __str__(self):
         return self.name
 
 
+class CategoryClosureManager(models.Manager):
+    """
+    Keeps the ancestor index of the category tree up to date. Deleted categories
+    take their rows with them through the CASCADE foreign keys.
+    """
+
+    use_in_migrations = True
+
+    def insert_node(self, category):
+        links = [self.model(ancestor_id=category.pk, descendant_id=category.pk)]
+        if category.parent_id:
+            links += [
+                self.model(
+                    ancestor_id=ancestor_id, descendant_id=category.pk, depth=depth + 1
+                )
+                for ancestor_id, depth in self.filter(
+                    descendant_id=category.parent_id
+                ).values_list("ancestor_id", "depth")
+            ]
+        self.bulk_create(links)
+
+    def move_subtree(self, category):
+        subtree = list(
+            self.filter(ancestor_id=category.pk).values_list("descendant_id", "depth")
+        )
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        if category.parent_id in subtree_ids:
+            raise ValueError("A category cannot be moved into its own subtree.")
+        self.filter(descendant_id__in=subtree_ids).exclude(
+            ancestor_id__in=subtree_ids
+        ).delete()
+        if category.parent_id:
+            ancestors = self.filter(descendant_id=category.parent_id).values_list(
+                "ancestor_id", "depth"
+            )
+            self.bulk_create(
+                [
+                    self.model(
+                        ancestor_id=ancestor_id,
+                        descendant_id=descendant_id,
+                        depth=ancestor_depth + depth + 1,
+                    )
+                    for ancestor_id, ancestor_depth in ancestors
+                    for descendant_id, depth in subtree
+                ],
+                batch_size=5000,
+            )
+
+    def paths(self, category_ids):
+        """
+        Category paths by category id, e.g. "Electronics / Phones", as stored
+        in ``Product.category_path``.
+        """
+        names = {}
+        for category_id, name in (
+            self.filter(descendant_id__in=category_ids)
+            .order_by("descendant_id", "-depth")
+            .values_list("descendant_id", "ancestor__name")
+        ):
+            names.setdefault(category_id, []).append(name)
+        return {
+            category_id: CATEGORY_PATH_SEPARATOR.join(parts)
+            for category_id, parts in names.items()
+        }
+
+    def update_product_paths(self, category, batch_size=500):
+        """
+        Rewrite ``category_path`` of the products in ``category``'s subtree
+        after it was renamed or moved.
+        """
+        paths = list(
+            self.paths(
+                self.filter(ancestor_id=category.pk).values("descendant_id")
+            ).items()
+        )
+        now = timezone.now()
+        for start in range(0, len(paths), batch_size):
+            batch = dict(paths[start : start + batch_size])
+            Product.objects.filter(category_id__in=batch).update(
+                category_path=models.Case(
+                    *[
+                        models.When(category_id=category_id, then=models.Value(path))
+                        for category_id, path in batch.items()
+                    ]
+                ),
+                updated_at=now,
+            )
+
+    def rebuild(self):
+        """
+        Recompute the whole index from the parent pointers, e.g. after categories
+        were inserted with bulk_create().
+        """
+        category_model = self.model._meta.get_field("ancestor").related_model
+        parents = dict(category_model.objects.values_list("pk", "parent_id"))
+        links = []
+        for category_id in parents:
+            ancestor_id, depth = category_id, 0
+            while ancestor_id is not None:
+                links.append(
+                    self.model(
+                        ancestor_id=ancestor_id, descendant_id=category_id, depth=depth
+                    )
+                )
+                ancestor_id, depth = parents[ancestor_id], depth + 1
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(links, batch_size=5000)
+
+
+class CategoryClosure(models.Model):
+    ancestor = models.ForeignKey(
+        Category, related_name="descendant_links", on_delete=models.CASCADE
+    )
+    descendant = models.ForeignKey(
+        Category, related_name="ancestor_links", on_delete=models.CASCADE
+    )
+    depth = models.PositiveSmallIntegerField(default=0)
+
+    objects = CategoryClosureManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="category_closure_unique"
+            )
+        ]
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Bumps the product version (products.cache.product_version) on bulk writes,
+    which skip the save and delete signals. Listings use it as their ETag stamp.
+    """
+
+    def _changed(self, result):
+        from .cache import product_version
+
+        product_version.bump_on_change()
+        return result
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        return self._changed(updated) if updated else updated
+
+    def bulk_create(self, *args, **kwargs):
+        return self._changed(super().bulk_create(*args, **kwargs))
+
+    def bulk_update(self, *args, **kwargs):
+        return self._changed(super().bulk_update(*args, **kwargs))
+
+    def delete(self):
+        return self._changed(super().delete())
+
+
 class Product(models.Model):
+    # Stock-keeping unit from the catalog feed; bulk imports upsert on it.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     category = models.ForeignKey(
         Category, related_name="products", on_delete=models.CASCADE
@@ -27,6 +228,76 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
 
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal(0))
+    # Read-model columns, so listings can filter and sort on them in SQL and
+    # don't compute them per row. The discounted price keeps every digit of
+    # price * (1 - discount / 100), which has at most six decimal places.
+    discounted_price = models.GeneratedField(
+        expression=PercentOff("price", "discount"),
+        output_field=models.DecimalField(max_digits=16, decimal_places=6),
+        db_persist=True,
+    )
+    in_stock = models.GeneratedField(
+        expression=models.Q(stock__gt=0),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+    # The names from the root category down, kept up to date by save() here and
+    # by Category.save(); bulk writes must fill it in themselves.
+    category_path = models.TextField(blank=True, default="", editable=False)
+    # auto_now only applies on save(); queryset.update() calls must set it too.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger on PostgreSQL, see products.search.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Reservations for hot-stock products take stock from a counter store that
+    # is flushed to ``stock`` in batches, see products.stock.
+    hot_stock = models.BooleanField(default=False)
+    # The campaign whose discount is currently applied, if any.
+    sale_campaign = models.ForeignKey(
+        "SaleCampaign",
+        related_name="discounted_products",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # list_products: in-stock products, optionally within a category
+            # subtree, paged by id.
+            models.Index(
+                fields=["id"],
+                condition=models.Q(stock__gt=0),
+                name="product_in_stock_idx",
+            ),
+            models.Index(
+                fields=["category", "id"],
+                condition=models.Q(stock__gt=0),
+                name="product_in_stock_category_idx",
+            ),
+            models.Index(
+                fields=["discounted_price", "id"],
+                condition=models.Q(stock__gt=0),
+                name="product_in_stock_price_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"category", "category_id"} & set(update_fields):
+            self.category_path = CategoryClosure.objects.paths([self.category_id]).get(
+                self.category_id, ""
+            )
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "category_path"}
+        super().save(*args, **kwargs)
+        # The database computes generated fields, so the instance still holds
+        # the values from before the save.
+        if update_fields is None or {"price", "discount", "stock"} & set(update_fields):
+            self.refresh_from_db(
+                using=self._state.db, fields=["discounted_price", "in_stock"]
+            )
 
     def get_discounted_price(self):
         return self.price * (Decimal(1) - self.discount / Decimal(100))
@@ -40,6 +311,7 @@ class Reservation(models.Model):
         ("reserved", "Reserved"),
         ("sold", "Sold"),
         ("canceled", "Canceled"),
+        ("expired", "Expired"),
     ]
 
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -48,8 +320,176 @@ class Reservation(models.Model):
     )  # This should be a ForeignKey to User in a real application
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="reserved")
     quantity = models.PositiveIntegerField(default=1)
+    # Product price when the sale completed; sales revenue is priced from it.
+    unit_price = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"], name="reservation_created_id_idx"
+            ),
+            # Sold reservations by sale date (sales rollup backfill).
+            models.Index(
+                fields=["status", "updated_at"], name="reservation_status_updated_idx"
+            ),
+            # Active reservations by age (reservation expiry).
+            models.Index(
+                fields=["status", "created_at"], name="reservation_status_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.product.name} reserved by {self.user}"
+
+
+class SalesDaily(models.Model):
+    """
+    Units sold and revenue per product and day, kept up to date by
+    ReservationService.complete_sale so the sold report never scans reservations.
+    """
+
+    product = models.ForeignKey(
+        Product, related_name="sales_daily", on_delete=models.CASCADE
+    )
+    category = models.ForeignKey(
+        Category, related_name="sales_daily", on_delete=models.CASCADE
+    )
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal(0))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "day"], name="sales_daily_product_day_unique"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="sales_daily_day_idx"),
+            models.Index(
+                fields=["category", "day"], name="sales_daily_category_day_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units}"
+
+
+class SaleCampaign(models.Model):
+    """
+    A discount applied to a set of products and category subtrees for a time
+    window. SaleCampaignService copies the discount onto the matching products
+    when the window opens and resets it when it closes, so reads never have to
+    look campaigns up.
+    """
+
+    STATUS_CHOICES = [
+        ("scheduled", "Scheduled"),
+        ("active", "Active"),
+        ("ended", "Ended"),
+    ]
+
+    name = models.CharField(max_length=255)
+    discount = models.DecimalField(max_digits=5, decimal_places=2)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="scheduled"
+    )
+    products = models.ManyToManyField(
+        Product, related_name="sale_campaigns", blank=True
+    )
+    categories = models.ManyToManyField(
+        Category, related_name="sale_campaigns", blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "starts_at"], name="sale_campaign_status_start_idx"
+            ),
+            models.Index(
+                fields=["status", "ends_at"], name="sale_campaign_status_end_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.discount}%)"
+
+
+class StockFlush(models.Model):
+    """
+    A batch of hot-stock changes applied to Product.stock. The flush id is
+    recorded in the same transaction as the stock update, so a reconciler that
+    crashed can tell whether its last flush reached the database.
+    """
+
+    flush_id = models.CharField(max_length=32, unique=True)
+    product = models.ForeignKey(
+        Product, related_name="stock_flushes", on_delete=models.CASCADE
+    )
+    delta = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["created_at"], name="stock_flush_created_idx")]
+
+    def __str__(self):
+        return f"{self.flush_id}: {self.product_id} {self.delta:+d}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied Idempotency-Key and the response to the first request sent
+    with it. ``response_status`` stays empty while that request is in progress;
+    ``locked_at`` is when it claimed the key.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_key_expires_idx")
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class OutboxEvent(models.Model):
+    """
+    A change to stock, a reservation or a discount, written in the transaction
+    that made it. The relay publishes events in ``id`` order and numbers them
+    with ``sequence`` as it goes; readers tail events by sequence, which has no
+    gaps from transactions committing out of order.
+    """
+
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sequence = models.PositiveBigIntegerField(null=True, blank=True, unique=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(published_at__isnull=True),
+                name="outbox_unpublished_idx",
+            ),
+            models.Index(fields=["published_at"], name="outbox_published_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.topic}"
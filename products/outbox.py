@@ -0,0 +1,40 @@
+"""
+Sinks for the outbox relay (``manage.py publish_events``). A sink receives
+batches of published events as dicts, in sequence order, and must raise if it
+could not deliver them; the batch is then retried. Delivery is at least once,
+so consumers should skip event ids they have already seen.
+
+Sinks take their options as keyword arguments, like the stock stores.
+"""
+
+import sys
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .exports import ndjson_lines
+
+
+class FileSink:
+    """
+    Append events as NDJSON lines to ``path``, or write them to stdout when no
+    path is given. Meant for local development and for piping into other tools.
+    """
+
+    def __init__(self, path=None, **options):
+        self.path = path
+
+    def publish(self, events):
+        if not self.path:
+            sys.stdout.writelines(ndjson_lines(events))
+            sys.stdout.flush()
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.writelines(ndjson_lines(events))
+
+
+def get_sink():
+    """
+    The sink configured by OUTBOX_SINK.
+    """
+    return import_string(settings.OUTBOX_SINK)(path=settings.OUTBOX_SINK_PATH)
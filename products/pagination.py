@@ -0,0 +1,190 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the WHERE clause that seeks past the row holding ``values`` for the given
+    ordering, e.g. ("-created_at", "-id") becomes
+    created_at <= v0 AND (created_at < v0 OR (created_at = v0 AND id < v1)).
+    The redundant leading bound lets the database start an index range scan there.
+    """
+    condition = None
+    for field, value in reversed(list(zip(ordering, values))):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        seek = Q(**{f"{name}__{lookup}": value})
+        condition = (
+            seek if condition is None else seek | (Q(**{name: value}) & condition)
+        )
+    name, lookup = ordering[0].lstrip("-"), (
+        "lte" if ordering[0].startswith("-") else "gte"
+    )
+    return Q(**{f"{name}__{lookup}": values[0]}) & condition
+
+
+def reverse_ordering(ordering):
+    return tuple(
+        field[1:] if field.startswith("-") else f"-{field}" for field in ordering
+    )
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row seen with a WHERE clause on the
+    ordering columns instead of an OFFSET, so deep pages cost the same as the first.
+    The ordering must end in a unique column and should be backed by an index.
+    """
+
+    ordering = ("id",)
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek(queryset, request)
+        return self.set_page(list(queryset[: self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek(queryset, request)
+        return self.set_page([row async for row in queryset[: self.page_size + 1]])
+
+    def seek(self, queryset, request):
+        """
+        Order the queryset for the requested page and position it after the cursor.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.cursor_values, self.reversed = self.decode_cursor(request, queryset.model)
+
+        ordering = reverse_ordering(self.ordering) if self.reversed else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor_values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, self.cursor_values))
+        return queryset
+
+    def get_ordering(self, queryset):
+        return self.ordering
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        has_cursor = self.cursor_values is not None
+        self.page = rows[: self.page_size]
+        if self.reversed:
+            self.page.reverse()
+            self.has_next, self.has_previous = has_cursor, has_more
+        else:
+            self.has_next, self.has_previous = has_more, has_cursor
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request, model):
+        """
+        The cursor's ordering values, converted to the types of their model fields,
+        and whether it points backwards. Anything malformed is a 404, as the cursor
+        only comes from links this class built.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            values, reversed_ = cursor["v"], bool(cursor["r"])
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            values = [
+                self.cursor_value(model, field, value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reversed_
+
+    def cursor_value(self, model, field, value):
+        if value is None or isinstance(value, (dict, list)):
+            raise ValueError
+        field = model._meta.get_field(field.lstrip("-"))
+        # Generated fields convert values with the field they're stored as.
+        return getattr(field, "output_field", field).to_python(value)
+
+    def encode_cursor(self, row, reversed_):
+        values = []
+        for field in self.ordering:
+            field = field.lstrip("-")
+            value = row[field] if isinstance(row, dict) else getattr(row, field)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        cursor = json.dumps({"v": values, "r": int(reversed_)}, default=str)
+        encoded = urlsafe_b64encode(cursor.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reversed_=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reversed_=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ProductPagination(KeysetPagination):
+    ordering = ("id",)
+
+    def get_ordering(self, queryset):
+        """
+        The ``?ordering=`` ProductFilter applied, with id breaking ties in the
+        direction of the last column, so a (column, id) index can serve it.
+        """
+        requested = tuple(queryset.query.order_by)
+        if not requested:
+            return self.ordering
+        if requested[-1].lstrip("-") == "id":
+            return requested
+        return requested + ("-id" if requested[-1].startswith("-") else "id",)
+
+
+class ReservationPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
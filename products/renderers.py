@@ -0,0 +1,31 @@
+"""
+The API's default JSON renderer, configured in REST_FRAMEWORK.
+"""
+
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class CompactJSONEncoder(JSONEncoder):
+    """
+    DRF's encoder, except that Decimals that reach it (e.g. in hand-built
+    responses) keep their exact value as strings, as serializer DecimalFields
+    render them, instead of becoming floats.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return format(obj, "f")
+        return super().default(obj)
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    JSON without whitespace, whatever COMPACT_JSON says. Clients can still ask
+    for ``application/json; indent=4`` while debugging.
+    """
+
+    encoder_class = CompactJSONEncoder
+    compact = True
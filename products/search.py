@@ -0,0 +1,119 @@
+"""
+Full-text product search. On PostgreSQL, ``Product.search_vector`` is kept up to
+date by a trigger and backed by a GIN index. On SQLite, an FTS5 table mirrors
+name and description through triggers instead, so search also works in local and
+test databases. Other backends fall back to substring matching.
+
+The statements below are the current definitions. Migrations install them from
+their own frozen copy in products/migrations/_search_sql.py, so changing them here
+needs a new migration. SQLite rebuilds a table for most ALTER TABLE operations,
+which drops its triggers, so migrations that alter the product table must
+recreate them afterwards with that module's reinstall_search.
+"""
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q, Value
+
+SEARCH_CONFIG = "english"
+FTS_TABLE = "products_product_fts"
+
+POSTGRES_INSTALL = [
+    f"""
+    CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_product_search_vector ON products_product",
+    """
+    CREATE TRIGGER products_product_search_vector
+    BEFORE INSERT OR UPDATE OF name, description ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update()
+    """,
+    "UPDATE products_product SET name = name",
+    """
+    CREATE INDEX IF NOT EXISTS product_search_vector_idx
+    ON products_product USING gin (search_vector)
+    """,
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "DROP TRIGGER IF EXISTS products_product_search_vector ON products_product",
+    "DROP FUNCTION IF EXISTS products_product_search_vector_update()",
+]
+
+SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, content='products_product', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON products_product
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON products_product
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, description ON products_product
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts5_query(text):
+    # Quote every term so user input can't use FTS5 operators; terms are ANDed.
+    return " ".join('"%s"' % term.replace('"', '""') for term in text.split())
+
+
+def search(queryset, text, vendor):
+    """
+    Restrict ``queryset`` to products matching ``text`` and annotate a ``rank``
+    where higher is better.
+    """
+    if vendor == "postgresql":
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F("search_vector"), query)
+        )
+    if vendor == "sqlite":
+        # Join the FTS table so MATCH and bm25() run once per query, not per row.
+        # bm25() is lower for better matches; name hits weigh more than description.
+        return queryset.extra(
+            select={"rank": f"-bm25({FTS_TABLE}, 10.0, 1.0)"},
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = products_product.id", f"{FTS_TABLE} MATCH %s"],
+            params=[fts5_query(text)],
+        )
+    condition = Q()
+    for term in text.split():
+        condition &= Q(name__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition).annotate(rank=Value(0.0))
@@ -1,5 +1,15 @@
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import Category, Product, Reservation
+from .models import (
+    Category,
+    CategoryClosure,
+    OutboxEvent,
+    Product,
+    Reservation,
+    SaleCampaign,
+)
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -7,31 +17,118 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = "__all__"
 
+    def validate_parent(self, parent):
+        if (
+            parent is not None
+            and self.instance is not None
+            and CategoryClosure.objects.filter(
+                ancestor=self.instance, descendant=parent
+            ).exists()
+        ):
+            raise serializers.ValidationError(
+                "A category cannot be moved into its own subtree."
+            )
+        return parent
+
 
 class ProductSerializer(serializers.ModelSerializer):
-    discounted_price = serializers.SerializerMethodField()
+    # Kept a JSON number, as before it became a column.
+    discounted_price = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Product
         fields = [
             "id",
+            "sku",
             "name",
             "description",
             "price",
             "stock",
             "category",
+            "category_path",
             "discount",
             "discounted_price",
         ]
 
-    def get_discounted_price(self, obj):
-        return obj.get_discounted_price()
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # A sparse fieldset, e.g. from ?fields= on the product listing.
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def validate_stock(self, stock):
+        # A hot product's stock lives in the counter store; see HotStockService.
+        if (
+            settings.HOT_STOCK_ENABLED
+            and self.instance is not None
+            and self.instance.hot_stock
+            and stock != self.instance.stock
+        ):
+            raise serializers.ValidationError(
+                "Held in hot-stock counters; disable hot stock first."
+            )
+        return stock
+
+    def update(self, instance, validated_data):
+        if not (settings.HOT_STOCK_ENABLED and instance.hot_stock):
+            return super().update(instance, validated_data)
+        # Saving every column would write a stale stock over a concurrent flush.
+        validated_data.pop("stock", None)
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields=[*validated_data, "updated_at"])
+        return instance
+
+
+class ProductSearchSerializer(ProductSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ["rank"]
+
+
+class ProductSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    category = serializers.IntegerField(required=False)
+    min_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    max_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    in_stock = serializers.BooleanField(required=False, allow_null=True, default=None)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    offset = serializers.IntegerField(min_value=0, default=0)
 
 
 class ReservationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reservation
         fields = "__all__"
+        read_only_fields = ["unit_price"]
+
+
+class ReservationLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class ReservationBatchSerializer(serializers.Serializer):
+    user = serializers.CharField(max_length=100, default="Anonymous")
+    items = ReservationLineSerializer(many=True, allow_empty=False)
+
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboxEvent
+        fields = ["id", "sequence", "topic", "payload", "created_at"]
+
+
+class EventQuerySerializer(serializers.Serializer):
+    after = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    timeout = serializers.FloatField(min_value=0, max_value=60, default=None)
 
 
 class SoldProductReportSerializer(serializers.ModelSerializer):
@@ -41,3 +138,38 @@ class SoldProductReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ["name", "category", "total_sold", "total_revenue"]
+
+
+class SaleCampaignSerializer(serializers.ModelSerializer):
+    discount = serializers.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        min_value=Decimal("0.01"),
+        max_value=Decimal(100),
+    )
+
+    class Meta:
+        model = SaleCampaign
+        fields = [
+            "id",
+            "name",
+            "discount",
+            "starts_at",
+            "ends_at",
+            "status",
+            "products",
+            "categories",
+            "created_at",
+        ]
+        read_only_fields = ["status"]
+
+    def validate(self, attrs):
+        if attrs["ends_at"] <= attrs["starts_at"]:
+            raise serializers.ValidationError(
+                {"ends_at": "The campaign must end after it starts."}
+            )
+        if not attrs.get("products") and not attrs.get("categories"):
+            raise serializers.ValidationError(
+                "A campaign needs at least one product or category."
+            )
+        return attrs
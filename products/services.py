@@ -1,17 +1,91 @@
 # products/services.py
 
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
 from decimal import Decimal
-from django.db.models import Sum, F
-from .models import Product, Category, Reservation
-from .exceptions import ProductNotFoundError, InsufficientStockError, ReservationError
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    Max,
+    PositiveIntegerField,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.utils import timezone
+from . import imports, search
+from .cache import category_tree_cache, product_version
+from .serializers import OutboxEventSerializer
+from .stock import stock_store
+from .models import (
+    CategoryClosure,
+    IdempotencyKey,
+    OutboxEvent,
+    Product,
+    Reservation,
+    SaleCampaign,
+    SalesDaily,
+    StockFlush,
+)
+from .exceptions import (
+    BatchReservationError,
+    CategoryNotFoundError,
+    IdempotencyKeyInUseError,
+    InsufficientStockError,
+    ProductNotFoundError,
+    ReservationError,
+    ReservationNotFoundError,
+    SaleCampaignNotFoundError,
+)
 
+_taken_stock = ContextVar("taken_stock", default=None)
 
-# products/services.py
 
-from decimal import Decimal
-from django.db.models import Sum, F
-from .models import Product, Category, Reservation
-from .exceptions import ProductNotFoundError, InsufficientStockError, ReservationError
+@contextmanager
+def hot_stock_atomic():
+    """
+    transaction.atomic() for code that takes hot stock. The counter store isn't
+    part of the transaction, so stock taken inside the block is given back if it
+    rolls back, including when the commit itself fails. Nested blocks join the
+    outermost one.
+    """
+    if _taken_stock.get() is not None:
+        with transaction.atomic(savepoint=False):
+            yield
+        return
+    taken = defaultdict(int)
+    token = _taken_stock.set(taken)
+    try:
+        with transaction.atomic():
+            yield
+    except BaseException:
+        if taken:
+            stock_store.adjust(dict(taken))
+        raise
+    finally:
+        _taken_stock.reset(token)
+
+
+def take_hot_stock(quantities):
+    """
+    Take ``{product_id: quantity}`` from the counters, all or nothing; returns
+    what stock_store.adjust() does. Inside hot_stock_atomic() the stock is given
+    back if the transaction rolls back.
+    """
+    applied = stock_store.adjust({pk: -qty for pk, qty in quantities.items()})
+    taken = _taken_stock.get()
+    if applied and taken is not None:
+        for product_id, quantity in quantities.items():
+            taken[product_id] += quantity
+    return applied
 
 
 class ProductService:
@@ -20,11 +94,71 @@ class ProductService:
     def list_products(category_id=None):
         queryset = Product.objects.filter(stock__gt=0)
         if category_id:
-            category = Category.objects.get(pk=category_id)
-            subcategories = category.subcategories.all()
-            queryset = queryset.filter(category__in=[category] + list(subcategories))
+            queryset = queryset.filter(
+                category_id__in=CategoryClosure.objects.filter(
+                    ancestor_id=category_id
+                ).values("descendant_id")
+            )
         return queryset
 
+    @staticmethod
+    def list_version(category_id=None):
+        """
+        A stamp that changes whenever ``list_products(category_id)`` would, read
+        from the cache without querying: every write to the product table bumps
+        the product version.
+        """
+        version = str(product_version.get())
+        if category_id:
+            # Moving categories changes the subtree without touching any product.
+            version += f":{category_tree_cache.version()}"
+        return version
+
+    @staticmethod
+    def search_products(
+        text, category_id=None, min_price=None, max_price=None, in_stock=None
+    ):
+        """
+        Products matching ``text``, best first, with a ``rank`` annotation.
+        """
+        queryset = Product.objects.all()
+        queryset = search.search(queryset, text, connections[queryset.db].vendor)
+        if category_id:
+            queryset = queryset.filter(
+                category_id__in=CategoryClosure.objects.filter(
+                    ancestor_id=category_id
+                ).values("descendant_id")
+            )
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if in_stock is not None:
+            queryset = (
+                queryset.filter(stock__gt=0) if in_stock else queryset.filter(stock=0)
+            )
+        return queryset.order_by("-rank", "id")
+
+    @staticmethod
+    def search_facets(queryset):
+        """
+        Number of products per category in ``queryset``, in one aggregate query.
+        """
+        rows = (
+            queryset.order_by()
+            .values("category", "category__name")
+            .annotate(count=Count("id"))
+            .order_by("-count", "category")
+        )
+        return [
+            {
+                "category": row["category"],
+                "name": row["category__name"],
+                "count": row["count"],
+            }
+            for row in rows
+        ]
+
     @staticmethod
     def get_product(pk):
         try:
@@ -33,56 +167,227 @@ class ProductService:
             raise ProductNotFoundError(f"Product with id {pk} not found.")
 
     @staticmethod
+    async def aget_product(pk):
+        try:
+            return await Product.objects.aget(pk=pk)
+        except Product.DoesNotExist:
+            raise ProductNotFoundError(f"Product with id {pk} not found.")
+
+    @staticmethod
+    @hot_stock_atomic()
     def modify_stock(product, quantity):
         """
         Modify the stock of a product. Positive quantity increases stock, negative quantity decreases stock.
         """
-        if product.stock + quantity < 0:
+        ProductService.adjust_stock(product.pk, quantity)
+        product.refresh_from_db(fields=["stock"])
+
+    @staticmethod
+    def adjust_stock(product_id, quantity):
+        """
+        Apply a stock delta with a single conditional UPDATE, without loading the product.
+        Decrements only match while enough stock is left, so concurrent callers can't oversell.
+        Hot-stock products are adjusted in the counter store instead; returns whether
+        the change went there. Stock given back to a counter only becomes available
+        once the transaction commits. Call it in hot_stock_atomic(): it also writes
+        an outbox event.
+        """
+        hot = settings.HOT_STOCK_ENABLED
+        if hot:
+            product_id = int(product_id)  # Request data may carry it as a string.
+            if quantity > 0:
+                applied = bool(stock_store.loaded([product_id])) or None
+                if applied:
+                    transaction.on_commit(
+                        lambda: ProductService.return_hot_stock(product_id, quantity)
+                    )
+            else:
+                applied = take_hot_stock({product_id: -quantity})
+            if applied is not None:
+                if not applied:
+                    raise InsufficientStockError("Not enough stock available.")
+                OutboxService.emit(
+                    "stock.changed", {"product": product_id, "delta": quantity}
+                )
+                return True
+        queryset = Product.objects.filter(pk=product_id)
+        if hot:
+            # Stock of a loaded hot product must only change through its counter.
+            queryset = queryset.filter(hot_stock=False)
+        if quantity < 0:
+            queryset = queryset.filter(stock__gte=-quantity)
+        if not queryset.update(stock=F("stock") + quantity, updated_at=timezone.now()):
+            product = Product.objects.filter(pk=product_id).values("hot_stock").first()
+            if product is None:
+                raise ProductNotFoundError(f"Product with id {product_id} not found.")
+            if hot and product["hot_stock"]:
+                HotStockService.load(product_id)
+                return ProductService.adjust_stock(product_id, quantity)
             raise InsufficientStockError("Not enough stock available.")
-        product.stock += quantity
-        product.save()
+        OutboxService.emit("stock.changed", {"product": product_id, "delta": quantity})
+        return False
+
+    @staticmethod
+    def return_hot_stock(product_id, quantity):
+        """
+        Give stock back to a hot product's counter once the transaction that freed
+        it has committed. A product unloaded in the meantime gets it in its row.
+        """
+        if stock_store.adjust({product_id: quantity}) is not None:
+            return
+        updated = Product.objects.filter(pk=product_id, hot_stock=False).update(
+            stock=F("stock") + quantity, updated_at=timezone.now()
+        )
+        if not updated and HotStockService.load(product_id):
+            stock_store.adjust({product_id: quantity})
+
+    @staticmethod
+    def import_products(rows, chunk_size=None, max_errors=100):
+        """
+        Validate and upsert product row dicts (see products.imports) in chunks of
+        ``chunk_size``, each in its own transaction. Invalid rows are skipped and
+        reported; the first ``max_errors`` are listed. Returns a report dict.
+        """
+        start = time.perf_counter()
+        chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        categories, paths = imports.category_map()
+        report = {"rows": 0, "imported": 0, "error_count": 0, "errors": []}
+        for chunk in imports.chunked(rows, chunk_size):
+            products, errors = imports.validate_chunk(
+                chunk, report["rows"] + 1, categories, paths
+            )
+            report["rows"] += len(chunk)
+            if products and settings.HOT_STOCK_ENABLED:
+                for sku in Product.objects.filter(
+                    sku__in=list(products), hot_stock=True
+                ).values_list("sku", flat=True):
+                    # Their stock lives in the counter store; see HotStockService.
+                    row, _ = products.pop(sku)
+                    errors.append(
+                        (
+                            row,
+                            "stock: Held in hot-stock counters; disable hot stock first.",
+                        )
+                    )
+            if products:
+                ProductService.upsert_products(
+                    [product for _, product in products.values()]
+                )
+            report["imported"] += len(products)
+            report["error_count"] += len(errors)
+            report["errors"].extend(
+                {"row": row, "error": message}
+                for row, message in sorted(errors)[: max_errors - len(report["errors"])]
+            )
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        report["rows_per_second"] = round(
+            report["rows"] / report["seconds"] if report["seconds"] else 0, 1
+        )
+        return report
 
     @staticmethod
+    @transaction.atomic
+    def upsert_products(products):
+        """
+        Insert the products or update the existing ones with the same sku, in one
+        statement, and record a products.imported event.
+        """
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=[
+                "name",
+                "description",
+                "price",
+                "stock",
+                "category",
+                "category_path",
+                "updated_at",
+            ],
+        )
+        OutboxService.emit(
+            "products.imported", {"skus": [product.sku for product in products]}
+        )
+
+    @staticmethod
+    @transaction.atomic
     def start_sale(pk, discount):
         product = ProductService.get_product(pk)
         product.discount = Decimal(discount)
-        product.save()
+        # A manual discount takes the product out of any running campaign.
+        product.sale_campaign = None
+        product.save(update_fields=["discount", "sale_campaign", "updated_at"])
+        OutboxService.emit(
+            "product.sale_started",
+            {"product": product.pk, "discount": f"{product.discount:.2f}"},
+        )
         return product
 
     @staticmethod
+    @transaction.atomic
     def end_sale(pk):
         product = ProductService.get_product(pk)
         product.discount = Decimal(0)
-        product.save()
+        product.sale_campaign = None
+        product.save(update_fields=["discount", "sale_campaign", "updated_at"])
+        OutboxService.emit(
+            "product.sale_ended", {"product": product.pk, "discount": "0.00"}
+        )
         return product
 
     @staticmethod
-    def get_sold_products_report(start_date=None, end_date=None, category=None):
-        queryset = Product.objects.filter(reservation__status="sold")
-        queryset = queryset.annotate(
-            total_sold=Sum("reservation__quantity"),
-            total_revenue=Sum(F("reservation__quantity") * F("price")),
-        ).filter(total_sold__gt=0)
+    def record_sale(product, quantity, unit_price, day):
+        """
+        Add a completed sale to the product's SalesDaily row for that day.
+        """
+        rollup, _ = SalesDaily.objects.get_or_create(
+            product_id=product.pk,
+            day=day,
+            defaults={"category_id": product.category_id},
+        )
+        SalesDaily.objects.filter(pk=rollup.pk).update(
+            units=F("units") + quantity,
+            revenue=F("revenue") + quantity * unit_price,
+        )
 
-        if start_date and end_date:
-            queryset = queryset.filter(
-                reservation__updated_at__range=[start_date, end_date]
-            )
+    @staticmethod
+    def get_sold_products_report(start_date=None, end_date=None, category=None):
+        filters = Q()
+        if start_date:
+            filters &= Q(sales_daily__day__gte=start_date)
+        if end_date:
+            filters &= Q(sales_daily__day__lte=end_date)
         if category:
-            queryset = queryset.filter(category=category)
-
-        return queryset
+            filters &= Q(sales_daily__category=category)
+        # Filtering before annotate() restricts the aggregate to the matching rollup rows.
+        return (
+            Product.objects.filter(filters)
+            .annotate(
+                total_sold=Sum("sales_daily__units"),
+                total_revenue=Sum("sales_daily__revenue"),
+            )
+            .filter(total_sold__gt=0)
+            .order_by("pk")
+        )
 
 
 class CategoryService:
 
     @staticmethod
     def get_all_categories():
-        return Category.objects.all()
+        return list(category_tree_cache.get_tree().values())
+
+    @staticmethod
+    def tree_version():
+        return category_tree_cache.version()
 
     @staticmethod
     def get_category(category_id):
-        return Category.objects.get(pk=category_id)
+        category = category_tree_cache.get_category(int(category_id))
+        if category is None:
+            raise CategoryNotFoundError(f"Category with id {category_id} not found.")
+        return category
 
 
 class ReservationService:
@@ -92,32 +397,631 @@ class ReservationService:
         return Reservation.objects.all()
 
     @staticmethod
+    def get_reservation(pk):
+        try:
+            return Reservation.objects.get(pk=pk)
+        except Reservation.DoesNotExist:
+            raise ReservationNotFoundError(f"Reservation with id {pk} not found.")
+
+    @staticmethod
+    @hot_stock_atomic()
     def create_reservation(data):
-        product = ProductService.get_product(data.get("product"))
+        product_id = data.get("product")
         quantity = int(data.get("quantity", 1))
         user = data.get("user", "Anonymous")
-        ProductService.modify_stock(product, -quantity)  # Decrease stock
+        if quantity < 1:
+            raise ReservationError("Quantity must be a positive integer.")
+        ProductService.adjust_stock(product_id, -quantity)  # Decrease stock
         reservation = Reservation.objects.create(
-            product=product, quantity=quantity, user=user
+            product_id=product_id, quantity=quantity, user=user
         )
+        OutboxService.emit_reservation("reservation.created", reservation)
         return reservation
 
     @staticmethod
+    @hot_stock_atomic()
+    def create_reservations(items, user="Anonymous"):
+        """
+        Reserve a whole cart in one transaction. Product rows are locked in primary key
+        order so concurrent carts can't deadlock, and either every line is reserved or none.
+        Hot-stock products are taken from the counter store without locking their rows.
+        """
+        requested = {}
+        for item in items:
+            requested[item["product"]] = (
+                requested.get(item["product"], 0) + item["quantity"]
+            )
+        hot = stock_store.loaded(requested) if settings.HOT_STOCK_ENABLED else set()
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update()
+            .filter(pk__in=requested.keys() - hot)
+            .order_by("pk")
+        }
+        for product in list(products.values()):
+            # Flagged but not loaded yet; the row lock we hold makes loading safe.
+            if settings.HOT_STOCK_ENABLED and product.hot_stock:
+                HotStockService.load(product.pk)
+                hot.add(products.pop(product.pk).pk)
+
+        def outcome(product_id):
+            if product_id in hot:
+                counter = stock_store.snapshot(product_id)
+                available = counter["available"] if counter else 0
+            elif product_id in products:
+                available = products[product_id].stock
+            else:
+                return "not_found"
+            return "ok" if available >= requested[product_id] else "insufficient_stock"
+
+        def reject():
+            raise BatchReservationError(
+                {
+                    "detail": "Cart could not be reserved.",
+                    "lines": [
+                        {**item, "status": outcome(item["product"])} for item in items
+                    ],
+                }
+            )
+
+        if any(outcome(pk) != "ok" for pk in requested.keys() - hot):
+            reject()
+        held = {pk: requested[pk] for pk in sorted(hot)}
+        if held and not take_hot_stock(held):
+            reject()
+
+        cold = requested.keys() - hot
+        if cold:
+            Product.objects.filter(pk__in=cold).update(
+                stock=F("stock")
+                - Case(
+                    *[When(pk=pk, then=Value(requested[pk])) for pk in cold],
+                    output_field=PositiveIntegerField(),
+                ),
+                updated_at=timezone.now(),
+            )
+        reservations = Reservation.objects.bulk_create(
+            [
+                Reservation(
+                    product_id=item["product"],
+                    quantity=item["quantity"],
+                    user=user,
+                )
+                for item in items
+            ]
+        )
+        OutboxService.emit_many(
+            [
+                *(
+                    ("stock.changed", {"product": pk, "delta": -requested[pk]})
+                    for pk in sorted(requested)
+                ),
+                *(
+                    OutboxService.reservation_event("reservation.created", reservation)
+                    for reservation in reservations
+                ),
+            ]
+        )
+        return reservations
+
+    @staticmethod
+    @transaction.atomic
     def complete_sale(reservation_id):
-        reservation = Reservation.objects.get(pk=reservation_id)
+        reservation = (
+            Reservation.objects.select_for_update()
+            .select_related("product")
+            .get(pk=reservation_id)
+        )
         if reservation.status != "reserved":
             raise ReservationError("Reservation is not available for sale.")
         reservation.status = "sold"
-        reservation.save()
+        reservation.unit_price = reservation.product.price
+        reservation.save(update_fields=["status", "unit_price", "updated_at"])
+        ProductService.record_sale(
+            reservation.product,
+            reservation.quantity,
+            reservation.unit_price,
+            timezone.localdate(reservation.updated_at),
+        )
+        OutboxService.emit_reservation("reservation.sold", reservation)
         return reservation
 
     @staticmethod
+    @hot_stock_atomic()
     def cancel_reservation(reservation_id):
-        reservation = Reservation.objects.get(pk=reservation_id)
+        reservation = Reservation.objects.select_for_update().get(pk=reservation_id)
         if reservation.status == "sold":
             raise ReservationError("Reservation already completed. Cannot cancel.")
-        product = reservation.product
-        ProductService.modify_stock(product, reservation.quantity)  # Increase stock
+        if reservation.status != "reserved":
+            raise ReservationError("Reservation is no longer active.")
+        ProductService.adjust_stock(
+            reservation.product_id, reservation.quantity
+        )  # Increase stock
         reservation.status = "canceled"
-        reservation.save()
+        reservation.save(update_fields=["status", "updated_at"])
+        OutboxService.emit_reservation("reservation.canceled", reservation)
         return reservation
+
+    @staticmethod
+    @hot_stock_atomic()
+    def expire_stale_reservations(ttl=None, batch_size=500):
+        """
+        Expire up to batch_size reservations older than the TTL and return their stock.
+        Rows locked by a checkout or another sweeper are skipped, so sweepers can run
+        in parallel. Returns the number of reservations expired.
+        """
+        ttl = settings.RESERVATION_TTL if ttl is None else ttl
+        cutoff = timezone.now() - timedelta(seconds=ttl)
+        stale = list(
+            Reservation.objects.select_for_update(skip_locked=True)
+            .filter(status="reserved", created_at__lt=cutoff)
+            .order_by("created_at")
+            .values_list("pk", "product_id", "quantity")[:batch_size]
+        )
+        if not stale:
+            return 0
+
+        Reservation.objects.filter(pk__in=[pk for pk, _, _ in stale]).update(
+            status="expired", updated_at=timezone.now()
+        )
+        restored = defaultdict(int)
+        for _, product_id, quantity in stale:
+            restored[product_id] += quantity
+        for product_id in sorted(restored):
+            ProductService.adjust_stock(product_id, restored[product_id])
+        OutboxService.emit_many(
+            (
+                "reservation.expired",
+                {
+                    "reservation": pk,
+                    "product": product_id,
+                    "quantity": quantity,
+                    "status": "expired",
+                },
+            )
+            for pk, product_id, quantity in stale
+        )
+        return len(stale)
+
+
+class SaleCampaignService:
+
+    @staticmethod
+    def get_all_campaigns():
+        return SaleCampaign.objects.prefetch_related("products", "categories").order_by(
+            "-starts_at", "-id"
+        )
+
+    @staticmethod
+    def get_campaign(pk):
+        try:
+            return SaleCampaignService.get_all_campaigns().get(pk=pk)
+        except SaleCampaign.DoesNotExist:
+            raise SaleCampaignNotFoundError(f"Sale campaign with id {pk} not found.")
+
+    @staticmethod
+    def target_products(campaign):
+        """
+        The campaign's products plus every product in its categories' subtrees.
+        """
+        Products = SaleCampaign.products.through
+        Categories = SaleCampaign.categories.through
+        return Product.objects.filter(
+            Q(
+                pk__in=Products.objects.filter(salecampaign=campaign).values(
+                    "product_id"
+                )
+            )
+            | Q(
+                category_id__in=CategoryClosure.objects.filter(
+                    ancestor_id__in=Categories.objects.filter(
+                        salecampaign=campaign
+                    ).values("category_id")
+                ).values("descendant_id")
+            )
+        )
+
+    @staticmethod
+    def apply(campaign):
+        """
+        Copy the campaign's discount onto its products in one UPDATE. Products
+        keep a bigger discount from another campaign and manual discounts set
+        with ProductService.start_sale(). Returns the number of products discounted.
+        """
+        updated = (
+            SaleCampaignService.target_products(campaign)
+            .filter(
+                Q(sale_campaign__isnull=True, discount=0)
+                | Q(sale_campaign__discount__lt=campaign.discount)
+            )
+            .update(
+                discount=campaign.discount,
+                sale_campaign=campaign,
+                updated_at=timezone.now(),
+            )
+        )
+        campaign.status = "active"
+        campaign.save(update_fields=["status"])
+        OutboxService.emit_campaign("campaign.started", campaign, updated)
+        return updated
+
+    @staticmethod
+    def revert(campaign):
+        """
+        Take the campaign's discount off its products. Products another active
+        campaign covers get the biggest such discount, one UPDATE per campaign;
+        the rest are reset in one more UPDATE.
+        """
+        others = SaleCampaign.objects.filter(status="active").exclude(pk=campaign.pk)
+        reverted = 0
+        for other in others.order_by("-discount", "id"):
+            reverted += (
+                SaleCampaignService.target_products(other)
+                .filter(sale_campaign=campaign)
+                .update(
+                    discount=other.discount,
+                    sale_campaign=other,
+                    updated_at=timezone.now(),
+                )
+            )
+        reverted += Product.objects.filter(sale_campaign=campaign).update(
+            discount=Decimal(0), sale_campaign=None, updated_at=timezone.now()
+        )
+        campaign.status = "ended"
+        campaign.save(update_fields=["status"])
+        OutboxService.emit_campaign("campaign.ended", campaign, reverted)
+        return reverted
+
+    @staticmethod
+    @transaction.atomic
+    def run_due(now=None):
+        """
+        End campaigns whose window has closed, then start those whose window is
+        open. Campaigns locked by another runner are skipped.
+        Returns (campaigns started, campaigns ended).
+        """
+        now = now or timezone.now()
+        due = SaleCampaign.objects.select_for_update(skip_locked=True)
+        ending = list(due.filter(status="active", ends_at__lte=now).order_by("id"))
+        for campaign in ending:
+            SaleCampaignService.revert(campaign)
+        # Windows that passed while nobody was running campaigns.
+        SaleCampaign.objects.filter(status="scheduled", ends_at__lte=now).update(
+            status="ended"
+        )
+        starting = list(
+            due.filter(
+                status="scheduled", starts_at__lte=now, ends_at__gt=now
+            ).order_by("starts_at", "id")
+        )
+        for campaign in starting:
+            SaleCampaignService.apply(campaign)
+        return len(starting), len(ending)
+
+    @staticmethod
+    @transaction.atomic
+    def end_campaign(pk):
+        try:
+            campaign = SaleCampaign.objects.select_for_update().get(pk=pk)
+        except SaleCampaign.DoesNotExist:
+            raise SaleCampaignNotFoundError(f"Sale campaign with id {pk} not found.")
+        if campaign.status == "active":
+            SaleCampaignService.revert(campaign)
+        elif campaign.status == "scheduled":
+            campaign.status = "ended"
+            campaign.save(update_fields=["status"])
+        return SaleCampaignService.get_campaign(pk)
+
+
+class HotStockService:
+    """
+    Hot-stock mode (HOT_STOCK_ENABLED) for products flagged ``hot_stock``: their
+    stock is held in ``stock_store`` while loaded, and reconcile() flushes the
+    changes to Product.stock. Edit the stock of a hot product only through
+    adjust_stock(), or disable hot stock for it first.
+    """
+
+    @staticmethod
+    @transaction.atomic
+    def load(product_id):
+        """
+        Load a flagged product's stock into the store. The row lock keeps
+        database-side stock changes out while the value is copied.
+        """
+        product = (
+            Product.objects.select_for_update()
+            .filter(pk=product_id, hot_stock=True)
+            .values("stock")
+            .first()
+        )
+        if product is not None:
+            stock_store.load(product_id, product["stock"])
+        return product is not None
+
+    @staticmethod
+    def enable(product_ids):
+        Product.objects.filter(pk__in=product_ids).update(
+            hot_stock=True, updated_at=timezone.now()
+        )
+        for product_id in product_ids:
+            HotStockService.load(product_id)
+
+    @staticmethod
+    def disable(product_ids, attempts=10):
+        """
+        Flush and unload the products so their stock lives in the database again.
+        Returns the ids that still had new changes after ``attempts`` flushes.
+        """
+        Product.objects.filter(pk__in=product_ids).update(
+            hot_stock=False, updated_at=timezone.now()
+        )
+        busy = set()
+        for product_id in product_ids:
+            for _ in range(attempts):
+                HotStockService.flush(product_id)
+                if stock_store.unload(product_id):
+                    break
+            else:
+                busy.add(product_id)
+        return busy
+
+    @staticmethod
+    def flush(product_id):
+        """
+        Apply the product's pending counter changes to Product.stock exactly once.
+        Returns the delta applied.
+        """
+        new_flush_id = uuid.uuid4().hex
+        flush = stock_store.begin_flush(product_id, new_flush_id)
+        if flush is None:
+            return 0
+        flush_id, delta = flush
+        try:
+            with transaction.atomic():
+                # Set when a previous run got this far and then crashed.
+                if not StockFlush.objects.filter(flush_id=flush_id).exists():
+                    if Product.objects.filter(pk=product_id).update(
+                        stock=F("stock") + delta, updated_at=timezone.now()
+                    ):
+                        StockFlush.objects.create(
+                            flush_id=flush_id, product_id=product_id, delta=delta
+                        )
+        except IntegrityError:
+            # Fine if another reconciler applied it first. Anything else, such as
+            # the row's stock going negative, leaves the flush inflight to retry.
+            if not StockFlush.objects.filter(flush_id=flush_id).exists():
+                raise
+        stock_store.end_flush(product_id, flush_id)
+        if flush_id != new_flush_id:
+            # That was an interrupted flush; the pending changes are still there.
+            return delta + HotStockService.flush(product_id)
+        return delta
+
+    @staticmethod
+    def reconcile():
+        """
+        Load flagged products missing from the store (e.g. after it restarted),
+        flush every product with pending changes and drop old flush records.
+        Returns the number of products flushed.
+        """
+        flagged = set(
+            Product.objects.filter(hot_stock=True).values_list("pk", flat=True)
+        )
+        for product_id in sorted(flagged - stock_store.loaded(flagged)):
+            HotStockService.load(product_id)
+        dirty = sorted(stock_store.dirty())
+        for product_id in dirty:
+            HotStockService.flush(product_id)
+        StockFlush.objects.filter(
+            created_at__lt=timezone.now()
+            - timedelta(days=settings.HOT_STOCK_FLUSH_RETENTION_DAYS)
+        ).delete()
+        return len(dirty)
+
+    @staticmethod
+    def check(attempts=3):
+        """
+        Compare every loaded counter with the database: Product.stock plus the
+        changes not flushed yet must equal the counter. Products that still
+        disagree after ``attempts`` reads are returned, so a flush running
+        between the two reads isn't reported.
+        """
+        mismatches = {}
+        product_ids = sorted(stock_store.loaded())
+        for _ in range(attempts):
+            mismatches = {}
+            for product_id in product_ids:
+                counter = stock_store.snapshot(product_id)
+                if counter is None:
+                    continue
+                unflushed = counter["pending"]
+                inflight = counter["inflight_id"]
+                if (
+                    inflight
+                    and not StockFlush.objects.filter(flush_id=inflight).exists()
+                ):
+                    unflushed += counter["inflight_delta"]
+                stock = (
+                    Product.objects.filter(pk=product_id)
+                    .values_list("stock", flat=True)
+                    .first()
+                )
+                if stock is None or stock + unflushed != counter["available"]:
+                    mismatches[product_id] = {
+                        "product": product_id,
+                        "counter": counter["available"],
+                        "unflushed": unflushed,
+                        "database": stock,
+                    }
+            if not mismatches:
+                break
+            product_ids = sorted(mismatches)
+        return list(mismatches.values())
+
+
+class IdempotencyService:
+
+    @staticmethod
+    def claim(key, fingerprint):
+        """
+        Claim ``key`` for a new request. Returns (record, claimed): ``claimed`` is
+        False when the key already belongs to another request, whose record is
+        returned so the caller can replay or reject. A claim left unfinished for
+        IDEMPOTENCY_LOCK_TIMEOUT seconds is taken over.
+        """
+        now = timezone.now()
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is not None and record.expires_at > now:
+            stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            if (
+                record.response_status is None
+                and record.fingerprint == fingerprint
+                and record.locked_at < stale
+                # Conditional, so only one of several retries takes it over.
+                and IdempotencyKey.objects.filter(
+                    pk=record.pk, response_status=None, locked_at=record.locked_at
+                ).update(locked_at=now)
+            ):
+                record.locked_at = now
+                return record, True
+            return record, False
+        if record is not None:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key,
+                    fingerprint=fingerprint,
+                    locked_at=now,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return record, True
+        except IntegrityError:
+            # A concurrent request with the same key inserted it first.
+            return IdempotencyService.claim(key, fingerprint)
+
+    @staticmethod
+    def complete(record, status_code, body):
+        """
+        Store the response for a claimed key. Call it in the transaction that made
+        the changes: if the claim was taken over meanwhile, this raises and the
+        changes roll back, so only one request with the key takes effect.
+        """
+        if not IdempotencyKey.objects.filter(
+            pk=record.pk, response_status=None, locked_at=record.locked_at
+        ).update(response_status=status_code, response_body=body):
+            raise IdempotencyKeyInUseError()
+
+    @staticmethod
+    def release(record):
+        """
+        Give up a claim whose request failed, so the client can retry with the key.
+        """
+        IdempotencyKey.objects.filter(
+            pk=record.pk, response_status=None, locked_at=record.locked_at
+        ).delete()
+
+    @staticmethod
+    def purge_expired(batch_size=1000):
+        """
+        Delete up to ``batch_size`` expired keys and return how many were deleted.
+        """
+        expired = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if expired:
+            IdempotencyKey.objects.filter(pk__in=expired).delete()
+        return len(expired)
+
+
+class OutboxService:
+    """
+    Writes events to the outbox in the caller's transaction and publishes them.
+    Topics: stock.changed, reservation.created/sold/canceled/expired,
+    product.sale_started/sale_ended, products.imported and campaign.started/ended.
+    """
+
+    @staticmethod
+    def emit(topic, payload):
+        OutboxEvent.objects.create(topic=topic, payload=payload)
+
+    @staticmethod
+    def emit_many(events):
+        """
+        Write (topic, payload) pairs with one INSERT.
+        """
+        OutboxEvent.objects.bulk_create(
+            [OutboxEvent(topic=topic, payload=payload) for topic, payload in events]
+        )
+
+    @staticmethod
+    def reservation_event(topic, reservation):
+        return topic, {
+            "reservation": reservation.pk,
+            "product": reservation.product_id,
+            "quantity": reservation.quantity,
+            "user": reservation.user,
+            "status": reservation.status,
+        }
+
+    @staticmethod
+    def emit_reservation(topic, reservation):
+        OutboxService.emit(*OutboxService.reservation_event(topic, reservation))
+
+    @staticmethod
+    def emit_campaign(topic, campaign, products):
+        OutboxService.emit(
+            topic,
+            {
+                "campaign": campaign.pk,
+                "discount": campaign.discount,
+                "status": campaign.status,
+                "products": products,
+            },
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def publish(sink, batch_size=500):
+        """
+        Hand the oldest unpublished events to ``sink`` in id order and number them.
+        The rows stay locked until the batch is recorded, so concurrent relays
+        wait for each other instead of publishing out of order.
+        Returns the number of events published.
+        """
+        events = list(
+            OutboxEvent.objects.select_for_update()
+            .filter(published_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+        last = OutboxEvent.objects.aggregate(Max("sequence"))["sequence__max"] or 0
+        now = timezone.now()
+        for sequence, event in enumerate(events, last + 1):
+            event.sequence = sequence
+            event.published_at = now
+        sink.publish(OutboxEventSerializer(events, many=True).data)
+        OutboxEvent.objects.bulk_update(events, ["sequence", "published_at"])
+        return len(events)
+
+    @staticmethod
+    def events_after(sequence, limit):
+        """
+        Published events after ``sequence``, as dicts in sequence order.
+        """
+        return (
+            OutboxEvent.objects.filter(sequence__gt=sequence)
+            .order_by("sequence")
+            .values("id", "sequence", "topic", "payload", "created_at")[:limit]
+        )
+
+    @staticmethod
+    def purge_published(days=None):
+        days = settings.OUTBOX_RETENTION_DAYS if days is None else days
+        deleted, _ = OutboxEvent.objects.filter(
+            published_at__lt=timezone.now() - timedelta(days=days)
+        ).delete()
+        return deleted
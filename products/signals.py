@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import category_tree_cache, product_version
+from .models import Category, Product
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    # Invalidate right away for this process, and again once the change is
+    # visible to other workers so nobody keeps a tree rebuilt from stale data.
+    category_tree_cache.invalidate()
+    transaction.on_commit(category_tree_cache.invalidate)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_version(sender, **kwargs):
+    product_version.bump_on_change()
@@ -0,0 +1,290 @@
+"""
+Counter stores for hot-stock products. While a product is loaded into the store,
+reservations take stock from its counter instead of updating (and locking) the
+product row. Every change is also added to the product's ``pending`` delta, which
+HotStockService.reconcile() flushes to Product.stock in batches.
+
+A flush first moves ``pending`` to ``inflight`` under a flush id, then applies it
+in the database together with a StockFlush row carrying the same id, and only
+then clears ``inflight``. A reconciler that crashes halfway leaves ``inflight``
+behind; the next run finds it and uses the StockFlush row to tell whether the
+database already has it, so every delta is applied exactly once.
+
+Both stores implement the same interface. Product ids passed in are ints.
+"""
+
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LocMemStockStore:
+    """
+    Counters in process memory. Only correct when a single process serves
+    reservations, e.g. in tests and local development.
+    """
+
+    def __init__(self, **options):
+        self._products = {}
+        self._lock = threading.Lock()
+
+    def load(self, product_id, stock):
+        """
+        Start counting ``product_id`` from ``stock``. Returns False if it is
+        already loaded.
+        """
+        with self._lock:
+            if product_id in self._products:
+                return False
+            self._products[product_id] = {
+                "available": stock,
+                "pending": 0,
+                "inflight_id": None,
+                "inflight_delta": 0,
+            }
+            return True
+
+    def unload(self, product_id):
+        """
+        Stop counting ``product_id``. Refused (False) while it has unflushed changes.
+        """
+        with self._lock:
+            counter = self._products.get(product_id)
+            if counter is None:
+                return True
+            if counter["pending"] or counter["inflight_id"]:
+                return False
+            del self._products[product_id]
+            return True
+
+    def loaded(self, product_ids=None):
+        with self._lock:
+            if product_ids is None:
+                return set(self._products)
+            return {pk for pk in product_ids if pk in self._products}
+
+    def adjust(self, product_ids_and_deltas):
+        """
+        Apply every delta or none. Returns None if a product isn't loaded,
+        False if a counter would drop below zero, True once applied.
+        """
+        with self._lock:
+            counters = []
+            for product_id, delta in product_ids_and_deltas.items():
+                counter = self._products.get(product_id)
+                if counter is None:
+                    return None
+                counters.append((counter, delta))
+            if any(counter["available"] + delta < 0 for counter, delta in counters):
+                return False
+            for counter, delta in counters:
+                counter["available"] += delta
+                counter["pending"] += delta
+            return True
+
+    def begin_flush(self, product_id, flush_id):
+        """
+        Move the pending delta to inflight under ``flush_id`` and return
+        (flush id, delta). An earlier, unfinished flush is returned instead of
+        starting a new one. Returns None when there is nothing to flush.
+        """
+        with self._lock:
+            counter = self._products.get(product_id)
+            if counter is None:
+                return None
+            if counter["inflight_id"] is None:
+                if not counter["pending"]:
+                    return None
+                counter["inflight_id"] = flush_id
+                counter["inflight_delta"] = counter["pending"]
+                counter["pending"] = 0
+            return counter["inflight_id"], counter["inflight_delta"]
+
+    def end_flush(self, product_id, flush_id):
+        with self._lock:
+            counter = self._products.get(product_id)
+            if counter is not None and counter["inflight_id"] == flush_id:
+                counter["inflight_id"] = None
+                counter["inflight_delta"] = 0
+
+    def dirty(self):
+        """
+        Products with changes not yet in the database.
+        """
+        with self._lock:
+            return {
+                product_id
+                for product_id, counter in self._products.items()
+                if counter["pending"] or counter["inflight_id"]
+            }
+
+    def snapshot(self, product_id):
+        """
+        The product's counter as a dict, read atomically, or None.
+        """
+        with self._lock:
+            counter = self._products.get(product_id)
+            return dict(counter) if counter is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._products.clear()
+
+
+class RedisStockStore:
+    """
+    Counters in Redis (or any server speaking its protocol), shared by every
+    worker. Each operation is a single Lua script, so it is atomic on the server.
+    All keys share one hash tag so multi-product scripts also work on a cluster.
+    """
+
+    LOAD = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+    redis.call('HSET', KEYS[1], 'available', ARGV[2], 'pending', 0)
+    redis.call('SADD', KEYS[2], ARGV[1])
+    return 1
+    """
+    UNLOAD = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return 1 end
+    if tonumber(redis.call('HGET', KEYS[1], 'pending')) ~= 0
+        or redis.call('HEXISTS', KEYS[1], 'inflight_id') == 1 then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[1])
+    redis.call('SREM', KEYS[3], ARGV[1])
+    return 1
+    """
+    # KEYS: dirty set, then one hash per product; ARGV: product ids, then deltas.
+    ADJUST = """
+    local n = #KEYS - 1
+    for i = 1, n do
+        local available = redis.call('HGET', KEYS[i + 1], 'available')
+        if not available then return -1 end
+        if tonumber(available) + tonumber(ARGV[n + i]) < 0 then return 0 end
+    end
+    for i = 1, n do
+        redis.call('HINCRBY', KEYS[i + 1], 'available', ARGV[n + i])
+        redis.call('HINCRBY', KEYS[i + 1], 'pending', ARGV[n + i])
+        redis.call('SADD', KEYS[1], ARGV[i])
+    end
+    return 1
+    """
+    BEGIN_FLUSH = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+    local inflight = redis.call('HMGET', KEYS[1], 'inflight_id', 'inflight_delta')
+    if inflight[1] then return inflight end
+    local pending = redis.call('HGET', KEYS[1], 'pending')
+    if tonumber(pending) == 0 then
+        redis.call('SREM', KEYS[2], ARGV[1])
+        return nil
+    end
+    redis.call('HSET', KEYS[1], 'inflight_id', ARGV[2], 'inflight_delta', pending,
+        'pending', 0)
+    return {ARGV[2], pending}
+    """
+    END_FLUSH = """
+    if redis.call('HGET', KEYS[1], 'inflight_id') ~= ARGV[2] then return 0 end
+    redis.call('HDEL', KEYS[1], 'inflight_id', 'inflight_delta')
+    if tonumber(redis.call('HGET', KEYS[1], 'pending')) == 0 then
+        redis.call('SREM', KEYS[2], ARGV[1])
+    end
+    return 1
+    """
+
+    def __init__(self, url=None, prefix="hotstock", **options):
+        import redis
+
+        self.redis = redis.Redis.from_url(url or settings.HOT_STOCK_REDIS_URL)
+        self.prefix = "{%s}" % prefix
+        self.products_key = f"{self.prefix}:products"
+        self.dirty_key = f"{self.prefix}:dirty"
+        self._load = self.redis.register_script(self.LOAD)
+        self._unload = self.redis.register_script(self.UNLOAD)
+        self._adjust = self.redis.register_script(self.ADJUST)
+        self._begin_flush = self.redis.register_script(self.BEGIN_FLUSH)
+        self._end_flush = self.redis.register_script(self.END_FLUSH)
+
+    def key(self, product_id):
+        return f"{self.prefix}:product:{product_id}"
+
+    def load(self, product_id, stock):
+        return bool(
+            self._load(
+                keys=[self.key(product_id), self.products_key],
+                args=[product_id, stock],
+            )
+        )
+
+    def unload(self, product_id):
+        return bool(
+            self._unload(
+                keys=[self.key(product_id), self.products_key, self.dirty_key],
+                args=[product_id],
+            )
+        )
+
+    def loaded(self, product_ids=None):
+        members = {int(pk) for pk in self.redis.smembers(self.products_key)}
+        return members if product_ids is None else members & set(product_ids)
+
+    def adjust(self, product_ids_and_deltas):
+        product_ids = list(product_ids_and_deltas)
+        result = self._adjust(
+            keys=[self.dirty_key, *map(self.key, product_ids)],
+            args=[*product_ids, *product_ids_and_deltas.values()],
+        )
+        return None if result == -1 else bool(result)
+
+    def begin_flush(self, product_id, flush_id):
+        result = self._begin_flush(
+            keys=[self.key(product_id), self.dirty_key], args=[product_id, flush_id]
+        )
+        if result is None:
+            return None
+        return result[0].decode(), int(result[1])
+
+    def end_flush(self, product_id, flush_id):
+        self._end_flush(
+            keys=[self.key(product_id), self.dirty_key], args=[product_id, flush_id]
+        )
+
+    def dirty(self):
+        return {int(pk) for pk in self.redis.smembers(self.dirty_key)}
+
+    def snapshot(self, product_id):
+        counter = self.redis.hgetall(self.key(product_id))
+        if not counter:
+            return None
+        counter = {key.decode(): value.decode() for key, value in counter.items()}
+        return {
+            "available": int(counter["available"]),
+            "pending": int(counter["pending"]),
+            "inflight_id": counter.get("inflight_id"),
+            "inflight_delta": int(counter.get("inflight_delta", 0)),
+        }
+
+    def clear(self):
+        keys = [self.key(int(pk)) for pk in self.redis.smembers(self.products_key)]
+        self.redis.delete(self.products_key, self.dirty_key, *keys)
+
+
+class LazyStockStore:
+    """
+    The store configured by HOT_STOCK_STORE, created on first use.
+    """
+
+    def __init__(self):
+        self._store = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = import_string(settings.HOT_STOCK_STORE)()
+        return getattr(self._store, name)
+
+
+stock_store = LazyStockStore()
@@ -1,8 +1,75 @@
-from django.test import TestCase
-from django.urls import reverse
+import csv
+import gzip
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from .models import Product, Category, Reservation
+from shop_api import metrics
+from shop_api.compression import CODECS, negotiate
+from shop_api.middleware import MetricsMiddleware
+from shop_api.routers import (
+    PIN_COOKIE,
+    ReplicaRouter,
+    ReplicaRoutingMiddleware,
+    replica_lag,
+    replica_reads,
+    use_primary,
+)
+from . import fastpath
+from .cache import CategoryTreeCache
+from .exceptions import IdempotencyKeyInUseError, InsufficientStockError
+from .idempotency import fingerprint
+from .models import (
+    Product,
+    Category,
+    CategoryClosure,
+    IdempotencyKey,
+    OutboxEvent,
+    Reservation,
+    SaleCampaign,
+    SalesDaily,
+    StockFlush,
+)
+from .serializers import ProductSerializer
+from .services import (
+    CategoryService,
+    HotStockService,
+    IdempotencyService,
+    OutboxService,
+    ProductService,
+    ReservationService,
+    SaleCampaignService,
+)
+from .stock import stock_store
 
 
 class ProductTests(TestCase):
@@ -25,8 +92,9 @@ class ProductTests(TestCase):
         url = reverse("product-list")
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["name"], "Smartphone")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["name"], "Smartphone")
+        self.assertIsNone(response.data["next"])
 
     def test_product_detail(self):
         url = reverse("product-detail", args=[self.product.id])
@@ -83,10 +151,2112 @@ class ProductTests(TestCase):
         self.assertEqual(self.product.discount, 20)
 
     def test_sold_product_report(self):
-        self.reservation.status = "sold"
-        self.reservation.save()
+        self.client.patch(reverse("complete_sale", args=[self.reservation.id]))
         url = reverse("sold_report")
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]["total_sold"], 1)
+
+    def test_reservation_create_invalid_quantity(self):
+        data = {"product": self.product.id, "quantity": -5}
+        response = self.client.post("/api/reservations/", data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    def test_reservation_create_nonexistent_product(self):
+        data = {"product": 999, "quantity": 1}
+        response = self.client.post("/api/reservations/", data)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_reservation_batch_create(self):
+        other = Product.objects.create(
+            name="Headphones", price="99.99", stock=3, category=self.category
+        )
+        url = reverse("reservation-batch")
+        data = {
+            "user": "cartuser",
+            "items": [
+                {"product": self.product.id, "quantity": 2},
+                {"product": other.id, "quantity": 3},
+            ],
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [line["status"] for line in response.data["lines"]],
+            ["reserved", "reserved"],
+        )
+        self.assertEqual(Reservation.objects.filter(user="cartuser").count(), 2)
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        self.assertEqual(other.stock, 0)
+
+    def test_reservation_batch_is_all_or_nothing(self):
+        url = reverse("reservation-batch")
+        data = [
+            {"product": self.product.id, "quantity": 2},
+            {"product": self.product.id, "quantity": 9},
+            {"product": 999, "quantity": 1},
+        ]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [line["status"] for line in response.data["lines"]],
+            ["insufficient_stock", "insufficient_stock", "not_found"],
+        )
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    def test_reservation_detail(self):
+        url = reverse("reservation_detail", args=[self.reservation.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["user"], "testuser")
+        response = self.client.get(reverse("reservation_detail", args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_endpoint_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "endpoints",
+            "--categories=20",
+            "--depth=3",
+            "--products=30",
+            "--reservations=20",
+            "--requests=3",
+            "--concurrency=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        # Every route is benchmarked; specs are named after their URL name.
+        benchmarked = {re.split("[?:]", result["endpoint"])[0] for result in results}
+        self.assertEqual(
+            benchmarked,
+            {pattern.name for pattern in import_module("products.urls").urlpatterns},
+        )
+        for result in results:
+            self.assertEqual(result["errors"], 0, result["endpoint"])
+            self.assertEqual(result["count"], 3)
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertFalse(SaleCampaign.objects.exists())
+
+
+class ReservationExpiryTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.phone = Product.objects.create(
+            name="Smartphone", price="100.00", stock=10, category=category
+        )
+        self.tablet = Product.objects.create(
+            name="Tablet", price="250.00", stock=10, category=category
+        )
+
+    def reserve(self, product, quantity, age):
+        reservation = ReservationService.create_reservation(
+            {"product": product.id, "quantity": quantity}
+        )
+        Reservation.objects.filter(pk=reservation.pk).update(
+            created_at=timezone.now() - timedelta(seconds=age)
+        )
+        return reservation
+
+    def test_stale_reservations_are_expired_in_batches(self):
+        stale = [
+            self.reserve(self.phone, 1, 3600),
+            self.reserve(self.phone, 2, 3600),
+            self.reserve(self.tablet, 3, 3600),
+        ]
+        fresh = self.reserve(self.phone, 4, 10)
+        sold = self.reserve(self.tablet, 1, 3600)
+        ReservationService.complete_sale(sold.id)
+
+        self.assertEqual(ReservationService.expire_stale_reservations(600, 2), 2)
+        self.assertEqual(ReservationService.expire_stale_reservations(600, 2), 1)
+        self.assertEqual(ReservationService.expire_stale_reservations(600, 2), 0)
+
+        self.assertEqual(
+            set(Reservation.objects.filter(status="expired")),
+            set(stale),
+        )
+        self.assertEqual(Reservation.objects.get(pk=fresh.pk).status, "reserved")
+        self.phone.refresh_from_db()
+        self.tablet.refresh_from_db()
+        self.assertEqual(self.phone.stock, 6)
+        self.assertEqual(self.tablet.stock, 9)
+
+    def test_expired_reservation_cannot_be_canceled_or_sold(self):
+        reservation = self.reserve(self.phone, 2, 3600)
+        call_command("expire_reservations", "--ttl=600", stdout=StringIO())
+        client = APIClient()
+        response = client.patch(reverse("reservation-cancel", args=[reservation.id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.patch(reverse("complete_sale", args=[reservation.id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 10)
+
+
+class SalesReportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Smartphone", price="100.00", stock=10, category=self.category
+        )
+        self.other = Product.objects.create(
+            name="Tablet", price="250.00", stock=10, category=self.category
+        )
+
+    def sell(self, product, quantity):
+        reservation = ReservationService.create_reservation(
+            {"product": product.id, "quantity": quantity}
+        )
+        return ReservationService.complete_sale(reservation.id)
+
+    def test_complete_sale_updates_rollup(self):
+        self.sell(self.product, 2)
+        self.sell(self.product, 3)
+        rollup = SalesDaily.objects.get(product=self.product)
+        self.assertEqual(rollup.day, timezone.localdate())
+        self.assertEqual(rollup.units, 5)
+        self.assertEqual(rollup.revenue, 500)
+        self.assertEqual(rollup.category, self.category)
+
+    def test_report_reads_from_rollup(self):
+        self.sell(self.product, 2)
+        self.sell(self.other, 1)
+        today = timezone.localdate().isoformat()
+        response = self.client.get(
+            reverse("sold_report"), {"start_date": today, "end_date": today}
+        )
+        self.assertEqual(
+            [(row["name"], row["total_sold"]) for row in response.data],
+            [("Smartphone", 2), ("Tablet", 1)],
+        )
+        self.assertEqual(response.data[1]["total_revenue"], "250.00")
+
+        response = self.client.get(reverse("sold_report"), {"end_date": "2000-01-01"})
+        self.assertEqual(response.data, [])
+        response = self.client.get(reverse("sold_report"), {"start_date": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for name in ["sold_report", "async-sold-report"]:
+            response = self.client.get(reverse(name), {"category": "abc"})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("category", response.json())
+
+    def test_report_streams_csv_and_ndjson(self):
+        self.sell(self.product, 2)
+        self.sell(self.other, 1)
+        expected = self.client.get(reverse("sold_report")).data
+
+        response = self.client.get(reverse("sold_report"), {"format": "csv"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="sold-report.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(response.getvalue().decode())))
+        self.assertEqual(
+            rows,
+            [{key: str(value) for key, value in row.items()} for row in expected],
+        )
+
+        response = self.client.get(reverse("sold_report"), {"format": "ndjson"})
+        self.assertTrue(response.streaming)
+        lines = response.getvalue().decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+        response = self.client.get(
+            reverse("sold_report"), {"format": "csv", "start_date": "yesterday"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("start_date", response.json())
+
+    def test_reservation_history_export(self):
+        for quantity in (1, 2, 3):
+            ReservationService.create_reservation(
+                {"product": self.product.id, "quantity": quantity}
+            )
+        response = self.client.get(
+            reverse("reservation_list"), {"format": "ndjson", "page_size": 1}
+        )
+        rows = [json.loads(line) for line in response.getvalue().decode().splitlines()]
+        self.assertEqual([row["quantity"] for row in rows], [3, 2, 1])
+        expected = self.client.get(reverse("reservation_detail", args=[rows[0]["id"]]))
+        self.assertEqual(rows[0], expected.json())
+
+    def test_exports_benchmark(self):
+        out = StringIO()
+        call_command("bench", "exports", "--rows=5", stdout=out)
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(
+            [(result["endpoint"], result["format"]) for result in results],
+            [
+                ("sold_report", "json"),
+                ("sold_report", "csv"),
+                ("sold_report", "ndjson"),
+                ("reservations", "csv"),
+                ("reservations", "ndjson"),
+            ],
+        )
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_backfill_rebuilds_rollup(self):
+        self.sell(self.product, 2)
+        self.sell(self.other, 4)
+        expected = set(
+            SalesDaily.objects.values_list("product_id", "day", "units", "revenue")
+        )
+        SalesDaily.objects.all().delete()
+        # History stays priced as sold, not at today's price.
+        Product.objects.filter(pk=self.product.pk).update(price="120.00")
+        call_command("backfill_sales_daily", stdout=StringIO())
+        self.assertEqual(
+            set(
+                SalesDaily.objects.values_list("product_id", "day", "units", "revenue")
+            ),
+            expected,
+        )
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot query shapes must be answered from an index, never a full table scan.
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        product = Product.objects.create(
+            name="Smartphone", price="100.00", stock=10, category=category
+        )
+        Reservation.objects.create(product=product, user="testuser")
+        self.category = category
+        self.today = timezone.localdate()
+
+    def assertUsesIndex(self, queryset):
+        if connection.vendor == "postgresql":
+            # Tiny test tables would otherwise always be sequentially scanned.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn("Seq Scan", plan)
+        elif connection.vendor == "sqlite":
+            plan = queryset.explain()
+            self.assertIsNone(re.search(r"\bSCAN \S+$", plan, re.MULTILINE), plan)
+        else:
+            self.skipTest(f"No plan check for {connection.vendor}.")
+
+    def test_product_listing_uses_index(self):
+        self.assertUsesIndex(ProductService.list_products().order_by("id")[:50])
+        self.assertUsesIndex(
+            ProductService.list_products(self.category.id).order_by("id")[:50]
+        )
+
+    def test_sold_report_uses_index(self):
+        self.assertUsesIndex(
+            ProductService.get_sold_products_report(self.today, self.today)
+        )
+        self.assertUsesIndex(
+            ProductService.get_sold_products_report(
+                self.today, self.today, self.category.id
+            )
+        )
+
+    def test_reservation_queries_use_index(self):
+        now = timezone.now()
+        self.assertUsesIndex(Reservation.objects.order_by("-created_at", "-id")[:50])
+        self.assertUsesIndex(
+            Reservation.objects.filter(status="sold", updated_at__range=(now, now))
+        )
+        self.assertUsesIndex(
+            Reservation.objects.filter(status="reserved", created_at__lt=now)
+        )
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Cable", price="9.99", stock=100, category=category
+        )
+        Reservation.objects.bulk_create(
+            [Reservation(product=self.product, user=f"user{i}") for i in range(5)]
+        )
+        # Identical timestamps exercise the id tiebreaker.
+        Reservation.objects.update(created_at=timezone.now())
+        Reservation.objects.bulk_create(
+            [Reservation(product=self.product, user=f"late{i}") for i in range(2)]
+        )
+
+    def collect(self, url, params, direction="next"):
+        pages, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row["id"] for row in response.data["results"]])
+            if not response.data[direction]:
+                return pages, response
+            response = self.client.get(response.data[direction])
+
+    def test_reservations_are_paged_newest_first_without_gaps(self):
+        url = reverse("reservation_list")
+        pages, last = self.collect(url, {"page_size": 3})
+        expected = list(
+            Reservation.objects.order_by("-created_at", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        back = self.client.get(last.data["previous"])
+        self.assertEqual([row["id"] for row in back.data["results"]], pages[1])
+        first = self.client.get(back.data["previous"])
+        self.assertEqual([row["id"] for row in first.data["results"]], pages[0])
+        self.assertIsNone(first.data["previous"])
+
+    def test_products_are_paged_by_id(self):
+        category = self.product.category
+        Product.objects.bulk_create(
+            [
+                Product(name=f"Item {i}", price="1.00", stock=1, category=category)
+                for i in range(4)
+            ]
+        )
+        pages, _ = self.collect(reverse("product-list"), {"page_size": 2})
+        self.assertEqual(
+            sum(pages, []),
+            list(Product.objects.order_by("id").values_list("id", flat=True)),
+        )
+
+    def test_pagination_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "pagination",
+            "--rows=30",
+            "--page-size=5",
+            "--pages=1,4",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual([result["page"] for result in results], [1, 4])
+        self.assertEqual(Reservation.objects.count(), 7)
+
+    def test_invalid_cursor(self):
+        def encode(cursor):
+            return urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+        response = self.client.get(reverse("reservation_list"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(
+            reverse("reservation_list"),
+            {"cursor": encode({"v": ["monday", 1], "r": 0})},
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for cursor in [
+            {"v": ["abc"], "r": 0},
+            {"v": [None], "r": 0},
+            {"v": [{"a": 1}], "r": 0},
+            {"v": "ab", "r": 0},
+            ["ab"],
+        ]:
+            for name in ["product-list", "async-product-list"]:
+                response = self.client.get(reverse(name), {"cursor": encode(cursor)})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CategoryTreeTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.root = Category.objects.create(name="Electronics")
+        self.phones = Category.objects.create(name="Phones", parent=self.root)
+        self.android = Category.objects.create(name="Android", parent=self.phones)
+        self.flagship = Category.objects.create(name="Flagship", parent=self.android)
+        self.garden = Category.objects.create(name="Garden")
+        self.product = Product.objects.create(
+            name="Pixel", price="799.00", stock=5, category=self.flagship
+        )
+
+    def subtree(self, category):
+        return set(
+            CategoryClosure.objects.filter(ancestor=category).values_list(
+                "descendant_id", flat=True
+            )
+        )
+
+    def test_list_products_includes_whole_subtree(self):
+        response = self.client.get(reverse("product-list"), {"category": self.root.id})
+        self.assertEqual([p["name"] for p in response.data["results"]], ["Pixel"])
+        with self.assertNumQueries(1):
+            list(ProductService.list_products(self.root.id))
+        self.assertEqual(list(ProductService.list_products(self.garden.id)), [])
+
+    def test_move_updates_ancestor_index(self):
+        self.android.parent = self.garden
+        self.android.save()
+        self.assertEqual(self.subtree(self.root), {self.root.id, self.phones.id})
+        self.assertEqual(
+            self.subtree(self.garden),
+            {self.garden.id, self.android.id, self.flagship.id},
+        )
+        self.assertEqual(
+            CategoryClosure.objects.get(
+                ancestor=self.garden, descendant=self.flagship
+            ).depth,
+            2,
+        )
+        self.assertEqual(
+            list(ProductService.list_products(self.garden.id)), [self.product]
+        )
+
+    def test_move_into_own_subtree_is_rejected(self):
+        url = reverse("category_detail", args=[self.root.id])
+        response = self.client.patch(url, {"parent": self.flagship.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delete_removes_subtree_from_index(self):
+        self.phones.delete()
+        self.assertEqual(self.subtree(self.root), {self.root.id})
+        self.assertFalse(
+            CategoryClosure.objects.filter(descendant_id=self.flagship.id).exists()
+        )
+
+    def test_rebuild_matches_incremental_index(self):
+        expected = set(
+            CategoryClosure.objects.values_list("ancestor_id", "descendant_id", "depth")
+        )
+        CategoryClosure.objects.rebuild()
+        self.assertEqual(
+            set(
+                CategoryClosure.objects.values_list(
+                    "ancestor_id", "descendant_id", "depth"
+                )
+            ),
+            expected,
+        )
+
+    def test_category_tree_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "category_tree",
+            "--categories=60",
+            "--depth=3",
+            "--products=100",
+            "--samples=5",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(results["closure_table"]["queries_per_call"], 1)
+        self.assertEqual(
+            results["closure_table"]["mean_rows"], results["tree_walk"]["mean_rows"]
+        )
+        self.assertEqual(Category.objects.count(), 5)
+
+
+class CategoryCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Electronics")
+
+    def test_warm_reads_do_not_touch_the_database(self):
+        CategoryService.get_all_categories()
+        with self.assertNumQueries(0):
+            self.assertEqual(CategoryService.get_all_categories(), [self.category])
+            self.assertEqual(
+                CategoryService.get_category(self.category.id).name, "Electronics"
+            )
+            response = self.client.get(reverse("category-list"))
+        self.assertEqual(response.data[0]["name"], "Electronics")
+
+    def test_saves_and_deletes_invalidate_the_cache(self):
+        CategoryService.get_all_categories()
+        phones = Category.objects.create(name="Phones", parent=self.category)
+        self.assertEqual(len(CategoryService.get_all_categories()), 2)
+
+        url = reverse("category_detail", args=[phones.id])
+        response = self.client.patch(url, {"name": "Mobile"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CategoryService.get_category(phones.id).name, "Mobile")
+
+        phones.delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_version_counter_keeps_workers_consistent(self):
+        worker_a, worker_b = CategoryTreeCache(), CategoryTreeCache()
+        self.assertEqual(len(worker_a.get_tree()), 1)
+        self.assertEqual(len(worker_b.get_tree()), 1)
+        Category.objects.bulk_create([Category(name="Imported")])
+        worker_a.invalidate()
+        self.assertEqual(len(worker_b.get_tree()), 2)
+
+    def test_cached_category_is_not_shared(self):
+        category = CategoryService.get_category(self.category.id)
+        category.name = "Changed"
+        self.assertEqual(
+            CategoryService.get_category(self.category.id).name, "Electronics"
+        )
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Electronics")
+        for i in range(6):
+            Product.objects.create(
+                name=f"Product {i}", price="10.00", stock=1, category=category
+            )
+
+    def test_requests_are_recorded_per_endpoint(self):
+        before, _ = metrics.QUERY_COUNT.snapshot(endpoint="product-list", method="GET")
+        self.client.get(reverse("product-list"))
+        count, queries = metrics.QUERY_COUNT.snapshot(
+            endpoint="product-list", method="GET"
+        )
+        self.assertEqual(count, before + 1)
+        self.assertGreater(queries, 0)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn(
+            'http_request_db_queries_count{endpoint="product-list",method="GET"}', body
+        )
+
+    @override_settings(METRICS_DETECT_N_PLUS_ONE=True, METRICS_SLOW_QUERY_MS=0)
+    def test_repeated_queries_and_slow_queries_are_logged(self):
+        with self.assertLogs("shop_api.metrics", "WARNING") as logs:
+            self.client.get(reverse("product-list"))
+        self.assertTrue(any("Slow query" in line for line in logs.output))
+
+        def n_plus_one(request):
+            for product in Product.objects.all():
+                Category.objects.get(pk=product.category_id)
+
+        request = RequestFactory().get("/api/products/")
+        with self.assertLogs("shop_api.metrics", "WARNING") as logs:
+            MetricsMiddleware(n_plus_one)(request)
+        self.assertTrue(any("Possible N+1" in line for line in logs.output))
+
+
+class FastPathTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Electronics")
+        for name, description, price, discount in [
+            ("Laptop", "", "999.99", "0"),
+            ("Câble «HDMI» 📺", 'Quote " and \\ and \n\t\x01', "12.50", "33.33"),
+            ("Line\u2028Separator", "Paragraph\u2029", "7.00", "15"),
+            ("Clearance", "", "0.01", "99.99"),
+            ("Free", "", "5.00", "100"),
+        ]:
+            Product.objects.create(
+                name=name,
+                description=description,
+                price=price,
+                discount=discount,
+                stock=3,
+                category=self.category,
+            )
+
+    def test_fast_path_is_byte_identical_to_serializer(self):
+        url = reverse("product-list")
+        for query in ["", "?page_size=2", f"?category={self.category.id}"]:
+            fast = self.client.get(url + query)
+            # indent=0 renders compactly but forces the regular serializer path.
+            slow = self.client.get(
+                url + query, HTTP_ACCEPT="application/json; indent=0"
+            )
+            self.assertIsInstance(fast, fastpath.ProductPageResponse)
+            self.assertNotIsInstance(slow, fastpath.ProductPageResponse)
+            self.assertEqual(fast.content, slow.content)
+            self.assertEqual(fast["Content-Type"], slow["Content-Type"])
+
+        page = fastpath.product_rows(fastpath.product_values(Product.objects.all()))
+        expected = ProductSerializer(Product.objects.all(), many=True).data
+        self.assertEqual(
+            fastpath.encode(page, [row["discounted_price"] for row in page]),
+            JSONRenderer().render(expected),
+        )
+
+    def test_fast_path_follows_cursor_links(self):
+        response = self.client.get(reverse("product-list"), {"page_size": 2})
+        names = [row["name"] for row in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            names += [row["name"] for row in response.data["results"]]
+        self.assertEqual(
+            names, list(Product.objects.order_by("id").values_list("name", flat=True))
+        )
+
+    def test_serializers_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "serializers",
+            "--rows=30",
+            "--page-sizes=10,30",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual([result["page_size"] for result in results], [10, 30])
+        self.assertTrue(all(result["identical"] for result in results))
+        self.assertEqual(Product.objects.count(), 5)
+
+
+class ProductReadModelTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name="Electronics")
+        self.phones = Category.objects.create(name="Phones", parent=self.root)
+        self.other = Category.objects.create(name="Outlet")
+
+    def create(self, **fields):
+        fields = {"name": "Phone", "price": "10.00", "stock": 1, **fields}
+        return Product.objects.create(category=self.phones, **fields)
+
+    def test_generated_columns_match_python(self):
+        for price, discount in [
+            ("10.00", "15"),
+            ("12.50", "33.33"),
+            ("0.01", "99.99"),
+            ("5.00", "100"),
+            ("99999999.99", "0.01"),
+        ]:
+            product = self.create(price=price, discount=discount)
+            product.refresh_from_db()
+            self.assertEqual(
+                float(product.discounted_price), float(product.get_discounted_price())
+            )
+        self.assertEqual(
+            list(
+                Product.objects.filter(discounted_price__gt=5, discounted_price__lt=9)
+                .order_by("discounted_price")
+                .values_list("price", flat=True)
+            ),
+            [Decimal("12.50"), Decimal("10.00")],
+        )
+        product = self.create(stock=0)
+        self.assertFalse(Product.objects.get(pk=product.pk).in_stock)
+        Product.objects.filter(pk=product.pk).update(stock=F("stock") + 2)
+        self.assertTrue(Product.objects.get(pk=product.pk).in_stock)
+
+    def test_category_path_follows_category_writes(self):
+        product = self.create()
+        bystander = Product.objects.create(
+            name="Lamp", price="5.00", stock=1, category=self.other
+        )
+        self.assertEqual(product.category_path, "Electronics / Phones")
+
+        self.root.name = "Gadgets"
+        self.root.save()
+        self.assertEqual(
+            Product.objects.get(pk=product.pk).category_path, "Gadgets / Phones"
+        )
+        self.phones.parent = self.other
+        self.phones.save()
+        self.assertEqual(
+            Product.objects.get(pk=product.pk).category_path, "Outlet / Phones"
+        )
+        self.assertEqual(Product.objects.get(pk=bystander.pk).category_path, "Outlet")
+
+        product.category = self.root
+        product.save(update_fields=["category"])
+        self.assertEqual(Product.objects.get(pk=product.pk).category_path, "Gadgets")
+
+    def test_write_responses_return_the_new_generated_values(self):
+        product = self.create(stock=0)
+        url = reverse("product-detail", args=[product.id])
+        response = self.client.patch(
+            url, {"price": "20.00", "stock": 3}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["discounted_price"], 20.0)
+        product.discount = Decimal("50")
+        product.save(update_fields=["discount"])
+        self.assertEqual(product.discounted_price, Decimal("10"))
+        self.assertTrue(product.in_stock)
+
+    def test_listing_reads_the_columns(self):
+        self.create(price="20.00", discount="25")
+        response = self.client.get(reverse("product-list"))
+        [row] = response.json()["results"]
+        self.assertEqual(row["category_path"], "Electronics / Phones")
+        self.assertEqual(row["discounted_price"], 15.0)
+        with self.assertNumQueries(1):
+            fastpath.product_rows(fastpath.product_values(Product.objects.all()))
+
+
+class ProductListFilterTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name="Electronics")
+        phones = Category.objects.create(name="Phones", parent=self.root)
+        other = Category.objects.create(name="Garden")
+        for name, price, discount, stock, category in [
+            ("Phone", "500.00", "10", 5, phones),
+            ("Case", "20.00", "50", 40, phones),
+            ("Charger", "20.00", "0", 12, phones),
+            ("Laptop", "1200.00", "25", 2, self.root),
+            ("Hose", "35.00", "0", 9, other),
+            ("Rake", "15.00", "0", 0, other),
+        ]:
+            Product.objects.create(
+                name=name,
+                price=price,
+                discount=discount,
+                stock=stock,
+                category=category,
+            )
+        self.url = reverse("product-list")
+
+    def names(self, params, url=None):
+        """
+        Follow the next links from the first page and collect the names.
+        """
+        names = []
+        response = self.client.get(url or self.url, {"page_size": 2, **params})
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            names += [row["name"] for row in response.json()["results"]]
+            if not response.json()["next"]:
+                return names
+            response = self.client.get(response.json()["next"])
+
+    def test_filters_and_ordering(self):
+        for url in [self.url, reverse("async-product-list")]:
+            self.assertEqual(
+                self.names({"ordering": "-discounted_price"}, url),
+                ["Laptop", "Phone", "Hose", "Charger", "Case"],
+            )
+            self.assertEqual(
+                self.names({"ordering": "price,-stock"}, url),
+                ["Case", "Charger", "Hose", "Phone", "Laptop"],
+            )
+            self.assertEqual(
+                self.names(
+                    {"category": self.root.id, "max_price": 500, "ordering": "name"},
+                    url,
+                ),
+                ["Case", "Charger", "Phone"],
+            )
+            self.assertEqual(
+                self.names(
+                    {"min_discounted_price": 15, "max_stock": 10, "ordering": "stock"},
+                    url,
+                ),
+                ["Laptop", "Phone", "Hose"],
+            )
+        for params in [{"ordering": "description"}, {"min_stock": "many"}]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()), list(params))
+
+    def test_sparse_fieldset(self):
+        params = {"fields": "name,discounted_price,id", "ordering": "-price"}
+        for accept in ["application/json", "application/json; indent=0"]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, params, HTTP_ACCEPT=accept)
+            self.assertEqual(
+                response.json()["results"][0],
+                {
+                    "id": Product.objects.get(name="Laptop").id,
+                    "name": "Laptop",
+                    "discounted_price": 900.0,
+                },
+            )
+            select = queries.captured_queries[-1]["sql"]
+            self.assertNotIn("description", select)
+            self.assertIn("price", select)
+        fast = self.client.get(self.url, params)
+        slow = self.client.get(
+            self.url, params, HTTP_ACCEPT="application/json; indent=0"
+        )
+        self.assertEqual(fast.content, slow.content)
+        async_response = self.client.get(reverse("async-product-list"), params)
+        self.assertEqual(async_response.json()["results"], fast.json()["results"])
+
+        response = self.client.get(self.url, {"fields": "name,secret"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": ['Unknown field "secret".']})
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(name="Electronics")
+        self.child = Category.objects.create(name="Phones", parent=self.root)
+        self.other = Category.objects.create(name="Books")
+        self.product = Product.objects.create(
+            name="Phone", price="499.99", stock=5, category=self.child
+        )
+        self.book = Product.objects.create(
+            name="Novel", price="9.99", stock=5, category=self.other
+        )
+
+    def assertRevalidates(self, url, change, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        change()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_product_list_revalidates_on_changes(self):
+        url = reverse("product-list")
+        self.assertRevalidates(
+            url, lambda: ProductService.adjust_stock(self.book.id, -1)
+        )
+        self.assertRevalidates(url, lambda: ProductService.start_sale(self.book.id, 10))
+        self.assertRevalidates(
+            url,
+            lambda: ReservationService.create_reservations(
+                [{"product": self.book.id, "quantity": 1}]
+            ),
+        )
+        self.assertRevalidates(
+            url, lambda: Product.objects.filter(pk=self.book.id).update(price="1.00")
+        )
+        self.assertRevalidates(url, lambda: self.book.delete())
+
+    def test_product_list_scoped_by_category(self):
+        url = reverse("product-list")
+        response = self.client.get(url, {"category": self.root.id})
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(response["Cache-Control"], "max-age=0")
+        self.assertIn("Accept", response["Vary"])
+        response = self.client.get(
+            url, {"category": self.root.id}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        for name in ["product-list", "async-product-list"]:
+            for value in ["abc", "1.5"]:
+                response = self.client.get(reverse(name), {"category": value})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn("category", response.json())
+        self.assertNotEqual(
+            self.client.get(url, {"category": self.root.id, "page_size": 1})["ETag"],
+            etag,
+        )
+
+        def move_books():
+            self.other.parent = self.root
+            self.other.save()
+
+        self.assertRevalidates(url, move_books, category=self.root.id)
+
+    def test_category_list_revalidates_on_changes(self):
+        self.assertRevalidates(
+            reverse("category-list"),
+            lambda: Category.objects.create(name="Toys"),
+        )
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.peripherals = Category.objects.create(name="Peripherals")
+        self.mice = Category.objects.create(name="Mice", parent=self.peripherals)
+        self.audio = Category.objects.create(name="Audio")
+        for name, description, price, stock, category in [
+            ("Wireless Mouse", "Ergonomic mouse", "25.00", 5, self.mice),
+            ("Gaming Mouse", "RGB, wireless charging", "60.00", 0, self.mice),
+            (
+                "Mechanical Keyboard",
+                "Comes with a wireless dongle",
+                "90.00",
+                3,
+                self.peripherals,
+            ),
+            ("Wireless Headphones", "Noise cancelling", "150.00", 2, self.audio),
+            ("Wired Headphones", "Studio monitor", "80.00", 4, self.audio),
+        ]:
+            Product.objects.create(
+                name=name,
+                description=description,
+                price=price,
+                stock=stock,
+                category=category,
+            )
+
+    def test_search_triggers_survive_migrations(self):
+        # Migrations that rebuild the product table on SQLite must reinstall them.
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 triggers are SQLite only.")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'products_product'"
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(
+            triggers,
+            {
+                "products_product_fts_insert",
+                "products_product_fts_delete",
+                "products_product_fts_update",
+            },
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse("product-search"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_search_ranks_name_matches_first(self):
+        data = self.search(q="wireless")
+        names = [row["name"] for row in data["results"]]
+        self.assertEqual(data["count"], 4)
+        self.assertEqual(
+            set(names[:2]), {"Wireless Mouse", "Wireless Headphones"}, names
+        )
+        ranks = [row["rank"] for row in data["results"]]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertEqual(
+            [row["name"] for row in self.search(q="wireless mouse")["results"]][0],
+            "Wireless Mouse",
+        )
+        self.assertEqual(self.search(q="headphone")["count"], 2)
+
+    def test_search_filters_and_facets(self):
+        data = self.search(q="wireless", min_price="30", max_price="100")
+        self.assertEqual(
+            {row["name"] for row in data["results"]},
+            {"Gaming Mouse", "Mechanical Keyboard"},
+        )
+        data = self.search(q="wireless", in_stock="true")
+        self.assertNotIn("Gaming Mouse", [row["name"] for row in data["results"]])
+        data = self.search(q="wireless", in_stock="false")
+        self.assertEqual([row["name"] for row in data["results"]], ["Gaming Mouse"])
+
+        data = self.search(q="wireless", category=self.peripherals.id, limit=1)
+        self.assertEqual(len(data["results"]), 1)
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(
+            data["facets"]["category"],
+            [
+                {"category": self.mice.id, "name": "Mice", "count": 2},
+                {"category": self.peripherals.id, "name": "Peripherals", "count": 1},
+            ],
+        )
+
+    def test_search_index_follows_writes(self):
+        product = Product.objects.get(name="Wired Headphones")
+        product.name = "Wired Earphones"
+        product.save()
+        self.assertEqual(self.search(q="earphones")["count"], 1)
+        self.assertEqual(self.search(q="wired")["count"], 1)
+        product.delete()
+        self.assertEqual(self.search(q="earphones")["count"], 0)
+
+    def test_search_validates_parameters(self):
+        url = reverse("product-search")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"q": "mouse", "min_price": "cheap"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Search syntax in the input is matched literally rather than failing.
+        self.assertEqual(self.search(q='mouse" OR NEAR(')["count"], 0)
+
+    def test_search_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "search",
+            "--products=200",
+            "--queries=wireless,steel lamp",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(
+            [result["query"] for result in results], ["wireless", "steel lamp"]
+        )
+        for result in results:
+            self.assertEqual(result["matches"], result["baseline_matches"])
+        self.assertEqual(Product.objects.count(), 5)
+
+
+class SaleCampaignTests(TestCase):
+    def setUp(self):
+        self.electronics = Category.objects.create(name="Electronics")
+        self.phones = Category.objects.create(name="Phones", parent=self.electronics)
+        self.books = Category.objects.create(name="Books")
+        self.phone = Product.objects.create(
+            name="Phone", price="500.00", stock=5, category=self.phones
+        )
+        self.novel = Product.objects.create(
+            name="Novel", price="10.00", stock=5, category=self.books
+        )
+        self.atlas = Product.objects.create(
+            name="Atlas", price="40.00", stock=5, category=self.books
+        )
+        self.now = timezone.now()
+
+    def campaign(self, discount, products=(), categories=(), starts_in=0, hours=1):
+        campaign = SaleCampaign.objects.create(
+            name=f"{discount}% off",
+            discount=discount,
+            starts_at=self.now + timedelta(hours=starts_in),
+            ends_at=self.now + timedelta(hours=starts_in + hours),
+        )
+        campaign.products.set(products)
+        campaign.categories.set(categories)
+        return campaign
+
+    def discounts(self):
+        return dict(Product.objects.values_list("name", "discount"))
+
+    def test_campaign_window_applies_and_reverts_discounts(self):
+        black_friday = self.campaign(
+            20, products=[self.novel], categories=[self.electronics], starts_in=1
+        )
+        self.assertEqual(SaleCampaignService.run_due(self.now), (0, 0))
+        self.assertEqual(self.discounts()["Phone"], 0)
+
+        opens = self.now + timedelta(hours=1)
+        self.assertEqual(SaleCampaignService.run_due(opens), (1, 0))
+        self.assertEqual(self.discounts(), {"Phone": 20, "Novel": 20, "Atlas": 0})
+        response = self.client.get(reverse("product-detail", args=[self.phone.id]))
+        self.assertEqual(response.data["discounted_price"], 400.0)
+
+        closes = self.now + timedelta(hours=2)
+        self.assertEqual(SaleCampaignService.run_due(closes), (0, 1))
+        self.assertEqual(self.discounts(), {"Phone": 0, "Novel": 0, "Atlas": 0})
+        black_friday.refresh_from_db()
+        self.assertEqual(black_friday.status, "ended")
+        self.assertFalse(Product.objects.filter(sale_campaign__isnull=False).exists())
+
+    def test_overlapping_campaigns_and_manual_sales(self):
+        books = self.campaign(10, categories=[self.books])
+        everything = self.campaign(50, categories=[self.books, self.electronics])
+        SaleCampaignService.run_due(self.now)
+        self.assertEqual(self.discounts(), {"Phone": 50, "Novel": 50, "Atlas": 50})
+
+        # A manual sale detaches the product, so ending the campaign keeps it.
+        ProductService.start_sale(self.atlas.id, 30)
+        SaleCampaignService.end_campaign(everything.id)
+        self.assertEqual(self.discounts(), {"Phone": 0, "Novel": 10, "Atlas": 30})
+
+        # Campaigns starting later don't override manual or bigger discounts.
+        ProductService.start_sale(self.phone.id, 5)
+        SaleCampaignService.apply(self.campaign(20, categories=[self.electronics]))
+        SaleCampaignService.apply(self.campaign(8, categories=[self.books]))
+        self.assertEqual(self.discounts(), {"Phone": 5, "Novel": 10, "Atlas": 30})
+        SaleCampaignService.end_campaign(books.id)
+        self.assertEqual(self.discounts(), {"Phone": 5, "Novel": 8, "Atlas": 30})
+
+    def test_campaign_api(self):
+        url = reverse("campaign-list")
+        data = {
+            "name": "Flash sale",
+            "discount": "25.00",
+            "starts_at": self.now - timedelta(minutes=1),
+            "ends_at": self.now + timedelta(hours=1),
+            "categories": [self.books.id],
+        }
+        response = self.client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status"], "active")
+        self.assertEqual(self.discounts()["Novel"], 25)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.data[0]["categories"], [self.books.id])
+
+        response = self.client.post(
+            reverse("campaign-end", args=[response.data[0]["id"]])
+        )
+        self.assertEqual(response.data["status"], "ended")
+        self.assertEqual(self.discounts()["Novel"], 0)
+
+        for invalid in [
+            {**data, "ends_at": data["starts_at"]},
+            {**data, "categories": []},
+            {**data, "discount": "120.00"},
+        ]:
+            response = self.client.post(url, invalid, content_type="application/json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("campaign-detail", args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_run_sale_campaigns_command(self):
+        self.campaign(15, products=[self.phone], starts_in=-2)
+        self.campaign(15, products=[self.novel], starts_in=-1, hours=2)
+        out = StringIO()
+        call_command("run_sale_campaigns", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Started 1 and ended 0 campaigns.")
+        self.assertEqual(self.discounts(), {"Phone": 0, "Novel": 15, "Atlas": 0})
+
+    def test_campaigns_benchmark(self):
+        out = StringIO()
+        call_command("bench", "campaigns", "--products=20", stdout=out)
+        result = json.loads(out.getvalue())
+        self.assertEqual(result["campaign"]["queries"], 7)
+        self.assertGreater(result["per_product_calls"]["queries"], 40)
+        self.assertEqual(SaleCampaign.objects.count(), 0)
+
+
+@override_settings(HOT_STOCK_ENABLED=True)
+class HotStockTests(TestCase):
+    def setUp(self):
+        stock_store.clear()
+        self.category = Category.objects.create(name="Consoles")
+        self.console = Product.objects.create(
+            name="Console", price="499.00", stock=10, category=self.category
+        )
+        self.cable = Product.objects.create(
+            name="Cable", price="9.00", stock=5, category=self.category
+        )
+        HotStockService.enable([self.console.id])
+
+    def tearDown(self):
+        stock_store.clear()
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock
+
+    def reserve(self, quantity):
+        return self.client.post(
+            "/api/reservations/",
+            {"product": self.console.id, "quantity": quantity},
+        )
+
+    def test_reservations_use_the_counter_until_reconciled(self):
+        # Only inserts (the reservation and its events); the product row is
+        # neither read nor locked.
+        with self.assertNumQueries(5):
+            ReservationService.create_reservation(
+                {"product": self.console.id, "quantity": 3}
+            )
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 7)
+        self.assertEqual(self.stock(self.console), 10)
+        self.assertEqual(HotStockService.check(), [])
+
+        self.assertEqual(self.reserve(8).status_code, status.HTTP_400_BAD_REQUEST)
+        reservation = Reservation.objects.get(product=self.console)
+        with self.captureOnCommitCallbacks() as callbacks:
+            ReservationService.cancel_reservation(reservation.id)
+        # Given back stock can't be reserved until the cancellation commits.
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 7)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 10)
+
+        self.assertEqual(self.reserve(4).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(HotStockService.reconcile(), 1)
+        self.assertEqual(self.stock(self.console), 6)
+        self.assertEqual(StockFlush.objects.get().delta, -4)
+        self.assertEqual(stock_store.dirty(), set())
+
+    def test_rolled_back_reservation_gives_back_hot_stock(self):
+        # Fails after the reservation rows are written.
+        with mock.patch.object(
+            OutboxService, "emit_reservation", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            ReservationService.create_reservation(
+                {"product": self.console.id, "quantity": 3}
+            )
+        with mock.patch.object(
+            OutboxService, "emit_many", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            ReservationService.create_reservations(
+                [{"product": self.console.id, "quantity": 2}]
+            )
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 10)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(HotStockService.check(), [])
+
+    def test_interrupted_flush_is_applied_once(self):
+        self.reserve(2)
+        # The reconciler crashes before writing to the database...
+        stock_store.begin_flush(self.console.id, "first")
+        self.reserve(1)
+        HotStockService.reconcile()
+        self.assertEqual(self.stock(self.console), 7)
+
+        # ...and after writing to the database, before clearing the counter.
+        self.reserve(3)
+        flush_id, delta = stock_store.begin_flush(self.console.id, "second")
+        Product.objects.filter(pk=self.console.id).update(stock=F("stock") + delta)
+        StockFlush.objects.create(
+            flush_id=flush_id, product_id=self.console.id, delta=delta
+        )
+        self.assertEqual(HotStockService.check(), [])
+        HotStockService.reconcile()
+        self.assertEqual(self.stock(self.console), 4)
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 4)
+
+    def test_failed_flush_stays_inflight(self):
+        self.reserve(5)
+        Product.objects.filter(pk=self.console.id).update(stock=2)
+        with self.assertRaises(IntegrityError):
+            HotStockService.flush(self.console.id)
+        self.assertEqual(stock_store.snapshot(self.console.id)["inflight_delta"], -5)
+        self.assertEqual(self.stock(self.console), 2)
+
+        Product.objects.filter(pk=self.console.id).update(stock=10)
+        self.assertEqual(HotStockService.flush(self.console.id), -5)
+        self.assertEqual(self.stock(self.console), 5)
+        self.assertEqual(stock_store.dirty(), set())
+
+    def test_detail_endpoint_refuses_stock_writes(self):
+        url = reverse("product-detail", args=[self.console.id])
+        response = self.client.patch(
+            url, {"stock": 50}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("stock", response.json())
+        self.reserve(3)
+        HotStockService.reconcile()
+        # The view loaded the product before the flush; its stock must not win.
+        stale = Product.objects.get(pk=self.console.id)
+        Product.objects.filter(pk=self.console.id).update(stock=F("stock") - 1)
+        serializer = ProductSerializer(
+            stale, data={"name": "Console Pro"}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(self.stock(self.console), 6)
+        response = self.client.patch(
+            url, {"name": "Console Max"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_store_restart_reloads_from_the_database(self):
+        self.reserve(2)
+        HotStockService.reconcile()
+        stock_store.clear()
+        self.assertEqual(self.reserve(1).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 7)
+
+    def test_cart_with_hot_and_cold_products(self):
+        url = reverse("reservation-batch")
+        cart = [
+            {"product": self.console.id, "quantity": 2},
+            {"product": self.cable.id, "quantity": 2},
+        ]
+        response = self.client.post(url, cart, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stock(self.console), 10)
+        self.assertEqual(self.stock(self.cable), 3)
+
+        cart[1]["quantity"] = 4
+        response = self.client.post(url, cart, content_type="application/json")
+        self.assertEqual(
+            [line["status"] for line in response.data["lines"]],
+            ["ok", "insufficient_stock"],
+        )
+        self.assertEqual(stock_store.snapshot(self.console.id)["available"], 8)
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_check_reports_database_edits_and_disable_flushes(self):
+        self.reserve(1)
+        Product.objects.filter(pk=self.console.id).update(stock=20)
+        self.assertEqual(
+            HotStockService.check(attempts=1),
+            [
+                {
+                    "product": self.console.id,
+                    "counter": 9,
+                    "unflushed": -1,
+                    "database": 20,
+                }
+            ],
+        )
+        with self.assertRaises(CommandError):
+            call_command("hot_stock", "check", stdout=StringIO())
+
+        self.assertEqual(HotStockService.disable([self.console.id]), set())
+        self.assertEqual(self.stock(self.console), 19)
+        self.assertEqual(stock_store.loaded(), set())
+        self.assertEqual(self.reserve(1).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stock(self.console), 18)
+
+    def test_hot_stock_command(self):
+        out = StringIO()
+        call_command("hot_stock", "enable", str(self.cable.id), stdout=out)
+        self.assertEqual(stock_store.loaded(), {self.console.id, self.cable.id})
+        self.reserve(1)
+        call_command("hot_stock", "reconcile", stdout=out)
+        call_command("hot_stock", "check", stdout=out)
+        self.assertIn("Hot-stock counters match the database.", out.getvalue())
+        self.assertEqual(self.stock(self.console), 9)
+
+    def test_hot_stock_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench", "hot_stock", "--reservations=20", "--concurrency=1", stdout=out
+        )
+        for result in json.loads(out.getvalue())["results"]:
+            self.assertEqual(result["errors"], 0, result["mode"])
+            self.assertTrue(result["consistent"], result["mode"])
+        self.assertEqual(Category.objects.count(), 1)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Consoles")
+        self.product = Product.objects.create(
+            name="Console", price="499.00", stock=10, category=self.category
+        )
+        self.url = reverse("reservation_list")
+
+    def reserve(self, key, quantity=2):
+        return self.client.post(
+            self.url,
+            {"product": self.product.id, "quantity": quantity},
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_retried_reservation_is_replayed(self):
+        first = self.reserve("order-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        # One lookup: no service call and no row locks.
+        with self.assertNumQueries(1):
+            retry = self.reserve("order-1")
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(self.stock(), 8)
+
+        self.assertEqual(self.reserve("order-2").status_code, 201)
+        self.assertEqual(self.stock(), 6)
+        response = self.reserve("order-1", quantity=3)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = self.reserve("x" * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cancel_and_complete_sale_are_replayed(self):
+        reservation_id = self.reserve("order-1").json()["id"]
+        sell = reverse("complete_sale", args=[reservation_id])
+        for _ in range(2):
+            response = self.client.patch(sell, headers={"Idempotency-Key": "sell-1"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["status"], "sold")
+
+        reservation_id = self.reserve("order-2").json()["id"]
+        cancel = reverse("reservation-cancel", args=[reservation_id])
+        for _ in range(2):
+            response = self.client.patch(
+                cancel, headers={"Idempotency-Key": "cancel-1"}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stock(), 8)
+        # Without a key the retry runs again and is rejected.
+        self.assertEqual(self.client.patch(cancel).status_code, 400)
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self.reserve("order-1", quantity=11).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.reserve("order-1").status_code, 201)
+
+    def test_request_in_progress_and_abandoned_claims(self):
+        request = RequestFactory().post(
+            self.url,
+            {"product": self.product.id, "quantity": 2},
+            content_type="application/json",
+        )
+        record, claimed = IdempotencyService.claim("order-1", fingerprint(request))
+        self.assertTrue(claimed)
+        self.assertEqual(self.reserve("order-1").status_code, status.HTTP_409_CONFLICT)
+
+        # The first request stalled past the lock timeout: a retry takes over,
+        # and the stalled request can no longer store its response.
+        IdempotencyKey.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.reserve("order-1").status_code, 201)
+        with self.assertRaises(IdempotencyKeyInUseError):
+            IdempotencyService.complete(record, 201, {})
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    @override_settings(HOT_STOCK_ENABLED=True)
+    def test_lost_claim_gives_back_hot_stock(self):
+        stock_store.clear()
+        self.addCleanup(stock_store.clear)
+        HotStockService.enable([self.product.id])
+        with mock.patch.object(
+            IdempotencyService, "complete", side_effect=IdempotencyKeyInUseError
+        ):
+            response = self.reserve("order-1")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Reservation.objects.exists())
+        counter = stock_store.snapshot(self.product.id)
+        self.assertEqual((counter["available"], counter["pending"]), (10, 0))
+
+    def test_expired_keys_are_reused_and_purged(self):
+        self.reserve("order-1")
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertIsNone(self.reserve("order-1").get("Idempotent-Replayed"))
+        self.assertEqual(self.stock(), 6)
+
+        self.reserve("order-2")
+        IdempotencyKey.objects.filter(key="order-2").update(expires_at=timezone.now())
+        out = StringIO()
+        call_command("purge_idempotency_keys", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Purged 1 idempotency keys.")
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["order-1"]
+        )
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Consoles")
+        self.console = Product.objects.create(
+            name="Console", price="499.00", stock=10, category=self.category
+        )
+        self.cable = Product.objects.create(
+            name="Cable", price="9.00", stock=5, category=self.category
+        )
+
+    def topics(self):
+        return list(OutboxEvent.objects.order_by("id").values_list("topic", flat=True))
+
+    def publish(self):
+        published = []
+
+        class ListSink:
+            def publish(self, events):
+                published.extend(events)
+
+        OutboxService.publish(ListSink())
+        return published
+
+    def test_changes_write_events_in_their_transaction(self):
+        sold = ReservationService.create_reservation(
+            {"product": self.console.id, "quantity": 2}
+        )
+        ReservationService.complete_sale(sold.id)
+        canceled = ReservationService.create_reservations(
+            [{"product": self.cable.id, "quantity": 1}]
+        )[0]
+        ReservationService.cancel_reservation(canceled.id)
+        ProductService.start_sale(self.cable.id, 10)
+        ProductService.end_sale(self.cable.id)
+        with self.assertRaises(InsufficientStockError):
+            ReservationService.create_reservation(
+                {"product": self.console.id, "quantity": 11}
+            )
+        self.assertEqual(
+            self.topics(),
+            [
+                "stock.changed",
+                "reservation.created",
+                "reservation.sold",
+                "stock.changed",
+                "reservation.created",
+                "stock.changed",
+                "reservation.canceled",
+                "product.sale_started",
+                "product.sale_ended",
+            ],
+        )
+        self.assertEqual(
+            OutboxEvent.objects.get(topic="reservation.sold").payload,
+            {
+                "reservation": sold.id,
+                "product": self.console.id,
+                "quantity": 2,
+                "user": "Anonymous",
+                "status": "sold",
+            },
+        )
+
+    def test_relay_publishes_in_order_once(self):
+        ProductService.start_sale(self.console.id, 10)
+        ProductService.end_sale(self.console.id)
+
+        class FailingSink:
+            def publish(self, events):
+                raise ConnectionError
+
+        with self.assertRaises(ConnectionError):
+            OutboxService.publish(FailingSink())
+        self.assertFalse(OutboxEvent.objects.filter(sequence__isnull=False).exists())
+
+        events = self.publish()
+        self.assertEqual([event["sequence"] for event in events], [1, 2])
+        self.assertEqual(events[0]["payload"]["discount"], "10.00")
+        self.assertEqual(self.publish(), [])
+        ProductService.start_sale(self.cable.id, 5)
+        self.assertEqual([event["sequence"] for event in self.publish()], [3])
+
+    def test_publish_events_command(self):
+        ProductService.start_sale(self.console.id, 10)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.ndjson")
+            with override_settings(OUTBOX_SINK_PATH=path):
+                call_command("publish_events", stderr=StringIO())
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual([line["topic"] for line in lines], ["product.sale_started"])
+
+        OutboxEvent.objects.update(published_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(OutboxService.purge_published(), 1)
+
+    @override_settings(EVENTS_POLL_INTERVAL=0.01)
+    def test_event_long_poll(self):
+        url = reverse("event-list")
+        ProductService.start_sale(self.console.id, 10)
+        # Events are served once the relay has published them.
+        response = self.client.get(url, {"timeout": 0})
+        self.assertEqual(response.json(), {"events": [], "next": 0})
+        self.publish()
+        ProductService.end_sale(self.console.id)
+        self.publish()
+
+        response = self.client.get(url, {"limit": 1})
+        data = response.json()
+        self.assertEqual(
+            [event["topic"] for event in data["events"]], ["product.sale_started"]
+        )
+        response = self.client.get(url, {"after": data["next"]})
+        data = response.json()
+        self.assertEqual([event["sequence"] for event in data["events"]], [2])
+
+        start = time.perf_counter()
+        response = self.client.get(url, {"after": data["next"], "timeout": 0.05})
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertEqual(response.json(), {"events": [], "next": 2})
+        response = self.client.get(url, {"after": -1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.consoles = Category.objects.create(name="Consoles")
+        self.cables = Category.objects.create(name="Cables")
+        Category.objects.create(name="Cables", parent=self.consoles)
+
+    def products(self):
+        return {
+            sku: (name, category, str(price), stock)
+            for sku, name, category, price, stock in Product.objects.values_list(
+                "sku", "name", "category_id", "price", "stock"
+            )
+        }
+
+    def test_import_products_command_upserts_on_sku(self):
+        rows = [
+            "sku,name,category,price,stock",
+            "C-1,Console,Consoles,499.00,10",
+            f"C-2,HDMI cable,{self.cables.id},9.5,",
+            "C-3,Bad price,Consoles,9.999,1",
+            "C-4,Ambiguous,Cables,1.00,1",
+            ",No sku,Consoles,1.00,1",
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "feed.csv")
+            with open(path, "w") as file:
+                file.write("\n".join(rows) + "\n")
+            out, err = StringIO(), StringIO()
+            call_command("import_products", path, stdout=out, stderr=err)
+            self.assertIn("Imported 2 of 5 rows", out.getvalue())
+            self.assertEqual(
+                err.getvalue().splitlines(),
+                [
+                    "Row 3: price: Ensure that there are no more than 2 decimal places.",
+                    'Row 4: category: Several categories are named "Cables"; use its id.',
+                    "Row 5: sku: This field is required.",
+                ],
+            )
+            self.assertEqual(
+                self.products(),
+                {
+                    "C-1": ("Console", self.consoles.id, "499.00", 10),
+                    "C-2": ("HDMI cable", self.cables.id, "9.50", 0),
+                },
+            )
+
+            with open(path, "w") as file:
+                file.write(
+                    "sku,name,category,price,stock\nC-1,Console Pro,Consoles,599,3\n"
+                )
+            call_command("import_products", path, stdout=out, stderr=err)
+        self.assertEqual(
+            self.products()["C-1"], ("Console Pro", self.consoles.id, "599.00", 3)
+        )
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list("payload", flat=True)),
+            [{"skus": ["C-1", "C-2"]}, {"skus": ["C-1"]}],
+        )
+
+    def test_chunks_are_upserted_with_a_fixed_number_of_queries(self):
+        rows = [
+            {"sku": f"S-{i}", "name": f"Item {i}", "category": "Consoles", "price": 1}
+            for i in range(5)
+        ]
+        rows.append({**rows[0], "name": "Item 0 again"})
+        # The category map, then per chunk: savepoint, insert, event, release.
+        with self.assertNumQueries(1 + 3 * 4):
+            report = ProductService.import_products(rows, chunk_size=2)
+        self.assertEqual((report["rows"], report["imported"]), (6, 6))
+        self.assertEqual(Product.objects.get(sku="S-0").name, "Item 0 again")
+
+    def test_bulk_endpoint(self):
+        url = reverse("product-bulk")
+        body = "\n".join(
+            [
+                json.dumps(
+                    {
+                        "sku": "N-1",
+                        "name": "Pad",
+                        "category": "Consoles",
+                        "price": "59.99",
+                        "stock": 3,
+                    }
+                ),
+                "not json",
+                json.dumps(
+                    {"sku": "N-2", "name": "Stand", "category": "Nope", "price": "5"}
+                ),
+            ]
+        )
+        response = self.client.post(url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["imported"], 1)
+        self.assertEqual(
+            response.data["errors"],
+            [
+                {"row": 2, "error": "Not a valid row."},
+                {"row": 3, "error": 'category: Category "Nope" does not exist.'},
+            ],
+        )
+        self.assertIn("rows_per_second", response.data)
+        response = self.client.get(reverse("product-list"))
+        self.assertEqual(response.data["results"][0]["sku"], "N-1")
+
+        response = self.client.post(
+            url, "not json", content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    @override_settings(HOT_STOCK_ENABLED=True)
+    def test_hot_stock_products_are_not_overwritten(self):
+        Product.objects.create(
+            sku="H-1",
+            name="Drop",
+            price=1,
+            stock=5,
+            category=self.consoles,
+            hot_stock=True,
+        )
+        report = ProductService.import_products(
+            [
+                {
+                    "sku": "H-1",
+                    "name": "Drop",
+                    "category": "Consoles",
+                    "price": 1,
+                    "stock": 50,
+                }
+            ]
+        )
+        self.assertEqual(report["imported"], 0)
+        self.assertEqual(Product.objects.get(sku="H-1").stock, 5)
+
+    def test_imports_benchmark(self):
+        out = StringIO()
+        call_command("bench", "imports", "--rows=50", "--baseline-rows=5", stdout=out)
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(
+            [(result["rows"], result["errors"]) for result in results],
+            [(50, 0)] * 4 + [(5, 0)],
+        )
+        self.assertEqual(Product.objects.count(), 0)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        replica_lag.record("replica1", 0)
+        replica_lag.record("replica2", 0)
+        self.router = ReplicaRouter()
+
+    def tearDown(self):
+        replica_lag.clear()
+
+    def reads(self):
+        aliases = {self.router.db_for_read(Product) for _ in range(2)}
+        return ",".join(sorted(aliases))
+
+    def route(self, view, method="get", cookies=None, handle=None):
+        """
+        Serve ``view`` through the routing middleware, but run ``handle`` (two
+        reads by default) instead of the view and return (what it returned,
+        whether the client was pinned to the primary).
+        """
+        request = getattr(RequestFactory(), method)("/")
+        request.COOKIES.update(cookies or {})
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return HttpResponse((handle or self.reads)())
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return response.content.decode(), PIN_COOKIE in response.cookies
+
+    def tolerating(self, max_lag):
+        return replica_reads(max_lag)(lambda request: None)
+
+    def test_safe_reads_of_opted_in_views_use_one_replica(self):
+        for name in [
+            "product-list",
+            "category-list",
+            "reservation_list",
+            "sold_report",
+            "async-sold-report",
+        ]:
+            alias, pinned = self.route(resolve(reverse(name)).func)
+            self.assertIn(alias, {"replica1", "replica2"}, name)
+            self.assertFalse(pinned)
+        detail = resolve(reverse("product-detail", args=[1])).func
+        self.assertEqual(self.route(detail), ("default", False))
+        # Outside a request everything uses the primary.
+        self.assertEqual(self.router.db_for_read(Product), "default")
+        self.assertEqual(self.router.db_for_write(Product), "default")
+        self.assertFalse(self.router.allow_migrate("replica1", "products"))
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        view = self.tolerating(5)
+        self.assertEqual(self.route(view, method="post"), ("default", True))
+
+        def write_then_read():
+            self.router.db_for_write(Product)
+            return self.reads()
+
+        self.assertEqual(self.route(view, handle=write_then_read), ("default", True))
+        pinned = {PIN_COOKIE: str(time.time() + 5)}
+        self.assertEqual(self.route(view, cookies=pinned), ("default", False))
+        for cookie in [str(time.time() - 1), "garbage"]:
+            alias, _ = self.route(view, cookies={PIN_COOKIE: cookie})
+            self.assertNotEqual(alias, "default")
+
+    def test_replica_lag_tolerance(self):
+        replica_lag.record("replica1", 30)
+        replica_lag.record("replica2", 3)
+        self.assertEqual(self.route(self.tolerating(5))[0], "replica2")
+        self.assertEqual(self.route(self.tolerating(1))[0], "default")
+        replica_lag.record("replica2", math.inf)  # Unreachable.
+        self.assertEqual(self.route(self.tolerating(5))[0], "default")
+        self.assertEqual(self.route(self.tolerating(60))[0], "replica1")
+
+    def test_disconnected_replica_is_not_fresh(self):
+        connection = mock.MagicMock(vendor="postgresql")
+        cursor = connection.cursor.return_value.__enter__.return_value
+        with mock.patch("shop_api.routers.connections", {"replica1": connection}):
+            # Not streaming: the query returns NULL.
+            cursor.fetchone.return_value = (None,)
+            self.assertEqual(replica_lag.measure("replica1"), math.inf)
+            cursor.fetchone.return_value = (0,)
+            self.assertEqual(replica_lag.measure("replica1"), 0.0)
+        self.assertIn("pg_stat_wal_receiver", cursor.execute.call_args[0][0])
+
+    def test_use_primary_inside_a_replica_request(self):
+        def cache_fill():
+            with use_primary():
+                return self.reads()
+
+        self.assertEqual(
+            self.route(self.tolerating(5), handle=cache_fill)[0], "default"
+        )
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}", price="19.99", stock=5, category=category
+            )
+            for i in range(20)
+        ]
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate("*"), next(iter(CODECS)))
+        self.assertEqual(negotiate("deflate, br;q=0, zstd;q=0, *;q=0.5"), "gzip")
+        for header in ["", "identity", "gzip;q=0", "gzip;q=oops", "*;q=0"]:
+            self.assertIsNone(negotiate(header), header)
+
+    def test_compresses_large_api_responses(self):
+        url = reverse("product-list")
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertEqual(response["ETag"], f"W/{plain['ETag']}")
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]
+            ).status_code,
+            304,
+        )
+
+        export = self.client.get(
+            reverse("reservation_list"), {"format": "csv"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(export["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(b"".join(export.streaming_content)).decode(),
+            "id,user,status,quantity,unit_price,created_at,updated_at,product\r\n",
+        )
+
+    def test_skips_small_and_html_responses(self):
+        detail = self.client.get(
+            reverse("product-detail", args=[self.products[0].id]),
+            HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertEqual(detail.status_code, 200)
+        self.assertFalse(detail.has_header("Content-Encoding"))
+        login = self.client.get("/admin/login/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertGreater(len(login.content), 200)
+        self.assertFalse(login.has_header("Content-Encoding"))
+
+    def test_compact_renderer(self):
+        response = self.client.post(
+            reverse("start_sale", args=[self.products[0].id, 25])
+        )
+        self.assertEqual(
+            response.content,
+            b'{"status":"sale started","original_price":"19.99",'
+            b'"discounted_price":"14.9925","discount":"25"}',
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("product-list"), HTTP_ACCEPT="text/html"
+            ).status_code,
+            406,
+        )
+
+    def test_compression_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "compression",
+            "--products=30",
+            "--reservations=30",
+            "--requests=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        gzipped = [result for result in results if result["coding"] == "gzip"]
+        self.assertEqual(len(gzipped), 4)
+        self.assertTrue(all(result["ratio"] < 1 for result in gzipped))
+        self.assertFalse(Product.objects.filter(name__startswith="bench-").exists())
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Laptop", price="999.99", stock=10, category=self.category
+        )
+        Product.objects.create(
+            name="Phone", price="499.99", stock=5, category=self.category
+        )
+        ProductService.record_sale(
+            self.product, 2, self.product.price, timezone.localdate()
+        )
+
+    async def assertSameAsSync(self, sync_name, async_name, query=""):
+        sync_response = await self.async_client.get(reverse(sync_name) + query)
+        async_response = await self.async_client.get(reverse(async_name) + query)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # Cursor links point back at whichever endpoint served the page.
+        async_content = async_response.content.replace(b"/api/async/", b"/api/")
+        self.assertEqual(json.loads(async_content), json.loads(sync_response.content))
+
+    async def test_async_views_match_sync_views(self):
+        await self.assertSameAsSync("product-list", "async-product-list")
+        await self.assertSameAsSync(
+            "product-list", "async-product-list", "?page_size=1"
+        )
+        await self.assertSameAsSync("category-list", "async-category-list")
+        await self.assertSameAsSync("sold_report", "async-sold-report")
+        await self.assertSameAsSync(
+            "sold_report", "async-sold-report", "?start_date=bad"
+        )
+
+    async def test_async_product_detail(self):
+        url = reverse("async-product-detail", args=[self.product.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)["name"], "Laptop")
+        response = await self.async_client.get(
+            reverse("async-product-detail", args=[999])
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_async_queries_are_recorded(self):
+        url = reverse("async-product-list")
+        before, queries_before = metrics.QUERY_COUNT.snapshot(
+            endpoint="async-product-list", method="GET"
+        )
+        await self.async_client.get(url)
+        count, queries = metrics.QUERY_COUNT.snapshot(
+            endpoint="async-product-list", method="GET"
+        )
+        self.assertEqual(count, before + 1)
+        self.assertGreater(queries, queries_before)
+
+
+class ReservationConcurrencyTests(TransactionTestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Console", price="499.99", stock=20, category=category
+        )
+
+    def test_concurrent_reservations_never_oversell(self):
+        workers, attempts = 8, 5
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def reserve():
+            try:
+                barrier.wait()
+                for _ in range(attempts):
+                    try:
+                        ReservationService.create_reservation(
+                            {"product": self.product.id, "quantity": 1}
+                        )
+                        results.append(True)
+                    except InsufficientStockError:
+                        results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(len(results), workers * attempts)
+        self.assertEqual(results.count(True), 20)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Reservation.objects.filter(product=self.product).count(), 20)
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_concurrent_carts_lock_in_a_consistent_order(self):
+        other = Product.objects.create(
+            name="Controller", price="59.99", stock=20, category=self.product.category
+        )
+        workers = 8
+        barrier = threading.Barrier(workers)
+        errors = []
+
+        def reserve(reverse_cart):
+            items = [
+                {"product": self.product.id, "quantity": 1},
+                {"product": other.id, "quantity": 1},
+            ]
+            if reverse_cart:
+                items.reverse()
+            try:
+                barrier.wait()
+                ReservationService.create_reservations(items)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=reserve, args=(i % 2,)) for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock, 20 - workers)
+        self.assertEqual(other.stock, 20 - workers)
+
+
+class AsgiBenchmarkTests(TransactionTestCase):
+    # Served over sockets, so seeded rows must be committed.
+    def test_asgi_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench",
+            "asgi",
+            "--products=20",
+            "--requests=3",
+            "--concurrency=2",
+            "--workers=1",
+            "--client-delay=0",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertEqual(result["wsgi"]["errors"], 0, result["endpoint"])
+            self.assertEqual(result["asgi"]["errors"], 0, result["endpoint"])
+            self.assertEqual(result["wsgi"]["count"], 3)
+            self.assertEqual(result["asgi"]["count"], 3)
+        self.assertFalse(Product.objects.exists())
+
+
+class ConnectionBenchmarkTests(TransactionTestCase):
+    def test_connections_benchmark(self):
+        out = StringIO()
+        call_command(
+            "bench", "connections", "--requests=6", "--concurrency=2", stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            [
+                (result["mode"], result["count"], result["errors"])
+                for result in report["results"]
+            ],
+            [
+                ("per_request", 6, 0),
+                ("persistent", 6, 0),
+                ("persistent_health_checks", 6, 0),
+                ("configured", 6, 0),
+            ],
+        )
+        persistent = report["results"][1]
+        self.assertLessEqual(persistent["connections_opened"], 2)
+        self.assertFalse(Product.objects.exists())
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Product CRUD
@@ -7,6 +7,8 @@ urlpatterns = [
     path(
         "products/<int:pk>/", views.ProductDetailView.as_view(), name="product-detail"
     ),
+    path("products/search/", views.ProductSearchView.as_view(), name="product-search"),
+    path("products/bulk/", views.ProductBulkImportView.as_view(), name="product-bulk"),
     # Category CRUD
     path("categories/", views.CategoryListView.as_view(), name="category-list"),
     path(
@@ -16,6 +18,11 @@ urlpatterns = [
     ),
     # Reservation CRUD
     path("reservations/", views.ReservationListView.as_view(), name="reservation_list"),
+    path(
+        "reservations/batch/",
+        views.ReservationBatchView.as_view(),
+        name="reservation-batch",
+    ),
     path(
         "reservations/<int:pk>/cancel/",
         views.ReservationCancelView.as_view(),
@@ -32,6 +39,17 @@ urlpatterns = [
         views.StartSaleView.as_view(),
         name="start_sale",
     ),
+    path("campaigns/", views.SaleCampaignListView.as_view(), name="campaign-list"),
+    path(
+        "campaigns/<int:pk>/",
+        views.SaleCampaignDetailView.as_view(),
+        name="campaign-detail",
+    ),
+    path(
+        "campaigns/<int:pk>/end/",
+        views.SaleCampaignEndView.as_view(),
+        name="campaign-end",
+    ),
     # Selling product
     path(
         "reservations/<int:pk>/complete_sale/",
@@ -44,4 +62,19 @@ urlpatterns = [
         views.SoldProductReportView.as_view(),
         name="sold_report",
     ),
+    # Change events (long poll)
+    path("events/", async_views.event_list, name="event-list"),
+    # Async (ASGI) read endpoints
+    path("async/products/", async_views.product_list, name="async-product-list"),
+    path(
+        "async/products/<int:pk>/",
+        async_views.product_detail,
+        name="async-product-detail",
+    ),
+    path("async/categories/", async_views.category_list, name="async-category-list"),
+    path(
+        "async/products/sold_report/",
+        async_views.sold_report,
+        name="async-sold-report",
+    ),
 ]
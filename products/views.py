@@ -1,35 +1,175 @@
+import codecs
+import csv
+
+from django.utils.dateparse import parse_date
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status
+from rest_framework.exceptions import ParseError, UnsupportedMediaType, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from . import fastpath, imports
+from .conditional import ConditionalGetMixin
+from .exports import StreamingExportMixin
+from .filters import ProductFilter, requested_fields
+from .idempotency import HEADER as IDEMPOTENCY_HEADER, idempotent
+from .models import Category
+from .pagination import ProductPagination, ReservationPagination
 from .serializers import (
     ProductSerializer,
+    ProductSearchQuerySerializer,
+    ProductSearchSerializer,
     CategorySerializer,
     ReservationSerializer,
+    ReservationBatchSerializer,
+    SaleCampaignSerializer,
     SoldProductReportSerializer,
 )
-from .services import ProductService, CategoryService, ReservationService
+from .services import (
+    ProductService,
+    CategoryService,
+    ReservationService,
+    SaleCampaignService,
+)
+
+
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER,
+    openapi.IN_HEADER,
+    description="Unique key for this request. Retries with the same key get the stored response instead of repeating the operation.",
+    type=openapi.TYPE_STRING,
+)
+
+
+def parse_date_param(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Enter a date in YYYY-MM-DD format."})
+    return parsed
+
 
+def parse_int_param(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "Enter a whole number."})
 
-class ProductListView(generics.ListCreateAPIView):
+
+class ProductListView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = ProductSerializer
+    pagination_class = ProductPagination
+    # Seconds of replica lag tolerated for reads; see shop_api.routers.
+    replica_max_lag = 5
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
 
     @swagger_auto_schema(
-        operation_description="Retrieve a list of products, optionally filtered by category.",
+        operation_description="Retrieve a page of in-stock products, optionally filtered by category, price and stock, in the given ordering. Follow the next/previous links to page through the results.",
         responses={200: ProductSerializer(many=True)},
-        query_parameters=[
+        manual_parameters=[
             openapi.Parameter(
-                "category",
+                "fields",
                 openapi.IN_QUERY,
-                description="Filter by category ID",
-                type=openapi.TYPE_INTEGER,
+                description="Comma-separated fields to return, e.g. id,name,discounted_price",
+                type=openapi.TYPE_STRING,
             ),
         ],
     )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
-        category_id = self.request.query_params.get("category", None)
-        return ProductService.list_products(category_id=category_id)
+        return ProductService.list_products()
+
+    def get_version(self):
+        # Validate first, so bad filters get the same 400 as the listing itself.
+        filterset = ProductFilter(
+            self.request.query_params, queryset=self.get_queryset()
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return ProductService.list_version(filterset.form.cleaned_data["category"])
+
+    def list(self, request, *args, **kwargs):
+        fields = requested_fields(request.query_params)
+        queryset = self.filter_queryset(self.get_queryset())
+        if not fastpath.accepts(request):
+            if fields is not None:
+                queryset = queryset.only(*fastpath.sparse_columns(queryset, fields))
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True, fields=fields)
+            return self.get_paginated_response(serializer.data)
+        page = self.paginate_queryset(fastpath.product_values(queryset, fields))
+        rows = fastpath.product_rows(page, fields)
+        return fastpath.ProductPageResponse(
+            self.get_paginated_response(rows).data, rows
+        )
+
+
+class ProductBulkImportView(APIView):
+    @swagger_auto_schema(
+        operation_description="Create or update products in bulk, matched on sku. Send CSV (text/csv) or NDJSON (application/x-ndjson) with the columns sku, name, category (name or id), price and optionally stock and description. Invalid rows are skipped and listed in the report.",
+        request_body=openapi.Schema(type=openapi.TYPE_STRING),
+        responses={200: "Import report.", 400: "No row could be imported."},
+    )
+    def post(self, request):
+        media_type = (request.content_type or "").split(";")[0].strip()
+        if media_type not in imports.MEDIA_TYPES:
+            raise UnsupportedMediaType(media_type)
+        # Read the body line by line instead of loading it into memory.
+        lines = codecs.iterdecode(request.stream or [], "utf-8-sig")
+        try:
+            report = ProductService.import_products(
+                imports.READERS[imports.MEDIA_TYPES[media_type]](lines)
+            )
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ParseError(f"Could not read the import: {exc}")
+        if report["error_count"] and not report["imported"]:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+
+class ProductSearchView(generics.GenericAPIView):
+    serializer_class = ProductSearchSerializer
+    replica_max_lag = 10
+
+    @swagger_auto_schema(
+        operation_description="Full-text search over product names and descriptions, best matches first, with per-category facet counts.",
+        query_serializer=ProductSearchQuerySerializer,
+        responses={200: ProductSearchSerializer(many=True)},
+    )
+    def get(self, request):
+        # A plain dict, so a missing in_stock isn't read as an unticked checkbox.
+        params = ProductSearchQuerySerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        queryset = ProductService.search_products(
+            params["q"],
+            category_id=params.get("category"),
+            min_price=params.get("min_price"),
+            max_price=params.get("max_price"),
+            in_stock=params["in_stock"],
+        )
+        facets = ProductService.search_facets(queryset)
+        page = queryset[params["offset"] : params["offset"] + params["limit"]]
+        return Response(
+            {
+                "count": sum(facet["count"] for facet in facets),
+                "results": self.get_serializer(page, many=True).data,
+                "facets": {"category": facets},
+            }
+        )
 
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -45,8 +185,9 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
         return ProductService.get_product(product_id)
 
 
-class CategoryListView(generics.ListCreateAPIView):
+class CategoryListView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = CategorySerializer
+    replica_max_lag = 30
 
     @swagger_auto_schema(
         operation_description="Retrieve a list of categories.",
@@ -55,10 +196,13 @@ class CategoryListView(generics.ListCreateAPIView):
     def get_queryset(self):
         return CategoryService.get_all_categories()
 
+    def get_version(self):
+        return CategoryService.tree_version()
+
 
 class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CategorySerializer
-    queryset = CategoryService.get_all_categories()
+    queryset = Category.objects.all()
 
     @swagger_auto_schema(
         operation_description="Retrieve, update, or delete a category by ID.",
@@ -69,21 +213,28 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
         return CategoryService.get_category(category_id)
 
 
-class ReservationListView(generics.ListCreateAPIView):
+class ReservationListView(StreamingExportMixin, generics.ListCreateAPIView):
     serializer_class = ReservationSerializer
+    pagination_class = ReservationPagination
+    export_filename = "reservations"
+    replica_max_lag = 2
 
     @swagger_auto_schema(
-        operation_description="Retrieve a list of reservations.",
+        operation_description="Retrieve a page of reservations, newest first. Follow the next/previous links to page through the results, or pass ?format=csv or ?format=ndjson to stream the full history.",
         responses={200: ReservationSerializer(many=True)},
     )
     def get_queryset(self):
-        return ReservationService.get_all_reservations()
+        return ReservationService.get_all_reservations().order_by(
+            *ReservationPagination.ordering
+        )
 
     @swagger_auto_schema(
         operation_description="Create a new reservation.",
         request_body=ReservationSerializer,
         responses={201: ReservationSerializer()},
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
         reservation = ReservationService.create_reservation(request.data)
         return Response(
@@ -91,6 +242,37 @@ class ReservationListView(generics.ListCreateAPIView):
         )
 
 
+class ReservationBatchView(APIView):
+    @swagger_auto_schema(
+        operation_description="Reserve every line of a cart in one request. Either all lines are reserved or none.",
+        request_body=ReservationBatchSerializer,
+        responses={201: "Cart reserved.", 400: "Cart could not be reserved."},
+    )
+    def post(self, request):
+        data = request.data
+        if isinstance(data, list):
+            data = {"items": data}
+        serializer = ReservationBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        reservations = ReservationService.create_reservations(
+            **serializer.validated_data
+        )
+        return Response(
+            {
+                "lines": [
+                    {
+                        "product": reservation.product_id,
+                        "quantity": reservation.quantity,
+                        "status": "reserved",
+                        "reservation": reservation.id,
+                    }
+                    for reservation in reservations
+                ]
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
 class ReservationDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ReservationSerializer
     queryset = ReservationService.get_all_reservations()
@@ -111,7 +293,9 @@ class ReservationCancelView(generics.UpdateAPIView):
     @swagger_auto_schema(
         operation_description="Cancel a reservation by ID.",
         responses={200: ReservationSerializer()},
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
+    @idempotent
     def patch(self, request, *args, **kwargs):
         reservation_id = self.kwargs.get("pk")
         reservation = ReservationService.cancel_reservation(reservation_id)
@@ -125,7 +309,9 @@ class CompleteSaleView(generics.UpdateAPIView):
     @swagger_auto_schema(
         operation_description="Mark a reservation as sold.",
         responses={200: ReservationSerializer()},
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
+    @idempotent
     def patch(self, request, *args, **kwargs):
         reservation_id = self.kwargs.get("pk")
         reservation = ReservationService.complete_sale(reservation_id)
@@ -191,11 +377,61 @@ class EndSaleView(APIView):
         )
 
 
-class SoldProductReportView(generics.ListAPIView):
+class SaleCampaignListView(generics.ListCreateAPIView):
+    serializer_class = SaleCampaignSerializer
+
+    @swagger_auto_schema(
+        operation_description="Retrieve sale campaigns, latest start first.",
+        responses={200: SaleCampaignSerializer(many=True)},
+    )
+    def get_queryset(self):
+        return SaleCampaignService.get_all_campaigns()
+
+    @swagger_auto_schema(
+        operation_description="Schedule a sale campaign. Its discount is applied to the target products and categories when the window opens and removed when it closes.",
+        request_body=SaleCampaignSerializer,
+        responses={201: SaleCampaignSerializer()},
+    )
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        campaign = serializer.save()
+        # Start it right away if its window is already open.
+        SaleCampaignService.run_due()
+        return Response(
+            SaleCampaignSerializer(SaleCampaignService.get_campaign(campaign.pk)).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class SaleCampaignDetailView(generics.RetrieveAPIView):
+    serializer_class = SaleCampaignSerializer
+
+    @swagger_auto_schema(
+        operation_description="Retrieve a sale campaign by ID.",
+        responses={200: SaleCampaignSerializer()},
+    )
+    def get_object(self):
+        return SaleCampaignService.get_campaign(self.kwargs.get("pk"))
+
+
+class SaleCampaignEndView(APIView):
+    @swagger_auto_schema(
+        operation_description="End a sale campaign now and remove its discounts.",
+        responses={200: SaleCampaignSerializer()},
+    )
+    def post(self, request, pk):
+        campaign = SaleCampaignService.end_campaign(pk)
+        return Response(SaleCampaignSerializer(campaign).data)
+
+
+class SoldProductReportView(StreamingExportMixin, generics.ListAPIView):
     serializer_class = SoldProductReportSerializer
+    export_filename = "sold-report"
+    replica_max_lag = 60
 
     @swagger_auto_schema(
-        operation_description="Get a report of sold products, optionally filtered by date range and category.",
+        operation_description="Get a report of sold products, optionally filtered by date range and category. Pass ?format=csv or ?format=ndjson to stream it.",
         responses={200: SoldProductReportSerializer(many=True)},
         query_parameters=[
             openapi.Parameter(
@@ -219,7 +455,7 @@ class SoldProductReportView(generics.ListAPIView):
         ],
     )
     def get_queryset(self):
-        start_date = self.request.query_params.get("start_date")
-        end_date = self.request.query_params.get("end_date")
-        category = self.request.query_params.get("category")
+        start_date = parse_date_param(self.request.query_params, "start_date")
+        end_date = parse_date_param(self.request.query_params, "end_date")
+        category = parse_int_param(self.request.query_params, "category")
         return ProductService.get_sold_products_report(start_date, end_date, category)
@@ -0,0 +1,171 @@
+"""
+Response compression negotiated from Accept-Encoding. gzip is always offered;
+zstd and br are offered as well when the zstandard and brotli packages are
+installed. Bodies under COMPRESSION_MIN_SIZE bytes are sent as they are, and
+streaming responses (the exports) are compressed chunk by chunk as they are
+produced.
+
+Only API media types are compressed. HTML pages (the admin, the browsable API)
+carry CSRF tokens, and compressing a secret next to reflected input is what
+BREACH exploits.
+"""
+
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/yaml",
+    "text/csv",
+}
+
+
+class GzipCodec:
+    def __init__(self):
+        # Level 6 is zlib's default; higher levels cost far more CPU for a few
+        # percent on JSON.
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCodec:
+    def __init__(self):
+        # Quality 5 compresses about as fast as gzip -6, and smaller.
+        self.compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCodec:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+# Available codings, most preferred first; the order breaks ties between
+# codings the client accepts equally.
+CODECS = {
+    **({"zstd": ZstdCodec} if zstandard is not None else {}),
+    **({"br": BrotliCodec} if brotli is not None else {}),
+    "gzip": GzipCodec,
+}
+
+
+def negotiate(accept_encoding):
+    """
+    The coding to use for an Accept-Encoding header, or None for identity.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in CODECS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compressed(codec, chunks):
+    for chunk in chunks:
+        if data := codec.compress(chunk):
+            yield data
+    yield codec.finish()
+
+
+async def acompressed(codec, chunks):
+    async for chunk in chunks:
+        if data := codec.compress(chunk):
+            yield data
+    yield codec.finish()
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if (
+            content_type not in COMPRESSIBLE_TYPES
+            or response.has_header("Content-Encoding")
+            or response.status_code in (204, 304)
+        ):
+            return response
+        patch_vary_headers(response, ["Accept-Encoding"])
+        coding = negotiate(request.headers.get("Accept-Encoding", ""))
+        if coding is None:
+            return response
+
+        codec = CODECS[coding]()
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompressed(
+                    codec, response.streaming_content
+                )
+            else:
+                response.streaming_content = compressed(
+                    codec, response.streaming_content
+                )
+            del response["Content-Length"]
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            response.content = codec.compress(response.content) + codec.finish()
+            response["Content-Length"] = str(len(response.content))
+        # The compressed body is a different byte sequence with the same meaning.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = f"W/{etag}"
+        response["Content-Encoding"] = coding
+        return response
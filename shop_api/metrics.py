@@ -0,0 +1,150 @@
+"""
+In-memory request metrics, exposed in the Prometheus text format on /metrics.
+
+Each worker process keeps its own numbers; scrape every worker (or aggregate
+upstream) when running more than one.
+"""
+
+import threading
+from bisect import bisect_left
+
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """
+        Return (count, sum) observed for the given labels.
+        """
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            return (series[2], series[1]) if series else (0, 0.0)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in series
+            ]
+        for key, counts, total, count in series:
+            labels = _format_labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{{{_format_labels(key)}}} {value}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling the request, per URL name.",
+    LATENCY_BUCKETS,
+)
+DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in SQL queries while handling the request, per URL name.",
+    LATENCY_BUCKETS,
+)
+QUERY_COUNT = Histogram(
+    "http_request_db_queries",
+    "Number of SQL queries issued while handling the request, per URL name.",
+    QUERY_COUNT_BUCKETS,
+)
+N_PLUS_ONE = Counter(
+    "http_request_repeated_queries_total",
+    "Requests that repeated one SQL template more often than the N+1 threshold.",
+)
+SLOW_QUERIES = Counter(
+    "db_slow_queries_total",
+    "SQL queries slower than METRICS_SLOW_QUERY_MS, per URL name.",
+)
+
+REGISTRY = (REQUEST_LATENCY, DB_TIME, QUERY_COUNT, N_PLUS_ONE, SLOW_QUERIES)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    return HttpResponse(
+        render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,144 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger("shop_api.metrics")
+
+# The recorder of the request being served. A context variable rather than a
+# wrapper on the request thread's connections, because async views run their
+# queries in executor threads with connections of their own.
+_recorder = ContextVar("query_recorder", default=None)
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` hook that times every query of one request.
+    """
+
+    def __init__(self, slow_query_ms=None, track_templates=False):
+        self.slow_query_ms = slow_query_ms
+        self.templates = Counter() if track_templates else None
+        self.count = 0
+        self.duration = 0.0
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.slow_query_ms is not None and duration * 1000 >= self.slow_query_ms:
+                self.slow.append((duration, sql))
+            if self.templates is not None:
+                # Django passes SQL with placeholders, so identical statements that
+                # only differ in parameters share one template.
+                self.templates[sql] += 1
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, DB time and query count per URL name, and optionally log slow
+    queries and SQL templates repeated within one request (likely N+1 patterns).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.record(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.record(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def record(self, request):
+        recorder = QueryRecorder(
+            settings.METRICS_SLOW_QUERY_MS, settings.METRICS_DETECT_N_PLUS_ONE
+        )
+        start = time.perf_counter()
+        # Connections opened before this module was imported missed the signal.
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        token = _recorder.set(recorder)
+        try:
+            yield
+        finally:
+            _recorder.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        endpoint = (match.url_name or match.view_name) if match else "unmatched"
+        metrics.REQUEST_LATENCY.observe(
+            duration, endpoint=endpoint, method=request.method
+        )
+        metrics.DB_TIME.observe(
+            recorder.duration, endpoint=endpoint, method=request.method
+        )
+        metrics.QUERY_COUNT.observe(
+            recorder.count, endpoint=endpoint, method=request.method
+        )
+        self.report(endpoint, request, recorder)
+
+    def report(self, endpoint, request, recorder):
+        for duration, sql in recorder.slow:
+            metrics.SLOW_QUERIES.inc(endpoint=endpoint)
+            logger.warning(
+                "Slow query (%.1f ms) on %s %s: %s",
+                duration * 1000,
+                request.method,
+                request.path,
+                sql,
+            )
+        if recorder.templates is None:
+            return
+        repeated = [
+            (sql, count)
+            for sql, count in recorder.templates.items()
+            if count >= settings.METRICS_N_PLUS_ONE_THRESHOLD
+        ]
+        if repeated:
+            metrics.N_PLUS_ONE.inc(endpoint=endpoint)
+        for sql, count in repeated:
+            logger.warning(
+                "Possible N+1 on %s %s: %d queries like %s",
+                request.method,
+                request.path,
+                count,
+                sql,
+            )
@@ -0,0 +1,219 @@
+"""
+Read-replica routing. Writes always go to ``default``. Reads go to a replica
+only inside a request whose view opted in with a ``replica_max_lag`` (seconds
+of replication lag it tolerates), and only while:
+
+- the request hasn't written anything and isn't inside a transaction;
+- the client isn't pinned to the primary: a response to a request that wrote
+  sets a cookie that keeps the client's reads on the primary for
+  REPLICA_PIN_SECONDS, so it reads its own writes;
+- some replica is within the lag tolerance.
+
+Everything outside such a request (commands, the shell, tests) reads from the
+primary. The routing state lives in a context variable, so it follows a request
+into ``sync_to_async`` threads and stays separate between concurrent requests.
+"""
+
+import contextvars
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = "db_primary_pin"
+
+# How far a PostgreSQL standby is behind. A standby that is streaming from the
+# primary and has replayed everything it received is up to date, however old its
+# last replayed transaction. One that isn't streaming has stopped replicating,
+# so it gets NULL (infinitely behind) however little it has left to replay.
+# Reading pg_stat_wal_receiver's status needs the pg_read_all_stats role.
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+class RequestRouting:
+    def __init__(self, max_lag=None, pinned=False):
+        self.max_lag = max_lag
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_routing = contextvars.ContextVar("db_routing", default=None)
+
+
+class ReplicaLag:
+    """
+    Replication lag per replica alias in seconds, measured at most every
+    REPLICA_LAG_CHECK_INTERVAL seconds per process. An unreachable replica
+    counts as infinitely behind until the next check.
+    """
+
+    def __init__(self):
+        self._measured = {}
+        self._lock = threading.Lock()
+
+    def lag(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            measured = self._measured.get(alias)
+        if measured is None or now - measured[0] >= settings.REPLICA_LAG_CHECK_INTERVAL:
+            measured = (now, self.measure(alias))
+            with self._lock:
+                self._measured[alias] = measured
+        return measured[1]
+
+    def measure(self, alias):
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            return 0.0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            return math.inf
+        return math.inf if lag is None else float(lag)
+
+    def record(self, alias, lag):
+        with self._lock:
+            self._measured[alias] = (time.monotonic(), lag)
+
+    def clear(self):
+        with self._lock:
+            self._measured.clear()
+
+
+replica_lag = ReplicaLag()
+
+
+def read_alias():
+    routing = _routing.get()
+    if (
+        routing is None
+        or routing.max_lag is None
+        or routing.pinned
+        or routing.wrote
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        return DEFAULT_DB_ALIAS
+    if routing.replica is None:
+        # Picked once, so all reads of a request see the same replica.
+        fresh = [
+            alias
+            for alias in settings.DATABASE_REPLICAS
+            if replica_lag.lag(alias) <= routing.max_lag
+        ]
+        routing.replica = random.choice(fresh) if fresh else DEFAULT_DB_ALIAS
+    return routing.replica
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, e.g. to fill a shared cache.
+    """
+    token = _routing.set(None)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def replica_reads(max_lag):
+    """
+    Let a function view read from replicas at most ``max_lag`` seconds behind.
+    Class-based views set a ``replica_max_lag`` attribute instead.
+    """
+
+    def decorator(view):
+        view.replica_max_lag = max_lag
+        return view
+
+    return decorator
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Set up the routing state for each request and pin clients that wrote.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _routing.set(self.start(request))
+        try:
+            return self.finish(request, self.get_response(request))
+        finally:
+            _routing.reset(token)
+
+    async def __acall__(self, request):
+        token = _routing.set(self.start(request))
+        try:
+            return self.finish(request, await self.get_response(request))
+        finally:
+            _routing.reset(token)
+
+    def start(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE) or 0)
+        except ValueError:
+            pinned_until = 0
+        return RequestRouting(pinned=pinned_until > time.time())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in ("GET", "HEAD") and settings.DATABASE_REPLICAS:
+            view = getattr(view_func, "view_class", view_func)
+            _routing.get().max_lag = getattr(view, "replica_max_lag", None)
+
+    def finish(self, request, response):
+        routing = _routing.get()
+        if settings.DATABASE_REPLICAS and (
+            routing.wrote or request.method not in ("GET", "HEAD", "OPTIONS")
+        ):
+            response.set_cookie(
+                PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
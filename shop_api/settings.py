@@ -13,10 +13,16 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+def env_bool(name, default=False):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -46,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "shop_api.middleware.MetricsMiddleware",
+    "shop_api.routers.ReplicaRoutingMiddleware",
+    "shop_api.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -87,9 +96,170 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST", "0.0.0.0"),
         "PORT": os.getenv("POSTGRES_PORT", "5432"),
+        # Keep connections open between requests for DB_CONN_MAX_AGE seconds
+        # ("" for no limit, 0 to close after every request) and check one is
+        # still usable before reusing it.
+        "CONN_MAX_AGE": (
+            int(os.getenv("DB_CONN_MAX_AGE", "60"))
+            if os.getenv("DB_CONN_MAX_AGE", "60")
+            else None
+        ),
+        "CONN_HEALTH_CHECKS": env_bool("DB_CONN_HEALTH_CHECKS", True),
+        # Behind PgBouncer in transaction mode a server-side cursor can't outlive
+        # its transaction, so .iterator() must fetch through a client-side one.
+        "DISABLE_SERVER_SIDE_CURSORS": env_bool("DB_PGBOUNCER_TRANSACTION_MODE"),
+        "OPTIONS": {},
+    }
+}
+
+# psycopg 3's connection pool (requires psycopg[pool]) instead of persistent
+# connections, which Django doesn't allow together with it.
+if env_bool("DB_POOL"):
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured(
+            "DB_POOL needs psycopg 3's pool; install psycopg[pool] (psycopg_pool)."
+        )
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    }
+
+# Read replicas, one alias per host in POSTGRES_REPLICA_HOSTS ("replica1", ...).
+# Safe requests to views with a ``replica_max_lag`` read from a replica that is
+# at most that many seconds behind; see shop_api.routers. Clients that wrote
+# read from the primary for REPLICA_PIN_SECONDS afterwards.
+
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1
+):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
     }
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["shop_api.routers.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "1"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Use a shared backend (e.g. django.core.cache.backends.redis.RedisCache) in
+# production so category cache invalidations reach every worker process.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+CATEGORY_CACHE_TIMEOUT = int(os.getenv("CATEGORY_CACHE_TIMEOUT", "3600"))
+
+# Cache-Control max-age for the product and category listings. They always send
+# an ETag, so clients revalidate cheaply once it expires.
+CATALOG_CACHE_MAX_AGE = int(os.getenv("CATALOG_CACHE_MAX_AGE", "0"))
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", "50")),
+    # The browsable API renders forms (and runs their queries) on every HTML
+    # request; enable it with API_BROWSABLE for local exploration only.
+    "DEFAULT_RENDERER_CLASSES": [
+        "products.renderers.CompactJSONRenderer",
+        *(
+            ["rest_framework.renderers.BrowsableAPIRenderer"]
+            if env_bool("API_BROWSABLE")
+            else []
+        ),
+    ],
 }
 
+# Pagination is enabled per view (keyset pagination on the large listings), so
+# PAGE_SIZE is intentionally set without a DEFAULT_PAGINATION_CLASS.
+SILENCED_SYSTEM_CHECKS = ["rest_framework.W001"]
+
+# Responses smaller than this many bytes are sent uncompressed; see
+# shop_api.compression.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Rows fetched per round trip by the streaming CSV/NDJSON exports.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+# Rows validated and upserted per statement by bulk product imports.
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "2000"))
+
+
+# Reservations
+# Reservations still "reserved" after this many seconds are expired by
+# `manage.py expire_reservations` and their stock is released.
+
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+
+
+# Idempotency keys
+# Reservation, cancel and sale-completion requests sent with an Idempotency-Key
+# header are stored for IDEMPOTENCY_KEY_TTL seconds and replayed on retries.
+# A key whose first request hasn't finished after IDEMPOTENCY_LOCK_TIMEOUT
+# seconds may be taken over by a retry. `manage.py purge_idempotency_keys`
+# deletes expired keys.
+
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT_SECONDS", "60"))
+
+
+# Outbox
+# Stock, reservation and discount changes are written to an outbox table.
+# `manage.py publish_events` hands them to OUTBOX_SINK in order and deletes
+# published events after OUTBOX_RETENTION_DAYS. /api/events/ long-polls for
+# published events for up to EVENTS_LONG_POLL_TIMEOUT seconds, checking every
+# EVENTS_POLL_INTERVAL seconds.
+
+OUTBOX_SINK = os.getenv("OUTBOX_SINK", "products.outbox.FileSink")
+OUTBOX_SINK_PATH = os.getenv("OUTBOX_SINK_PATH", "")
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+EVENTS_LONG_POLL_TIMEOUT = float(os.getenv("EVENTS_LONG_POLL_TIMEOUT", "25"))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))
+
+
+# Hot stock
+# With HOT_STOCK_ENABLED, reservations for products flagged hot_stock take stock
+# from an atomic counter store instead of locking the product row, and
+# `manage.py hot_stock reconcile` flushes the counters to the database.
+# LocMemStockStore only works with a single process; use RedisStockStore when
+# several workers serve reservations.
+
+HOT_STOCK_ENABLED = env_bool("HOT_STOCK_ENABLED")
+HOT_STOCK_STORE = os.getenv("HOT_STOCK_STORE", "products.stock.LocMemStockStore")
+HOT_STOCK_REDIS_URL = os.getenv("HOT_STOCK_REDIS_URL", "redis://localhost:6379/0")
+HOT_STOCK_FLUSH_RETENTION_DAYS = int(os.getenv("HOT_STOCK_FLUSH_RETENTION_DAYS", "7"))
+
+
+# Metrics
+# Per-endpoint latency, DB time and query-count histograms are served on /metrics.
+# Queries slower than METRICS_SLOW_QUERY_MS are logged (unset to disable), and
+# the N+1 detector logs SQL templates repeated METRICS_N_PLUS_ONE_THRESHOLD times
+# within one request.
+
+METRICS_SLOW_QUERY_MS = (
+    float(os.getenv("METRICS_SLOW_QUERY_MS"))
+    if os.getenv("METRICS_SLOW_QUERY_MS")
+    else None
+)
+METRICS_DETECT_N_PLUS_ONE = env_bool("METRICS_DETECT_N_PLUS_ONE")
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "5"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,8 +295,8 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
-STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATIC_URL = "/static/"
+STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field